@@ -0,0 +1,242 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+
+import numpy as np
+
+import performance
+from config import BANK_ACCOUNT_CASH_BUFFER, BROKERAGE_ACCOUNT_CASH_BUFFER
+
+"""
+Offline backtest of recurring-investment schedules over historical prices
+"""
+
+# Orders are scheduled on this weekday (Monday is 0) and filled at the first
+# available price on or after it
+ORDER_WEEKDAY = 6
+
+# numpy day 0 (1970-01-01) was a Thursday
+EPOCH_WEEKDAY = 3
+
+# Funding assumptions when none are given
+DEFAULT_INITIAL_BANK_BALANCE = 0.0
+DEFAULT_INITIAL_BROKERAGE_CASH = 0.0
+
+# Price matrix shared with worker processes (set by the pool initializer)
+WORKER_PRICE_DATA = None
+
+
+def loadPriceData(path):
+    # Loads long-format daily prices (date, symbol, price) from CSV or Parquet
+    # into a dense dates x symbols matrix
+    if path.endswith(".parquet"):
+        # Parquet support is optional and requires pandas with a parquet engine
+        import pandas
+
+        frame = pandas.read_parquet(path, columns=[performance.PRICE_CSV_DATE_FIELD,
+                                                   performance.PRICE_CSV_SYMBOL_FIELD,
+                                                   performance.PRICE_CSV_PRICE_FIELD])
+        symbols = frame[performance.PRICE_CSV_SYMBOL_FIELD].to_numpy(dtype=object)
+        dates = frame[performance.PRICE_CSV_DATE_FIELD].to_numpy().astype("datetime64[D]")
+        prices = frame[performance.PRICE_CSV_PRICE_FIELD].to_numpy(dtype=np.float64)
+    else:
+        symbols, dates, prices = performance.loadPriceCSV(path)
+
+    return buildPriceMatrix(symbols, dates, prices)
+
+
+def buildPriceMatrix(symbols, dates, prices):
+    uniqueSymbols, symbolIndexes = np.unique(symbols.astype(str), return_inverse=True)
+    uniqueDays, dayIndexes = np.unique(dates.astype(np.int64), return_inverse=True)
+
+    matrix = np.full((len(uniqueDays), len(uniqueSymbols)), np.nan)
+    matrix[dayIndexes, symbolIndexes] = prices
+
+    # Carry the last known price forward over missing days (leading gaps, e.g.
+    # before a symbol was listed, stay NaN)
+    rowIndexes = np.where(np.isfinite(matrix),
+                          np.arange(len(uniqueDays))[:, None], 0)
+    rowIndexes = np.maximum.accumulate(rowIndexes, axis=0)
+    matrix = matrix[rowIndexes, np.arange(len(uniqueSymbols))[None, :]]
+
+    return {"symbols": uniqueSymbols, "days": uniqueDays, "prices": matrix}
+
+
+def getScheduleFillIndexes(days, startDay=None, endDay=None):
+    # Returns the price row used to fill each weekly order
+    startDay = days[0] if startDay is None else startDay
+    endDay = days[-1] if endDay is None else endDay
+
+    firstOrderDay = startDay + (ORDER_WEEKDAY - (startDay + EPOCH_WEEKDAY)) % 7
+    scheduleDays = np.arange(firstOrderDay, endDay + 1, 7)
+
+    fillIndexes = np.searchsorted(days, scheduleDays, side="left")
+    return fillIndexes[fillIndexes < len(days)]
+
+
+def getAllocationVector(allocation, symbols):
+    # Converts a symbol -> weekly amount mapping into a vector aligned with the
+    # price matrix (symbols without prices are reported as missing)
+    symbolIndexes = {symbol: i for i, symbol in enumerate(symbols)}
+    vector = np.zeros(len(symbols))
+    missingSymbols = []
+    for symbol, amount in allocation.items():
+        if symbol in symbolIndexes:
+            vector[symbolIndexes[symbol]] = float(amount)
+        else:
+            missingSymbols.append(symbol)
+    return vector, missingSymbols
+
+
+def simulateFunding(weekCount, weeklyTotal, initialBankBalance, weeklyBankDeposit,
+                    initialBrokerageCash):
+    # Replays validateSufficientFunds week by week and returns which weeks were
+    # funded (weeks without enough bank funds are skipped, as in the live
+    # order flow)
+    funded = np.zeros(weekCount, dtype=bool)
+    bankBalance = initialBankBalance
+    brokerageCash = initialBrokerageCash
+    deposits = 0.0
+
+    for week in range(weekCount):
+        bankBalance += weeklyBankDeposit
+
+        fundsToBeDeposited = weeklyTotal - (brokerageCash - BROKERAGE_ACCOUNT_CASH_BUFFER)
+        if fundsToBeDeposited > 0:
+            if fundsToBeDeposited > bankBalance - BANK_ACCOUNT_CASH_BUFFER:
+                continue
+            bankBalance -= fundsToBeDeposited
+            brokerageCash += fundsToBeDeposited
+            deposits += fundsToBeDeposited
+
+        brokerageCash -= weeklyTotal
+        funded[week] = True
+
+    return funded, {"bankBalance": bankBalance, "brokerageCash": brokerageCash,
+                    "deposits": deposits}
+
+
+def runBacktest(priceData, allocation, startDate=None, endDate=None,
+                initialBankBalance=DEFAULT_INITIAL_BANK_BALANCE,
+                weeklyBankDeposit=None,
+                initialBrokerageCash=DEFAULT_INITIAL_BROKERAGE_CASH):
+    # Simulates weekly fractional buys of `allocation` (symbol -> dollars) and
+    # returns the resulting holdings, value and daily equity curve
+    days = priceData["days"]
+    prices = priceData["prices"]
+    symbols = priceData["symbols"]
+
+    startDay = None if startDate is None else np.datetime64(startDate, "D").astype(np.int64)
+    endDay = None if endDate is None else np.datetime64(endDate, "D").astype(np.int64)
+
+    allocationVector, missingSymbols = getAllocationVector(allocation, symbols)
+    weeklyTotal = float(allocationVector.sum())
+
+    # By default the bank receives exactly the weekly investment total
+    if weeklyBankDeposit is None:
+        weeklyBankDeposit = weeklyTotal
+
+    fillIndexes = getScheduleFillIndexes(days, startDay=startDay, endDay=endDay)
+    funded, funding = simulateFunding(len(fillIndexes), weeklyTotal,
+                                      initialBankBalance, weeklyBankDeposit,
+                                      initialBrokerageCash)
+
+    # weeks x symbols: dollars spent and fractional shares bought (symbols
+    # without a price yet leave their dollars in cash)
+    fillPrices = prices[fillIndexes]
+    tradable = np.isfinite(fillPrices) & (fillPrices > 0)
+    spent = np.where(tradable & funded[:, None], allocationVector[None, :], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharesBought = np.where(spent > 0, spent / fillPrices, 0.0)
+
+    # Daily equity curve from the cumulative holdings of the latest fill
+    cumulativeShares = np.cumsum(sharesBought, axis=0)
+    if len(fillIndexes):
+        weekOfDay = np.searchsorted(fillIndexes, np.arange(len(days)), side="right") - 1
+        heldShares = np.where(weekOfDay[:, None] >= 0,
+                              cumulativeShares[np.clip(weekOfDay, 0, None)], 0.0)
+    else:
+        # No scheduled order day in the range, so nothing is ever held
+        heldShares = np.zeros(prices.shape)
+    equityCurve = np.nansum(heldShares * prices, axis=1)
+
+    lastIndex = len(days) - 1
+    if endDay is not None:
+        lastIndex = max(0, np.searchsorted(days, endDay, side="right") - 1)
+
+    totalInvested = spent.sum()
+    finalValue = float(equityCurve[lastIndex])
+    holdings = cumulativeShares[-1] if len(fillIndexes) else np.zeros(len(symbols))
+
+    return {"weeks": int(len(fillIndexes)),
+            "fundedWeeks": int(funded.sum()),
+            "totalInvested": float(totalInvested),
+            "finalValue": finalValue,
+            "profit": finalValue - float(totalInvested),
+            "uninvestedCash": float(funding["brokerageCash"] + (funded.sum() * weeklyTotal - totalInvested)),
+            "deposits": funding["deposits"],
+            "bankBalance": funding["bankBalance"],
+            "missingSymbols": missingSymbols,
+            "holdings": {symbols[i]: float(holdings[i])
+                         for i in np.flatnonzero(holdings)},
+            "equityCurve": equityCurve}
+
+
+def initializeWorker(priceData):
+    global WORKER_PRICE_DATA
+    WORKER_PRICE_DATA = priceData
+
+
+def runBacktestInWorker(allocation, kwargs):
+    result = runBacktest(WORKER_PRICE_DATA, allocation, **kwargs)
+    # The equity curve is not needed to compare allocations
+    result.pop("equityCurve")
+    return result
+
+
+def sweepAllocations(priceData, allocations, maxWorkers=None, **kwargs):
+    # Backtests every allocation across a process pool (the price matrix is
+    # sent once per worker rather than once per allocation)
+    with ProcessPoolExecutor(max_workers=maxWorkers, initializer=initializeWorker,
+                             initargs=(priceData,)) as executor:
+        futures = [executor.submit(runBacktestInWorker, allocation, kwargs)
+                   for allocation in allocations]
+        return [future.result() for future in futures]
+
+
+# Main function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backtest recurring investments over historical prices")
+    parser.add_argument("--prices", required=True,
+                        help="CSV or Parquet with date, symbol and price columns")
+    parser.add_argument("--start", help="first date to simulate (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to simulate (YYYY-MM-DD)")
+    parser.add_argument("--bank-balance", type=float,
+                        default=DEFAULT_INITIAL_BANK_BALANCE)
+    parser.add_argument("--weekly-deposit", type=float,
+                        help="bank deposits per week (defaults to the weekly total)")
+    parser.add_argument("--sweep",
+                        help="JSON file with a list of symbol -> weekly amount allocations")
+    parser.add_argument("--workers", type=int, help="worker processes for --sweep")
+    args = parser.parse_args()
+
+    priceData = loadPriceData(args.prices)
+    backtestArgs = {"startDate": args.start, "endDate": args.end,
+                    "initialBankBalance": args.bank_balance,
+                    "weeklyBankDeposit": args.weekly_deposit}
+
+    if args.sweep:
+        with open(args.sweep) as file:
+            allocations = json.load(file)
+        results = sweepAllocations(priceData, allocations, maxWorkers=args.workers,
+                                   **backtestArgs)
+    else:
+        from wrappers import SheetsAPIWrapper
+
+        result = runBacktest(priceData, SheetsAPIWrapper.getAllRecurringInvestments(),
+                             **backtestArgs)
+        result.pop("equityCurve")
+        results = [result]
+
+    print(json.dumps(results, indent=2))
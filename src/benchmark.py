@@ -0,0 +1,407 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from wrappers import SheetsAPIWrapper
+from wrappers import PlaidAPIWrapper
+from wrappers import RobinhoodAPIWrapper
+
+from helper import formatTable
+from rateLimiter import RateLimiter
+from simulatedBroker import SimulatedBroker
+import historyStore
+import main
+import scheduleEngine
+
+"""
+Benchmarks of the recurring-investment flow over synthetic fixtures
+"""
+
+BENCHMARK_NAMES = ["sheets", "positions", "orders", "history"]
+
+BASELINE_FILE_PATH = "./benchmarks/baseline.json"
+
+# A benchmark whose p50 latency exceeds its baseline by this factor is
+# reported as a regression
+REGRESSION_THRESHOLD = 1.25
+
+DEFAULT_ITERATIONS = 20
+DEFAULT_TABS = 10
+DEFAULT_ROWS = 100
+DEFAULT_POSITIONS = 500
+DEFAULT_ORDERS = 200
+DEFAULT_YEARS = 10
+DEFAULT_SYMBOLS = 50
+
+# One in this many synthetic positions is crypto
+CRYPTO_POSITION_RATIO = 10
+
+# Fixtures replace the broker rate limiter with one that never waits
+UNLIMITED_RATE = 1e9
+
+
+def getPercentile(sortedValues, fraction):
+    # Nearest-rank percentile
+    index = min(len(sortedValues) - 1, max(0, int(round(fraction * len(sortedValues))) - 1))
+    return sortedValues[index]
+
+
+def measure(name, run, items, iterations, setup=None, parameters=None):
+    # Times `iterations` calls of run() (setup() runs untimed before each) and
+    # then measures the peak memory of one more call. tracemalloc slows
+    # allocations down, so memory is never measured during timed calls.
+    durations = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        startTime = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - startTime)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    run()
+    peakMemoryBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    durations.sort()
+    return {"name": name,
+            "parameters": parameters if parameters is not None else {},
+            "items": items,
+            "iterations": iterations,
+            "p50Seconds": getPercentile(durations, 0.50),
+            "p99Seconds": getPercentile(durations, 0.99),
+            "meanSeconds": sum(durations) / len(durations),
+            "throughputPerSecond": items * iterations / sum(durations),
+            "peakMemoryBytes": peakMemoryBytes}
+
+
+@contextlib.contextmanager
+def patchAttributes(target, **attributes):
+    originalAttributes = {name: getattr(target, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originalAttributes.items():
+            setattr(target, name, value)
+
+
+def resetFileBackedState():
+    # Module state loaded from ./investments is reloaded from the current
+    # working directory on next use
+    if historyStore.CONNECTION is not None:
+        historyStore.CONNECTION.close()
+    historyStore.CONNECTION = None
+    RobinhoodAPIWrapper.ASSET_CLASS_REGISTRY = None
+    RobinhoodAPIWrapper.INSTRUMENT_CACHE = None
+    RobinhoodAPIWrapper.clearQuoteCache()
+    SheetsAPIWrapper.SNAPSHOT = None
+    SheetsAPIWrapper.GRID_INDEX = None
+
+
+@contextlib.contextmanager
+def temporaryWorkingDirectory():
+    # Runs in an empty directory so that fixtures never touch real caches,
+    # journals or history
+    previousDirectory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "investments"))
+        os.chdir(directory)
+        resetFileBackedState()
+        try:
+            yield directory
+        finally:
+            resetFileBackedState()
+            os.chdir(previousDirectory)
+
+
+def buildSpreadsheetFixture(tabs, rows):
+    # Full grid response (as returned by getFullSpreadsheet) with a Main sheet
+    # and `tabs` asset categories of `rows` symbols each
+    def toRowData(rowValues):
+        return {"values": [{"effectiveValue": {"numberValue" if isinstance(value, (int, float)) else "stringValue": value}}
+                           if value is not None else {} for value in rowValues]}
+
+    def toSheet(title, matrix):
+        return {"properties": {"title": title},
+                "data": [{"rowData": [toRowData(rowValues) for rowValues in matrix]}]}
+
+    headerPadding = [[None]] * (SheetsAPIWrapper.ASSET_FIELDS_ROW - 1)
+    sheets = [toSheet("Main", headerPadding +
+                      [["Category", SheetsAPIWrapper.WEEKLY_INVESTMENT_FIELD]] +
+                      [[f"Category{tab}", float(rows)] for tab in range(tabs)] +
+                      [[None, float(tabs * rows)]])]
+    for tab in range(tabs):
+        sheets.append(toSheet(f"Category{tab}", headerPadding +
+                              [["Name", SheetsAPIWrapper.SYMBOL_FIELD,
+                                SheetsAPIWrapper.WEEKLY_INVESTMENT_FIELD,
+                                SheetsAPIWrapper.CADENCE_FIELD]] +
+                              [[f"Asset {tab}-{row}", f"S{tab}X{row}", 1.0,
+                                scheduleEngine.CADENCES[row % len(scheduleEngine.CADENCES)]]
+                               for row in range(rows)]))
+
+    return {"sheets": sheets}
+
+
+def benchmarkSheets(tabs, rows, iterations):
+    # Cold getAllRecurringInvestments: grid index, parsing and snapshot write
+    spreadsheet = buildSpreadsheetFixture(tabs, rows)
+
+    def setup():
+        SheetsAPIWrapper.SNAPSHOT = None
+        SheetsAPIWrapper.GRID_INDEX = None
+
+    with temporaryWorkingDirectory(), \
+            patchAttributes(SheetsAPIWrapper, REFRESH_SNAPSHOT=True,
+                            SNAPSHOT_FILE_PATH="./investments/sheets-snapshot.json",
+                            fetchGridIndex=lambda service=None: SheetsAPIWrapper.buildGridIndex(spreadsheet),
+                            getSpreadsheetRevision=lambda driveService=None: None):
+        return measure("sheets", SheetsAPIWrapper.getAllRecurringInvestments,
+                       items=tabs * rows, iterations=iterations, setup=setup,
+                       parameters={"tabs": tabs, "rows": rows})
+
+
+class FixtureResponse:
+
+    def __init__(self, body):
+        self.ok = True
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+def buildPositionsFixture(positions):
+    # Stand-in for the robin_stocks calls made by getAllOpenPositions, and an
+    # HTTP session answering instrument lookups
+    cryptoCount = positions // CRYPTO_POSITION_RATIO
+    stockCount = positions - cryptoCount
+
+    instrumentURL = RobinhoodAPIWrapper.INSTRUMENTS_URL + "{}/"
+    stockPositions = [{"instrument": instrumentURL.format(f"id{i}"), "quantity": "1.5"}
+                      for i in range(stockCount)]
+    cryptoPositions = [{"currency": {"code": f"C{i}"}, "quantity": "0.25"}
+                       for i in range(cryptoCount)]
+    cryptoPairs = [{"symbol": f"C{i}-USD", "asset_currency": {"code": f"C{i}"}, "id": f"pair{i}"}
+                   for i in range(cryptoCount)]
+
+    def getQuotes(symbols):
+        return [{"symbol": symbol, "last_extended_hours_trade_price": None,
+                 "last_trade_price": "10.0"} for symbol in symbols]
+
+    def requestGet(url, dataType, payload):
+        return [{"id": pairId, "mark_price": "2.0"} for pairId in payload["ids"].split(",")]
+
+    def getInstruments(url, params=None, timeout=None):
+        return FixtureResponse({"results": [{"id": instrumentId, "symbol": f"T{instrumentId}"}
+                                            for instrumentId in params["ids"].split(",")]})
+
+    rs = SimpleNamespace(
+        account=SimpleNamespace(get_open_stock_positions=lambda: stockPositions),
+        crypto=SimpleNamespace(get_crypto_positions=lambda: cryptoPositions,
+                               get_crypto_currency_pairs=lambda: cryptoPairs,
+                               get_crypto_quote=lambda symbol: None),
+        stocks=SimpleNamespace(get_quotes=getQuotes),
+        helper=SimpleNamespace(request_get=requestGet))
+
+    return rs, SimpleNamespace(get=getInstruments)
+
+
+def getUnlimitedRateLimiter():
+    return RateLimiter(burst=UNLIMITED_RATE, ratePerSecond=UNLIMITED_RATE,
+                       minRatePerSecond=UNLIMITED_RATE, maxRatePerSecond=UNLIMITED_RATE)
+
+
+def benchmarkPositions(positions, iterations):
+    # Cold getAllOpenPositions: no cached instruments or quotes
+    rs, session = buildPositionsFixture(positions)
+
+    def setup():
+        RobinhoodAPIWrapper.INSTRUMENT_CACHE = {}
+        RobinhoodAPIWrapper.CRYPTO_PAIR_IDS = None
+        RobinhoodAPIWrapper.clearQuoteCache()
+
+    with temporaryWorkingDirectory(), \
+            patchAttributes(RobinhoodAPIWrapper, rs=rs, HTTP_SESSION=session,
+                            CRYPTO_PAIR_IDS=None,
+                            BROKER_RATE_LIMITER=getUnlimitedRateLimiter()):
+        return measure("positions", RobinhoodAPIWrapper.getAllOpenPositions,
+                       items=positions, iterations=iterations, setup=setup,
+                       parameters={"positions": positions})
+
+
+def buildSnapshotFixture(orders):
+    recurringInvestments = {f"S{i}": 1.0 for i in range(orders)}
+    return {"recurringInvestments": recurringInvestments,
+            "recurringInvestmentsByCategory": {"Category": recurringInvestments},
+            "recurringInvestmentCadences": {symbol: scheduleEngine.WEEKLY_CADENCE
+                                            for symbol in recurringInvestments},
+            "totalRecurringInvestmentsValue": float(orders)}
+
+
+def benchmarkOrders(orders, iterations):
+    # Complete sendRecurringOrders runs (pre-flight, caching, journaled
+    # submission, history write) against a SimulatedBroker with no latency
+    snapshot = buildSnapshotFixture(orders)
+    simulatedBroker = SimulatedBroker(cash=UNLIMITED_RATE)
+
+    def setup():
+        historyStore.clearHistory()
+        main.clearAllCaches()
+
+    with temporaryWorkingDirectory(), \
+            patchAttributes(SheetsAPIWrapper, SNAPSHOT=snapshot,
+                            getSnapshot=lambda: snapshot), \
+            patchAttributes(PlaidAPIWrapper, getTotalAvailableFunds=lambda: UNLIMITED_RATE,
+                            getFundingAccountAvailableFunds=lambda: UNLIMITED_RATE), \
+            patchAttributes(main, BROKER=simulatedBroker):
+        main.clearAllCaches()
+        return measure("orders", main.sendRecurringOrders, items=orders,
+                       iterations=iterations, setup=setup,
+                       parameters={"orders": orders})
+
+
+def benchmarkHistory(years, symbols, iterations):
+    # History writes and due checks against `years` of weekly runs
+    orders = {f"S{i}": 1.0 for i in range(symbols)}
+    firstDate = date.today() - timedelta(weeks=52 * years)
+    results = []
+
+    with temporaryWorkingDirectory():
+        connection = historyStore.getConnection()
+        with connection:
+            for week in range(52 * years):
+                historyStore.insertRun(connection, scheduleEngine.WEEKLY_CADENCE,
+                                       firstDate + timedelta(weeks=week), orders)
+
+        # New runs are added after the existing history (one day apart)
+        runDates = iter(date.today() + timedelta(days=day) for day in range(1, 10 ** 6))
+
+        def addRun():
+            main.addToInvestmentHistory(
+                {"date": next(runDates),
+                 "ordersByCadence": {scheduleEngine.WEEKLY_CADENCE: orders}})
+
+        parameters = {"years": years, "symbols": symbols}
+        results.append(measure("history-add", addRun, items=1,
+                               iterations=iterations, parameters=parameters))
+        results.append(measure("history-due-check",
+                               lambda: scheduleEngine.getDueCadences(scheduleEngine.CADENCES,
+                                                                     date.today()),
+                               items=1, iterations=iterations, parameters=parameters))
+
+    return results
+
+
+def runBenchmarks(names, args):
+    results = []
+    # Order flow progress messages would dominate the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        if "sheets" in names:
+            results.append(benchmarkSheets(args.tabs, args.rows, args.iterations))
+        if "positions" in names:
+            results.append(benchmarkPositions(args.positions, args.iterations))
+        if "orders" in names:
+            results.append(benchmarkOrders(args.orders, args.iterations))
+        if "history" in names:
+            results += benchmarkHistory(args.years, args.symbols, args.iterations)
+    return results
+
+
+def loadBaseline(path):
+    with open(path) as file:
+        return {result["name"]: result for result in json.load(file)["results"]}
+
+
+def saveBaseline(path, results):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "createdAt": time.time(),
+                   "results": results}, file, indent=2)
+
+
+def compareWithBaseline(results, baseline):
+    # Returns the names of the benchmarks that regressed (results measured
+    # with different parameters are not compared)
+    regressions = []
+    for result in results:
+        baselineResult = baseline.get(result["name"])
+        if baselineResult is None or baselineResult["parameters"] != result["parameters"]:
+            result["baselineRatio"] = None
+            continue
+        result["baselineRatio"] = result["p50Seconds"] / baselineResult["p50Seconds"]
+        if result["baselineRatio"] > REGRESSION_THRESHOLD:
+            regressions.append(result["name"])
+    return regressions
+
+
+def printResultsAsTable(results):
+    headers = ["Benchmark", "Items", "p50 (ms)", "p99 (ms)", "Items/s", "Peak memory (KiB)"]
+    rows = [[result["name"], result["items"],
+             f"{result['p50Seconds'] * 1000:.3f}", f"{result['p99Seconds'] * 1000:.3f}",
+             f"{result['throughputPerSecond']:.0f}", f"{result['peakMemoryBytes'] / 1024:.0f}"]
+            for result in results]
+    if any("baselineRatio" in result for result in results):
+        headers.append("vs baseline")
+        for row, result in zip(rows, results):
+            ratio = result.get("baselineRatio")
+            row.append(f"{ratio:.2f}x" if ratio is not None else "-")
+    print(formatTable("Benchmarks", headers, rows))
+
+
+# Main function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recurring-investment flow over synthetic fixtures")
+    parser.add_argument("--only", action="append", choices=BENCHMARK_NAMES,
+                        help="benchmark to run (repeatable, defaults to all)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--tabs", type=int, default=DEFAULT_TABS,
+                        help="asset category sheets in the workbook")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS,
+                        help="symbols per asset category sheet")
+    parser.add_argument("--positions", type=int, default=DEFAULT_POSITIONS)
+    parser.add_argument("--orders", type=int, default=DEFAULT_ORDERS,
+                        help="orders per sendRecurringOrders run")
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS,
+                        help="years of weekly runs in the history")
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS,
+                        help="orders per run in the history")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_FILE_PATH,
+                        help=f"save the results as a baseline (default {BASELINE_FILE_PATH})")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_FILE_PATH,
+                        help=f"compare with a saved baseline (default {BASELINE_FILE_PATH})")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.only or BENCHMARK_NAMES, args)
+
+    regressions = []
+    if args.compare:
+        regressions = compareWithBaseline(results, loadBaseline(args.compare))
+    if args.save_baseline:
+        saveBaseline(args.save_baseline, results)
+
+    if args.format == "json":
+        print(json.dumps(results, indent=2))
+    else:
+        printResultsAsTable(results)
+
+    if regressions:
+        print(f"\nRegressions (p50 over {REGRESSION_THRESHOLD}x baseline): {', '.join(regressions)}")
+        raise SystemExit(1)
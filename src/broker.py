@@ -0,0 +1,71 @@
+"""
+Interface shared by the brokers that main.py can send orders through
+"""
+
+# Every broker provides these functions (as module functions or methods)
+# with the signatures used by RobinhoodAPIWrapper
+BROKER_INTERFACE = ["login",
+                    "logout",
+                    "getAccountBuyingPower",
+                    "depositFundsToAccount",
+                    "buyFractionalSharesByPrice",
+                    "sellFractionalSharesByQuantity",
+                    "getAllOpenPositions",
+                    "getQuoteOfSymbol",
+                    "getQuotesOfSymbols",
+                    "seedAssetClassesFromCategories"]
+
+ROBINHOOD_BROKER = "robinhood"
+SIMULATED_BROKER = "simulated"
+
+BROKER_NAMES = [ROBINHOOD_BROKER, SIMULATED_BROKER]
+
+
+class BrokerOrderError(Exception):
+    # Raised when an order (or deposit) did not go through
+    pass
+
+
+class BrokerRejectedError(BrokerOrderError):
+    # The broker answered and refused the order, so it was not placed
+    pass
+
+
+class BrokerThrottledError(BrokerOrderError):
+    # The broker throttled the request, so the order was not placed
+    pass
+
+
+class BrokerNoResponseError(BrokerOrderError):
+    # No response (e.g. a timeout): the order may or may not have been placed
+    pass
+
+
+def isOrderNotPlaced(error):
+    # Only orders the broker explicitly refused or throttled are known not
+    # to have been placed, and are safe to resend
+    return isinstance(error, (BrokerRejectedError, BrokerThrottledError))
+
+
+def validateBroker(broker):
+    missingFunctions = [name for name in BROKER_INTERFACE
+                        if not callable(getattr(broker, name, None))]
+    if missingFunctions:
+        raise TypeError(f"Broker is missing {', '.join(missingFunctions)}")
+    return broker
+
+
+def getBroker(name, **options):
+    # Returns the RobinhoodAPIWrapper module or a new SimulatedBroker (built
+    # with `options`)
+    if name == ROBINHOOD_BROKER:
+        from wrappers import RobinhoodAPIWrapper
+
+        return validateBroker(RobinhoodAPIWrapper)
+
+    if name == SIMULATED_BROKER:
+        from simulatedBroker import SimulatedBroker
+
+        return validateBroker(SimulatedBroker(**options))
+
+    raise ValueError(f"Unknown broker \"{name}\"")
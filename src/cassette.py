@@ -0,0 +1,381 @@
+from datetime import timedelta
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+"""
+Record and replay of the HTTP traffic of the wrappers
+
+Every request made through requests (Plaid, robin_stocks, RobinhoodAPIWrapper)
+or httplib2 (the Google API client) is captured into a cassette file while
+recording, and answered from it while replaying, without any network access.
+"""
+
+RECORD_MODE = "record"
+REPLAY_MODE = "replay"
+CASSETTE_MODES = [RECORD_MODE, REPLAY_MODE]
+
+CASSETTE_FORMAT_VERSION = 1
+
+# Values of these fields (JSON keys, form fields and query parameters, in
+# requests and responses) are replaced with SCRUBBED_VALUE before anything is
+# written. Request headers are never written, and only the response headers
+# in RECORDED_RESPONSE_HEADERS are.
+SCRUBBED_FIELDS = {"access_token", "refresh_token", "id_token", "token",
+                   "password", "username", "client_id", "client_secret",
+                   "secret", "mfa_code", "device_token", "challenge_id",
+                   "account_number", "routing_number", "mask", "key"}
+SCRUBBED_VALUE = "<scrubbed>"
+
+# Values of these response fields are collected while recording and replaced
+# with SCRUBBED_VALUE everywhere else they appear (URLs, request paths, request
+# bodies and other responses, e.g. the /accounts/<number>/ URLs of positions)
+LEARNED_SCRUBBED_FIELDS = {"account_number"}
+
+# Response bodies of these hosts are never written (the connectivity probe
+# echoes the public IP address); an empty body is replayed instead
+UNRECORDED_CONTENT_HOSTS = {"api.myip.com"}
+
+RECORDED_RESPONSE_HEADERS = ["content-type"]
+
+# Latency profiles for replayed responses: "none" (instant), "recorded" (the
+# latency measured while recording), "fixed:<seconds>" or "scaled:<factor>"
+# (recorded latency multiplied by factor)
+DEFAULT_LATENCY_PROFILE = "none"
+
+# Installed cassette (see install)
+CASSETTE = None
+
+
+class CassetteMissError(Exception):
+    # Raised while replaying a request that was never recorded
+    pass
+
+
+def scrubValue(value):
+    if isinstance(value, dict):
+        return {key: (SCRUBBED_VALUE if key.lower() in SCRUBBED_FIELDS else scrubValue(item))
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [scrubValue(item) for item in value]
+    return value
+
+
+def getFieldValues(value, fields):
+    # Values of the given fields anywhere in a parsed JSON document
+    if isinstance(value, dict):
+        values = set()
+        for key, item in value.items():
+            if key.lower() in fields and isinstance(item, (str, int)) and len(str(item)) >= 4:
+                values.add(str(item))
+            else:
+                values |= getFieldValues(item, fields)
+        return values
+    if isinstance(value, list):
+        return set().union(*(getFieldValues(item, fields) for item in value))
+    return set()
+
+
+def replaceSecretValues(text, secretValues):
+    # Longest values first, so that a value containing another is replaced
+    # whole
+    for secretValue in sorted(secretValues, key=len, reverse=True):
+        text = text.replace(secretValue, SCRUBBED_VALUE)
+    return text
+
+
+def scrubURL(url, secretValues=()):
+    # The path is compared unquoted, as a scrubbed value replayed into a path
+    # is percent-encoded by the client
+    parts = urlsplit(url)
+    query = [(key, SCRUBBED_VALUE if key.lower() in SCRUBBED_FIELDS else item)
+             for key, item in parse_qsl(parts.query, keep_blank_values=True)]
+    url = urlunsplit(parts._replace(path=unquote(parts.path), query=urlencode(sorted(query))))
+    return replaceSecretValues(url, secretValues)
+
+
+def scrubBody(body):
+    # Returns the body as scrubbed text (canonical JSON or form data), or a
+    # digest for binary bodies
+    if body is None or body == b"" or body == "":
+        return None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return "sha256:" + hashlib.sha256(body).hexdigest()
+
+    try:
+        return json.dumps(scrubValue(json.loads(body)), sort_keys=True)
+    except ValueError:
+        pass
+
+    fields = parse_qsl(body, keep_blank_values=True)
+    if fields and "=" in body:
+        return urlencode(sorted((key, SCRUBBED_VALUE if key.lower() in SCRUBBED_FIELDS else item)
+                                for key, item in fields))
+    return body
+
+
+def getSecretValues(url, body):
+    # Values of the scrubbed fields of a request, which are also removed from
+    # its response (e.g. where a token is echoed back in a URL)
+    fields = parse_qsl(urlsplit(url).query, keep_blank_values=True)
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="ignore")
+    if body:
+        try:
+            parsedBody = json.loads(body)
+            if isinstance(parsedBody, dict):
+                fields += list(parsedBody.items())
+        except ValueError:
+            fields += parse_qsl(body, keep_blank_values=True)
+
+    return {str(value) for key, value in fields
+            if key.lower() in SCRUBBED_FIELDS and len(str(value)) >= 4}
+
+
+def getLearnedSecretValues(content):
+    # Values of LEARNED_SCRUBBED_FIELDS in a JSON response
+    try:
+        return getFieldValues(json.loads(content.decode("utf-8")), LEARNED_SCRUBBED_FIELDS)
+    except ValueError:
+        return set()
+
+
+def scrubResponseBody(content, secretValues=()):
+    try:
+        text = json.dumps(scrubValue(json.loads(content.decode("utf-8"))))
+    except ValueError:
+        text = content.decode("utf-8")
+
+    return replaceSecretValues(text, secretValues)
+
+
+def encodeContent(content, secretValues=()):
+    # JSON and text responses are stored readable, anything else as base64
+    try:
+        return {"text": scrubResponseBody(content, secretValues)}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def decodeContent(stored):
+    if "text" in stored:
+        return stored["text"].encode("utf-8")
+    return base64.b64decode(stored["base64"])
+
+
+def getMatchKey(method, url, body, secretValues=()):
+    key = f"{method.upper()} {scrubURL(url)} {scrubBody(body)}"
+    return replaceSecretValues(key, secretValues)
+
+
+def scrubInteraction(interaction, secretValues):
+    # Replaces secret values learned after the interaction was recorded
+    interaction["key"] = replaceSecretValues(interaction["key"], secretValues)
+    interaction["request"]["url"] = replaceSecretValues(interaction["request"]["url"], secretValues)
+    content = interaction["response"]["content"]
+    if "text" in content:
+        content["text"] = replaceSecretValues(content["text"], secretValues)
+
+
+def getReplayLatency(latencyProfile, recordedSeconds):
+    if latencyProfile == "none":
+        return 0.0
+    if latencyProfile == "recorded":
+        return recordedSeconds
+    kind, _, value = latencyProfile.partition(":")
+    if kind == "fixed":
+        return float(value)
+    if kind == "scaled":
+        return recordedSeconds * float(value)
+    raise ValueError(f"Unknown latency profile \"{latencyProfile}\"")
+
+
+class Cassette:
+
+    def __init__(self, path, mode, latencyProfile=DEFAULT_LATENCY_PROFILE,
+                 sleep=time.sleep):
+        self.path = path
+        self.mode = mode
+        self.latencyProfile = latencyProfile
+        self.sleep = sleep
+        self.interactions = []
+        self.lock = threading.Lock()
+
+        # Values of LEARNED_SCRUBBED_FIELDS seen in recorded responses
+        self.secretValues = set()
+
+        # Replayed requests are matched by method, scrubbed URL and scrubbed
+        # body. Repeated requests get the recorded responses in order, then
+        # start over from the first one.
+        self.responsesByKey = {}
+        self.nextResponseIndexes = {}
+
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+        if mode == REPLAY_MODE:
+            self.load()
+
+    def load(self):
+        with open(self.path) as file:
+            cassette = json.load(file)
+        if cassette.get("formatVersion") != CASSETTE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported cassette format in {self.path}")
+
+        self.interactions = cassette["interactions"]
+        for interaction in self.interactions:
+            self.responsesByKey.setdefault(interaction["key"], []).append(interaction)
+
+    def save(self):
+        # Written through a temporary file so that an interrupted save never
+        # leaves a partial cassette behind
+        with self.lock:
+            for interaction in self.interactions:
+                scrubInteraction(interaction, self.secretValues)
+            cassette = {"formatVersion": CASSETTE_FORMAT_VERSION,
+                        "interactions": list(self.interactions)}
+        tempFilePath = f"{self.path}.tmp"
+        with open(tempFilePath, "w") as file:
+            json.dump(cassette, file, indent=1)
+        os.replace(tempFilePath, self.path)
+
+    def record(self, method, url, body, status, headers, content, elapsedSeconds):
+        if urlsplit(url).hostname in UNRECORDED_CONTENT_HOSTS:
+            content = b""
+
+        with self.lock:
+            self.secretValues |= getLearnedSecretValues(content)
+            secretValues = set(self.secretValues)
+
+        interaction = {"key": getMatchKey(method, url, body, secretValues),
+                       "request": {"method": method.upper(), "url": scrubURL(url, secretValues)},
+                       "response": {"status": status,
+                                    "headers": {name: headers[name] for name in RECORDED_RESPONSE_HEADERS
+                                                if name in headers},
+                                    "content": encodeContent(content, secretValues | getSecretValues(url, body))},
+                       "elapsedSeconds": elapsedSeconds}
+        with self.lock:
+            self.interactions.append(interaction)
+            self.stats["recorded"] += 1
+
+    def replay(self, method, url, body):
+        # Returns (status, headers, content) of the recorded response
+        key = getMatchKey(method, url, body)
+        with self.lock:
+            responses = self.responsesByKey.get(key)
+            if not responses:
+                self.stats["misses"] += 1
+                raise CassetteMissError(f"No recorded response for {key}")
+
+            index = self.nextResponseIndexes.get(key, 0)
+            self.nextResponseIndexes[key] = (index + 1) % len(responses)
+            self.stats["replayed"] += 1
+            interaction = responses[index]
+
+        latency = getReplayLatency(self.latencyProfile, interaction["elapsedSeconds"])
+        if latency > 0:
+            self.sleep(latency)
+
+        response = interaction["response"]
+        return response["status"], response["headers"], decodeContent(response["content"])
+
+    def getStats(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+def patchRequests(cassette):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    originalSend = requests.Session.send
+
+    def send(session, request, **kwargs):
+        if cassette.mode == RECORD_MODE:
+            startTime = time.monotonic()
+            response = originalSend(session, request, **kwargs)
+            cassette.record(request.method, request.url, request.body,
+                            response.status_code, {name.lower(): value for name, value in response.headers.items()},
+                            response.content, time.monotonic() - startTime)
+            return response
+
+        status, headers, content = cassette.replay(request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(0)
+
+        # Response hooks run as they would for a real response
+        return requests.hooks.dispatch_hook("response", request.hooks, response, **kwargs)
+
+    requests.Session.send = send
+    return lambda: setattr(requests.Session, "send", originalSend)
+
+
+def patchHttplib2(cassette):
+    # The Google API client is optional (only needed by SheetsAPIWrapper)
+    try:
+        import httplib2
+    except ImportError:
+        return lambda: None
+
+    originalRequest = httplib2.Http.request
+
+    def request(http, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        if cassette.mode == RECORD_MODE:
+            startTime = time.monotonic()
+            response, content = originalRequest(http, uri, method, body, headers,
+                                                *args, **kwargs)
+            cassette.record(method, uri, body, response.status,
+                            {name.lower(): value for name, value in response.items()},
+                            content, time.monotonic() - startTime)
+            return response, content
+
+        status, headers, content = cassette.replay(method, uri, body)
+        return httplib2.Response(dict(headers, status=str(status))), content
+
+    httplib2.Http.request = request
+    return lambda: setattr(httplib2.Http, "request", originalRequest)
+
+
+# Functions restoring the patched transports
+UNPATCH_FUNCTIONS = []
+
+
+def install(path, mode, latencyProfile=DEFAULT_LATENCY_PROFILE):
+    # Routes every HTTP request of the process through a cassette
+    global CASSETTE
+    if CASSETTE is not None:
+        uninstall()
+
+    CASSETTE = Cassette(path, mode, latencyProfile=latencyProfile)
+    UNPATCH_FUNCTIONS.append(patchRequests(CASSETTE))
+    UNPATCH_FUNCTIONS.append(patchHttplib2(CASSETTE))
+    return CASSETTE
+
+
+def uninstall():
+    # Restores the transports, saving the cassette if it was recording
+    global CASSETTE
+    if CASSETTE is None:
+        return
+
+    while UNPATCH_FUNCTIONS:
+        UNPATCH_FUNCTIONS.pop()()
+    if CASSETTE.mode == RECORD_MODE:
+        CASSETTE.save()
+    CASSETTE = None
+
+
+def isReplaying():
+    return CASSETTE is not None and CASSETTE.mode == REPLAY_MODE
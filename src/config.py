@@ -0,0 +1,10 @@
+"""
+Settings shared by the recurring investment flow (main.py) and the offline
+backtest (backtest.py)
+"""
+
+# Ensures that there is AT MINMUM this amount of available brokerage funds
+BROKERAGE_ACCOUNT_CASH_BUFFER = 100
+
+# Ensures that there is AT MINMUM this amount of available bank account funds
+BANK_ACCOUNT_CASH_BUFFER = 500
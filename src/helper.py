@@ -1,14 +1,123 @@
+from datetime import date
+import argparse
+import functools
 import json
 
-INVESTMENT_HISTORY_PATH = "investments/investment-history.json"
-
-with open(INVESTMENT_HISTORY_PATH, "r") as file:
-    data = json.load(file)
-    orderCount = 0
-    weekCount = 0
-    for weeklyOrdersObj in data:
-        weekCount += 1
-        for order in weeklyOrdersObj["orders"]:
-            orderCount += 1
-    print(f"orderCount:{orderCount}")
-    print(f"weekCount:{weekCount}")
\ No newline at end of file
+import historyStore
+
+"""
+Analytics over the investment history
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def getWeekOfDate(isoDate):
+    # ISO week (e.g. 2021-W01); cached since every order of a run shares a date
+    year, week, _ = date.fromisoformat(isoDate).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def getMonthOfDate(isoDate):
+    return isoDate[:7]
+
+
+def analyzeInvestmentHistory(startDate=None, endDate=None):
+    # Aggregates the history one order at a time (memory grows with the number
+    # of symbols/weeks/months, not with the number of orders)
+    report = {"summary": {"orderCount": 0, "runCount": 0, "weekCount": 0, "totalInvested": 0.0,
+                          "firstDate": None, "lastDate": None},
+              "symbols": {},
+              "weeks": {},
+              "months": {},
+              "recurringTypes": {}}
+
+    lastRunId = None
+    for runId, isoDate, recurringType, symbol, amount in historyStore.iterateOrders(
+            startDate=startDate, endDate=endDate):
+        summary = report["summary"]
+        summary["orderCount"] += 1
+        summary["totalInvested"] += amount
+        if summary["firstDate"] is None:
+            summary["firstDate"] = isoDate
+        summary["lastDate"] = isoDate
+
+        # Orders are sorted by date and run, so each run is counted once
+        if runId != lastRunId:
+            summary["runCount"] += 1
+            lastRunId = runId
+
+        symbolTotals = report["symbols"].setdefault(
+            symbol, {"orderCount": 0, "totalInvested": 0.0})
+        symbolTotals["orderCount"] += 1
+        symbolTotals["totalInvested"] += amount
+
+        week = getWeekOfDate(isoDate)
+        report["weeks"][week] = report["weeks"].get(week, 0.0) + amount
+
+        month = getMonthOfDate(isoDate)
+        report["months"][month] = report["months"].get(month, 0.0) + amount
+
+        report["recurringTypes"][recurringType] = report["recurringTypes"].get(
+            recurringType, 0) + 1
+
+    # Distinct ISO weeks with at least one order (runs of several cadences
+    # may share a week)
+    report["summary"]["weekCount"] = len(report["weeks"])
+
+    return report
+
+
+def formatTable(title, headers, rows):
+    widths = [max([len(str(header))] + [len(str(row[i])) for row in rows])
+              for i, header in enumerate(headers)]
+    lines = [title,
+             "  ".join(str(header).ljust(widths[i]) for i, header in enumerate(headers)),
+             "  ".join("-" * width for width in widths)]
+    for row in rows:
+        lines.append("  ".join(str(value).ljust(widths[i])
+                               for i, value in enumerate(row)))
+    return "\n".join(lines)
+
+
+def printReportAsTables(report):
+    summary = report["summary"]
+    print(formatTable("Summary", ["Field", "Value"],
+                      [[key, value if not isinstance(value, float) else f"{value:.2f}"]
+                       for key, value in summary.items()]))
+    print()
+
+    symbolRows = sorted(report["symbols"].items(),
+                        key=lambda item: item[1]["totalInvested"], reverse=True)
+    print(formatTable("Totals by symbol", ["Symbol", "Orders", "Invested"],
+                      [[symbol, totals["orderCount"], f"{totals['totalInvested']:.2f}"]
+                       for symbol, totals in symbolRows]))
+    print()
+
+    print(formatTable("Contributions by week", ["Week", "Invested"],
+                      [[week, f"{amount:.2f}"]
+                       for week, amount in sorted(report["weeks"].items())]))
+    print()
+
+    print(formatTable("Contributions by month", ["Month", "Invested"],
+                      [[month, f"{amount:.2f}"]
+                       for month, amount in sorted(report["months"].items())]))
+    print()
+
+    print(formatTable("Orders by recurring type", ["Recurring Type", "Orders"],
+                      sorted(report["recurringTypes"].items())))
+
+
+# Main function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Investment history analytics")
+    parser.add_argument("--start", help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to include (YYYY-MM-DD)")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = analyzeInvestmentHistory(startDate=args.start, endDate=args.end)
+
+    if args.format == "json":
+        print(json.dumps(report, indent=2))
+    else:
+        printReportAsTables(report)
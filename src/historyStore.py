@@ -0,0 +1,244 @@
+from datetime import datetime
+import json
+import math
+import os
+import sqlite3
+
+"""
+SQLite-backed store for the investment history
+"""
+
+HISTORY_DB_FILE_PATH = "./investments/investment-history.db"
+
+# Legacy JSON history, imported automatically when the database is created
+LEGACY_HISTORY_FILE_PATH = "./investments/investment-history.json"
+
+# Dates are stored as ISO strings (sortable, usable in range queries) and
+# converted from/to the legacy "%m-%d-%y" format at the JSON boundary
+LEGACY_DATE_FORMAT = "%m-%d-%y"
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    recurringType TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    runId INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    recurringType TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runsDateIndex ON runs(date, recurringType);
+CREATE INDEX IF NOT EXISTS runsRecurringTypeIndex ON runs(recurringType, date);
+CREATE INDEX IF NOT EXISTS ordersDateIndex ON orders(date);
+CREATE INDEX IF NOT EXISTS ordersSymbolIndex ON orders(symbol, date);
+CREATE INDEX IF NOT EXISTS ordersRecurringTypeIndex ON orders(recurringType, date);
+"""
+
+# Opened on first use
+CONNECTION = None
+
+
+def getConnection():
+    global CONNECTION
+    if CONNECTION is None:
+        CONNECTION = openConnection(HISTORY_DB_FILE_PATH)
+    return CONNECTION
+
+
+def openConnection(path):
+    # The connection may be opened on a pre-flight thread and used afterwards
+    # from the main thread (never concurrently)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA foreign_keys = ON")
+
+    # user_version is 0 for a newly created database
+    userVersion = connection.execute("PRAGMA user_version").fetchone()[0]
+    if userVersion < SCHEMA_VERSION:
+        connection.executescript(SCHEMA)
+
+        # Schema version is only recorded once the (transactional) import
+        # succeeded, so a failed import is retried on the next run
+        if userVersion == 0 and os.path.exists(LEGACY_HISTORY_FILE_PATH):
+            print("Importing legacy investment history....")
+            importFromJSON(LEGACY_HISTORY_FILE_PATH, connection=connection)
+
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    return connection
+
+
+def toISODate(date):
+    # Accepts date/datetime objects, ISO strings or legacy "%m-%d-%y" strings
+    if hasattr(date, "isoformat"):
+        return date.strftime("%Y-%m-%d")
+    try:
+        return datetime.strptime(date, LEGACY_DATE_FORMAT).strftime("%Y-%m-%d")
+    except ValueError:
+        return datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def toLegacyDate(isoDate):
+    return datetime.strptime(isoDate, "%Y-%m-%d").strftime(LEGACY_DATE_FORMAT)
+
+
+def insertRun(connection, recurringType, date, orders):
+    isoDate = toISODate(date)
+    cursor = connection.execute(
+        "INSERT INTO runs (date, recurringType) VALUES (?, ?)",
+        (isoDate, recurringType))
+    connection.executemany(
+        "INSERT INTO orders (runId, date, recurringType, symbol, amount) VALUES (?, ?, ?, ?, ?)",
+        [(cursor.lastrowid, isoDate, recurringType, symbol, amount)
+         for symbol, amount in orders.items()])
+
+
+def addRun(recurringType, date, orders):
+    # Run and its orders are written in a single transaction
+    connection = getConnection()
+    with connection:
+        insertRun(connection, recurringType, date, orders)
+
+
+def addRuns(date, ordersByRecurringType):
+    # Records one run per recurring type, all in a single transaction
+    connection = getConnection()
+    with connection:
+        for recurringType, orders in ordersByRecurringType.items():
+            insertRun(connection, recurringType, date, orders)
+
+
+def getLastRunDate(recurringType):
+    # ISO date of the latest run of recurringType (a single seek on
+    # runsRecurringTypeIndex), or None
+    return getConnection().execute(
+        "SELECT MAX(date) FROM runs WHERE recurringType = ?",
+        (recurringType,)).fetchone()[0]
+
+
+def countRuns():
+    return getConnection().execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+
+def iterateRuns(connection=None):
+    # Yields runs in the legacy JSON shape, one at a time
+    connection = connection if connection is not None else getConnection()
+    rows = connection.execute(
+        "SELECT runs.id, runs.date, runs.recurringType, orders.symbol, orders.amount "
+        "FROM runs LEFT JOIN orders ON orders.runId = runs.id "
+        "ORDER BY runs.id, orders.id")
+
+    run = None
+    for runId, isoDate, recurringType, symbol, amount in rows:
+        if run is None or run["id"] != runId:
+            if run is not None:
+                yield {"recurringType": run["recurringType"], "date": run["date"],
+                       "orders": run["orders"]}
+            run = {"id": runId, "recurringType": recurringType,
+                   "date": toLegacyDate(isoDate), "orders": {}}
+        if symbol is not None:
+            run["orders"][symbol] = amount
+
+    if run is not None:
+        yield {"recurringType": run["recurringType"], "date": run["date"],
+               "orders": run["orders"]}
+
+
+def iterateOrders(startDate=None, endDate=None):
+    # Yields (runId, date, recurringType, symbol, amount) rows one at a time
+    # (ISO dates, inclusive range), so callers can aggregate in constant
+    # memory
+    query = "SELECT runId, date, recurringType, symbol, amount FROM orders"
+    conditions = []
+    params = []
+    if startDate is not None:
+        conditions.append("date >= ?")
+        params.append(toISODate(startDate))
+    if endDate is not None:
+        conditions.append("date <= ?")
+        params.append(toISODate(endDate))
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    yield from getConnection().execute(query + " ORDER BY date, runId, id", params)
+
+
+def clearHistory():
+    connection = getConnection()
+    with connection:
+        connection.execute("DELETE FROM orders")
+        connection.execute("DELETE FROM runs")
+
+
+def toAmount(value):
+    # Legacy amounts may be numbers or numeric strings; returns None for
+    # missing or non-numeric amounts
+    if isinstance(value, bool):
+        return None
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) else None
+
+
+def importFromJSON(path, connection=None):
+    # Imports a legacy investment-history.json list in a single transaction.
+    # Orders with a missing or non-numeric amount are skipped (and reported),
+    # since one of them would otherwise fail the whole import.
+    connection = connection if connection is not None else getConnection()
+    with open(path) as file:
+        investmentHistory = json.load(file)
+
+    skippedOrderCount = 0
+    with connection:
+        for entry in investmentHistory:
+            orders = {}
+            for symbol, value in entry["orders"].items():
+                amount = toAmount(value)
+                if amount is None:
+                    print(f"WARNING: skipping {symbol} order of {entry['date']} "
+                          f"with amount {value!r}")
+                    skippedOrderCount += 1
+                else:
+                    orders[symbol] = amount
+            insertRun(connection, entry["recurringType"], entry["date"], orders)
+
+    if skippedOrderCount > 0:
+        print(f"Skipped {skippedOrderCount} orders with a missing or non-numeric amount")
+
+    return len(investmentHistory)
+
+
+def exportToJSON(path):
+    # Writes the history in the legacy investment-history.json format without
+    # holding it all in memory
+    with open(path, "w") as file:
+        file.write("[")
+        for i, run in enumerate(iterateRuns()):
+            if i > 0:
+                file.write(", ")
+            json.dump(run, file)
+        file.write("]")
+
+
+# Main function
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Import or export the investment history as JSON")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"Imported {importFromJSON(args.path)} runs from {args.path}")
+    else:
+        exportToJSON(args.path)
+        print(f"Exported {countRuns()} runs to {args.path}")
@@ -1,66 +1,144 @@
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+import argparse
+import random
 import requests
+import signal
+import threading
 from time import sleep
 import json
 import os
-global SheetsAPIWrapper
-from wrappers import SheetsAPIWrapper
+import traceback
 
-# PlaidAPIWrapper has global constants that are reliant upon a stable
-# internet connection
-global PlaidAPIWrapper
+# Wrappers initialize their clients and fetch remote data lazily (on first
+# use), so importing them does not require an internet connection
+from wrappers import SheetsAPIWrapper
 from wrappers import PlaidAPIWrapper
-
-global RobinhoodAPIWrapper
 from wrappers import RobinhoodAPIWrapper
 
+import broker
+import cassette
+import config
+import historyStore
+import metrics
+import orderJournal
+import orderPipeline
+import preflight
+import profiler
+import scheduleEngine
 
-def awaitInternetConnection():
-    print("Determining Internet connection....")
-    count = 1
-    while True:
-        try:
-            print(f"Attempting connection #{count}")
-            url = "https://api.myip.com/"
-            resp = requests.get(url=url, timeout=1)
-            count += 1
-            break
-        except:
-            pass
-    print("Internet connection established!")
 
+# Global constants 
 
-def importCustomWrappers():
-    print("Importing custom wrappers...")
+# Connectivity is probed with exponential backoff and full jitter (each retry
+# waits a random delay of up to the current backoff)
+CONNECTIVITY_CHECK_URL = "https://api.myip.com/"
+CONNECTIVITY_CHECK_TIMEOUT = 5
+CONNECTIVITY_INITIAL_BACKOFF_SECONDS = 1
+CONNECTIVITY_MAX_BACKOFF_SECONDS = 5 * 60
 
-    # SheetsAPIWrapper has global constants that are reliant upon a stable
-    # internet connection
-    global SheetsAPIWrapper
-    from wrappers import SheetsAPIWrapper
-    
-    # PlaidAPIWrapper has global constants that are reliant upon a stable
-    # internet connection
-    global PlaidAPIWrapper
-    from wrappers import PlaidAPIWrapper
+# Daemon mode: scheduled runs start at this local time on their due date
+DAEMON_RUN_TIME = time(hour=9)
 
-    global RobinhoodAPIWrapper
-    from wrappers import RobinhoodAPIWrapper
+# Connectivity, the broker session and the spreadsheet snapshot are warmed
+# up this long before a scheduled run, so orders go out on time
+DAEMON_PREWARM_SECONDS = 5 * 60
 
-    # Global/Import combination ensures imports can be used throughout
-    # the entire script (not just within the functino)
+# Runs that fail or leave orders unsent are retried after this long
+DAEMON_RETRY_SECONDS = 15 * 60
 
-# Global constants 
+# Daemon sleeps are split into waits of at most this long, so that clock
+# changes and system suspends do not delay a run
+DAEMON_MAX_SLEEP_SECONDS = 60 * 60
+
+# Set by SIGINT/SIGTERM; every wait in awaitInternetConnection and the daemon
+# returns as soon as it is set
+STOP_EVENT = threading.Event()
+
+# NOTE: the brokerage and bank account cash buffers are in config.py (shared
+# with backtest.py)
+
+# NOTE: Robinhood orders are paced by RobinhoodAPIWrapper.BROKER_RATE_LIMITER
+# (shared by every broker request) rather than a fixed delay between orders
+
+# Broker that orders, deposits and buying power go through (see broker.py).
+# Set from the required --broker option when run as a script: there is no
+# default, so that a live run is never mistaken for a simulated one.
+BROKER = None
+
+# Orders of the current run, grouped by cadence
+MAIN_CACHE_FILE_PATH = "./investments/investment-history-cache-main.json"
+
+# Simulated runs keep their investment history, order journal and caches here,
+# so that they never mark live orders as done
+SIMULATED_STATE_DIRECTORY = "./investments/simulated"
+
+# Maximum number of orders awaiting acknowledgement at once
+MAX_ORDERS_IN_FLIGHT = 4
+
+# Seconds each pre-flight call (due orders from Google Sheets, available funds
+# of the funding and every linked bank account from Plaid, buying power from
+# the broker) may take
+PREFLIGHT_TIMEOUTS = {"ordersByCadence": 60,
+                      "bankAvailableFunds": 30,
+                      "brokerageBuyingPower": 30}
 
-SUNDAY_NUMERIC_VALUE = 6
+# Outcomes accepted by --resolve-order: unacknowledged orders were placed or
+# failed (resent); rejected orders are resent (failed) or skipped
+ORDER_RESOLUTIONS = ["placed", "failed", "skipped"]
 
-# Ensures that there is AT MINMUM this amount of available brokerage funds
-BROKERAGE_ACCOUNT_CASH_BUFFER = 100
+# Set from --metrics-textfile / --metrics-report when run as a script; the
+# metrics are written after every run (see writeMetrics)
+METRICS_TEXTFILE_PATH = None
+METRICS_REPORT_PATH = None
 
-# Ensures that there is AT MINMUM this amount of available bank account funds
-BANK_ACCOUNT_CASH_BUFFER = 500
 
-# Prevents API from being flooded with fractional orders
-FRACTIONAL_ORDER_FLOW_DELAY = 7.5
+def getBroker():
+    if BROKER is None:
+        raise RuntimeError("No broker selected (choose one with --broker)")
+    return BROKER
+
+
+def useStateDirectory(directory):
+    # Moves the investment history, order journal and main cache (and the
+    # legacy files they are imported from) into directory
+    global MAIN_CACHE_FILE_PATH
+    os.makedirs(directory, exist_ok=True)
+
+    def inDirectory(path):
+        return os.path.join(directory, os.path.basename(path))
+
+    MAIN_CACHE_FILE_PATH = inDirectory(MAIN_CACHE_FILE_PATH)
+    historyStore.HISTORY_DB_FILE_PATH = inDirectory(historyStore.HISTORY_DB_FILE_PATH)
+    historyStore.LEGACY_HISTORY_FILE_PATH = inDirectory(historyStore.LEGACY_HISTORY_FILE_PATH)
+    orderJournal.JOURNAL_FILE_PATH = inDirectory(orderJournal.JOURNAL_FILE_PATH)
+    orderJournal.LEGACY_PROGRESS_CACHE_FILE_PATH = inDirectory(
+        orderJournal.LEGACY_PROGRESS_CACHE_FILE_PATH)
+
+    if not os.path.exists(MAIN_CACHE_FILE_PATH):
+        writeToMainCache({})
+
+
+def awaitInternetConnection():
+    # Returns False if stopped before a connection was established
+    print("Determining Internet connection....")
+    count = 1
+    backoff = CONNECTIVITY_INITIAL_BACKOFF_SECONDS
+    while not STOP_EVENT.is_set():
+        try:
+            print(f"Attempting connection #{count}")
+            requests.get(url=CONNECTIVITY_CHECK_URL,
+                         timeout=CONNECTIVITY_CHECK_TIMEOUT)
+            print("Internet connection established!")
+            return True
+        except requests.RequestException:
+            delay = random.uniform(0, backoff)
+            print(f"No Internet connection, retrying in {delay:.1f}s....")
+            STOP_EVENT.wait(delay)
+            backoff = min(backoff * 2, CONNECTIVITY_MAX_BACKOFF_SECONDS)
+            count += 1
+
+    return False
 
 
 def clearAllDatabases():
@@ -74,7 +152,7 @@ def clearAllDatabases():
 
 def validateEmptyInvestmentHistoryCache():
     # Validate that investment-history-cache-main is EMPTY
-    with open("./investments/investment-history-cache-main.json") as file:
+    with open(MAIN_CACHE_FILE_PATH) as file:
         investmentHistoryCache = json.load(file)
 
     emptyCache = len(list(investmentHistoryCache.keys())) == 0
@@ -82,39 +160,94 @@ def validateEmptyInvestmentHistoryCache():
     return emptyCache
 
 
-def validateWeeklyOrdersNotCompleted():
-
-    # Function should only be called if the day is Sunday
-
-    # Determine currDate
-    currDatetime = datetime.now()
-    currWeekdayVal = currDatetime.weekday()
-    currDate = currDatetime.strftime("%m-%d-%y")
-
-    # Validate that investment-history does not contain an entry for the
-    # given Sunday
-    with open("./investments/investment-history.json") as file:
-        investmentHistory = json.load(file)
+def getDueOrdersByCadence(currDate):
+    # Returns cadence -> {symbol: amount} for every cadence with a run due on
+    # currDate (cadences already recorded in the investment history for their
+    # latest scheduled date are not due)
+    recurringCadences = {symbol: scheduleEngine.normalizeCadence(cadence)
+                         for symbol, cadence in SheetsAPIWrapper.getRecurringInvestmentCadences().items()}
+    dueCadences = scheduleEngine.getDueCadences(
+        set(recurringCadences.values()), currDate)
 
-    ordersCompleted = False
-    for entry in investmentHistory:
-        if entry["date"] == currDate:
-            ordersCompleted = True
+    return scheduleEngine.groupOrdersByCadence(
+        SheetsAPIWrapper.getAllRecurringInvestments(), recurringCadences,
+        dueCadences)
 
-    return not ordersCompleted
 
+def printNextRunDates(currDate):
+    cadences = {scheduleEngine.normalizeCadence(cadence)
+                for cadence in SheetsAPIWrapper.getRecurringInvestmentCadences().values()}
+    for cadence, nextRunDate in sorted(scheduleEngine.getNextRunDates(cadences, currDate).items(),
+                                       key=lambda item: item[1]):
+        print(f"Next {cadence} orders are scheduled for {nextRunDate.isoformat()}")
 
-def validateSufficientFunds(totalInvestmentValue):
 
-    print("Determining available bank account funds (with buffer)....")
-    availBankAccountFunds = PlaidAPIWrapper.getAccountAvailableBalance() - \
-        BANK_ACCOUNT_CASH_BUFFER
-
-    print("Determining available brokerage account funds (with buffer)....")
-    availBrokerageFunds = RobinhoodAPIWrapper.getAccountBuyingPower() - \
-        BROKERAGE_ACCOUNT_CASH_BUFFER
-
-    fundsToBeDeposited = totalInvestmentValue - availBrokerageFunds
+@contextmanager
+def runStage(stage):
+    # Times a stage of the order flow, and snapshots allocations when it ends
+    # (while profiling)
+    try:
+        with metrics.timed(metrics.STAGE_SECONDS, stage=stage):
+            yield
+    finally:
+        profiler.takeSnapshot(stage)
+
+
+def fetchBankAvailableFunds():
+    # Returns (funding account funds, total funds across every linked
+    # account). The total is fetched first so that the funding account's
+    # balance is read from the same cached balances.
+    totalBankAvailableFunds = PlaidAPIWrapper.getTotalAvailableFunds()
+    return PlaidAPIWrapper.getFundingAccountAvailableFunds(), totalBankAvailableFunds
+
+
+def runPreflight(currDate):
+    # Fetches the due orders and both balances concurrently, and returns
+    # (ordersByCadence, fundingSnapshot). When no orders are due the balances
+    # (and any error fetching them) are discarded and the snapshot is None.
+    print("Running pre-flight checks....")
+    startTime = datetime.now()
+    results = preflight.runConcurrently(
+        {"ordersByCadence": lambda: getDueOrdersByCadence(currDate),
+         "bankAvailableFunds": fetchBankAvailableFunds,
+         "brokerageBuyingPower": getBroker().getAccountBuyingPower},
+        timeouts=PREFLIGHT_TIMEOUTS, returnExceptions=True)
+
+    ordersByCadence = results["ordersByCadence"]
+    if isinstance(ordersByCadence, Exception):
+        raise ordersByCadence
+    if len(ordersByCadence) == 0:
+        return ordersByCadence, None
+
+    for name in ["bankAvailableFunds", "brokerageBuyingPower"]:
+        if isinstance(results[name], Exception):
+            raise results[name]
+
+    bankAvailableFunds, totalBankAvailableFunds = results["bankAvailableFunds"]
+    if bankAvailableFunds is None:
+        raise preflight.PreflightError(
+            "Pre-flight could not determine the available funds of the funding bank account")
+    if results["brokerageBuyingPower"] is None:
+        raise preflight.PreflightError(
+            "Pre-flight could not determine the brokerage buying power")
+
+    fundingSnapshot = preflight.FundingSnapshot(
+        totalInvestmentValue=sum(scheduleEngine.mergeOrders(ordersByCadence).values()),
+        bankAvailableFunds=bankAvailableFunds,
+        totalBankAvailableFunds=totalBankAvailableFunds,
+        brokerageBuyingPower=results["brokerageBuyingPower"],
+        fetchSeconds=(datetime.now() - startTime).total_seconds())
+    print(f"Pre-flight checks completed in {fundingSnapshot.fetchSeconds:.2f}s")
+    print(f"Funding bank account: ${fundingSnapshot.bankAvailableFunds} available "
+          f"(${fundingSnapshot.totalBankAvailableFunds} across every linked account)")
+
+    return ordersByCadence, fundingSnapshot
+
+
+def validateSufficientFunds(fundingSnapshot):
+
+    fundsToBeDeposited = fundingSnapshot.getFundsToBeDeposited(
+        brokerageCashBuffer=config.BROKERAGE_ACCOUNT_CASH_BUFFER)
     # fundsToBeDeposited = 0
 
     # Addresses cases in which funds should be deposited from the bank account
@@ -125,7 +258,8 @@ def validateSufficientFunds(totalInvestmentValue):
         # If there are not sufficient funds available in the bank acccount
         # STOP RECURRING INVESTMENT FLOW
         print("Checking if there are sufficient bank account funds to deposit into brokerage account....")
-        if (fundsToBeDeposited > availBankAccountFunds):
+        if (not fundingSnapshot.canDeposit(fundsToBeDeposited,
+                                           bankCashBuffer=config.BANK_ACCOUNT_CASH_BUFFER)):
             print("INSUFFICIENT FUNDS TO DEPOSIT INTO BROKERAGE ACCOUNT!")
             return False
         # If there ARE sufficient funds available in the bank account
@@ -133,7 +267,7 @@ def validateSufficientFunds(totalInvestmentValue):
         else:
             print(
                 f"Depositing ${fundsToBeDeposited} into brokerage account....")
-            RobinhoodAPIWrapper.depositFundsToAccount(
+            getBroker().depositFundsToAccount(
                 amount=fundsToBeDeposited)
             return True
 
@@ -144,229 +278,447 @@ def validateSufficientFunds(totalInvestmentValue):
         return True
 
 
-def retrieveSingleWeeklyOrderFromCache():
-
-    # Read progress cache JSON
-    investmentHistoryCache = loadProgressCache()
-
-    # Retrieve first order in progress cache
-    firstKey = list(investmentHistoryCache.keys())[0]
-    order = {"symbol": firstKey, "amount": investmentHistoryCache[firstKey]}
+def sendOrdersFromProgressCache(submitOrder):
+    # Send every order remaining in the progress cache, keeping up to
+    # MAX_ORDERS_IN_FLIGHT orders pending at once
+    ordersToBeSent = [{"symbol": symbol, "amount": amount}
+                      for symbol, amount in loadProgressCache().items()]
 
-    # Remove first order from progress cache
-    investmentHistoryCache.pop(firstKey)
-
-    # Update progress cache JSON
-    with open("./investments/investment-history-cache-progress.json", "w") as file:
-        json.dump(investmentHistoryCache, file)
-
-    return order
+    print(f"Sending {len(ordersToBeSent)} orders from progress cache...")
+    orderPipeline.submitOrders(ordersToBeSent, submitOrder=submitOrder,
+                               onSubmit=orderJournal.recordOrderSubmitted,
+                               onResult=orderJournal.recordOrderResult,
+                               maxInFlight=MAX_ORDERS_IN_FLIGHT)
 
 
 def clearAllCaches():
-    with open("./investments/investment-history-cache-main.json", "w") as file:
-        json.dump({},  file)
-    with open("./investments/investment-history-cache-progress.json", "w") as file:
+    with open(MAIN_CACHE_FILE_PATH, "w") as file:
         json.dump({},  file)
+    orderJournal.clearJournal()
 
 
 def clearInvestmentHistory():
-    with open("./investments/investment-history.json", "w") as file:
-        json.dump([],  file)
+    historyStore.clearHistory()
 
 
 def addToInvestmentHistory(toBeAdded):
+    # Records one run per cadence in "ordersByCadence"
     print("Updating investment history...")
-    investmentHistory = None
-    with open("./investments/investment-history.json") as file:
-        investmentHistory = json.load(file)
-
-    investmentHistory.append(toBeAdded)
-
-    with open("./investments/investment-history.json", "w") as file:
-        json.dump(investmentHistory, file)
+    historyStore.addRuns(date=toBeAdded["date"],
+                         ordersByRecurringType=toBeAdded["ordersByCadence"])
 
 
 def writeToMainCache(data):
-    with open("./investments/investment-history-cache-main.json", "w") as file:
+    with open(MAIN_CACHE_FILE_PATH, "w") as file:
         json.dump(data, file)
 
 
 def writeToProgressCache(data):
-    with open("./investments/investment-history-cache-progress.json", "w") as file:
-        json.dump(data, file)
+    # Progress is tracked in the order journal (replayed by loadProgressCache)
+    orderJournal.clearJournal()
+    orderJournal.queueOrders(data)
 
 
 def loadMainCache():
-    with open("./investments/investment-history-cache-main.json") as file:
-        return json.load(file)
+    # Returns the orders of the current run as cadence -> {symbol: amount}
+    with open(MAIN_CACHE_FILE_PATH) as file:
+        mainCache = json.load(file)
+
+    # Caches written before cadences were tracked hold {symbol: amount}
+    if any(not isinstance(orders, dict) for orders in mainCache.values()):
+        return {scheduleEngine.DEFAULT_CADENCE: mainCache}
+
+    return mainCache
 
 
 def loadProgressCache():
-    with open("./investments/investment-history-cache-progress.json") as file:
-        return json.load(file)
+    return orderJournal.getPendingOrders()
 
 
-def sendWeeklyOrders():
+def sendRecurringOrders():
 
     # Determine currDate
-    currDatetime = datetime.now()
-    currWeekdayVal = currDatetime.weekday()
-    currDate = currDatetime.strftime("%m-%d-%y")
+    currDate = datetime.now().date()
+
+    # Orders left by an order flow interrupted before the journal was
+    # introduced are resumed from the journal
+    importedOrders = orderJournal.importLegacyProgressCache()
+    if len(importedOrders) > 0:
+        print(f"Imported {len(importedOrders)} orders from the legacy progress cache....")
+
+    # Addresses cases in which order flow has NOT BEEN INITIATED
+    print("Determining cache status ....")
+    if (validateEmptyInvestmentHistoryCache()):
+
+        # Due orders and account balances are fetched at once
+        with runStage("preflight"):
+            ordersByCadence, fundingSnapshot = runPreflight(currDate)
+
+        # Addresses cases in which no orders are due today
+        if len(ordersByCadence) == 0:
+            print("No recurring orders are due!")
+            printNextRunDates(currDate)
+            sleep(2)
+            return
 
-    isSunday = (currWeekdayVal == SUNDAY_NUMERIC_VALUE)
+        # Initiate order flow
+        print(f"Initiating order flow for {', '.join(ordersByCadence)} orders....")
 
-    # If the day is Sunday, go through order flow
-    print("Validating day....")
-    # if (isSunday):s
-    if (True):
+        # Orders of every due cadence are sent as a single run
+        ordersToBeCached = scheduleEngine.mergeOrders(ordersByCadence)
 
-        # Addresses cases in which orders have not yet been completed
-        print("Determing order completion status....")
-        if (validateWeeklyOrdersNotCompleted()):
+        # Validate that there are sufficient funds for making
+        # recurring investments
+        print(
+            "Determine if brokerage has sufficient funds to make the investments...")
+        with runStage("funding"):
+            brokerageHasSufficientFunds = validateSufficientFunds(fundingSnapshot)
 
-            # Addresses cases in which order flow has NOT BEEN INITIATED
-            print("Determining cache status ....")
-            if (validateEmptyInvestmentHistoryCache()):
+        # NOTE: If there are sufficient funds at this point in the order
+        # flow, then if the flow is interrupted the brokerage account
+        # will still have all the liquidity it needs to complete the
+        # remaining orders
 
-                # Initiate order flow
-                print("Initiating order flow....")
+        if (brokerageHasSufficientFunds):
+            # Register the asset class of every symbol so orders do
+            # not have to probe for it
+            getBroker().seedAssetClassesFromCategories(
+                SheetsAPIWrapper.getRecurringInvestmentCategories())
 
-                # Validate that there are sufficient funds for making
-                # recurring investments
-                totalRecurringInvestmentsValue = SheetsAPIWrapper.getTotalRecurringInvestmentsValue()
+            print("Caching orders based on Google Sheets....")
+            with runStage("caching"):
+                writeToMainCache(ordersByCadence)
+                writeToProgressCache(ordersToBeCached)
 
-                print(
-                    "Determine if brokerage has sufficient funds to make the investments...")
-                brokerageHasSufficientFunds = validateSufficientFunds(
-                    totalInvestmentValue=totalRecurringInvestmentsValue)
+            # Send orders to the broker
+            with runStage("submission"):
+                sendOrdersFromProgressCache(submitOrder=sendMarketOrder)
 
-                # NOTE: If there are sufficient funds at this point in the order
-                # flow, then if the flow is interrupted the brokerage account
-                # will still have all the liquidity it needs to complete the
-                # remaining orders
+        else:
+            print("INSUFFICIENT FUNDS FOR CONTINUING ORDER FLOW!")
+            clearAllCaches()
 
-                if (brokerageHasSufficientFunds):
-                    # Cache prospective orders
-                    ordersToBeCached = SheetsAPIWrapper.getAllRecurringInvestments()
-                    print("Caching orders based on Google Sheets....")
-                    writeToMainCache(ordersToBeCached)
-                    writeToProgressCache(ordersToBeCached)
+            # STOP order flow
+            return
+    # Addresses cases in which order flow HAS been initiated but not
+    # completed
+    else:
+        print("Order flow previously initiated....")
+
+        # Drop completed events from the journal before resuming
+        # (unacknowledged orders are kept until they are resolved)
+        orderJournal.compactJournal()
+        metrics.incrementCounter(metrics.ORDER_RETRIES, len(loadProgressCache()))
+
+        print("Completing order flow.....")
+
+        # Send remaining orders to the broker
+        with runStage("submission"):
+            sendOrdersFromProgressCache(submitOrder=sendMarketOrder)
+
+    # Orders that failed remain in the progress cache and are resent
+    # the next time the order flow runs
+    if len(loadProgressCache()) > 0:
+        print("Some orders could not be sent, order flow will be resumed on the next run!")
+        return
+
+    # Orders interrupted while awaiting acknowledgement may have been
+    # placed and are not resent automatically, so the order flow cannot
+    # complete until they are resolved
+    unacknowledgedOrders = orderJournal.getUnacknowledgedOrders()
+    if len(unacknowledgedOrders) > 0:
+        print(
+            f"WARNING: orders submitted but never acknowledged: {unacknowledgedOrders}")
+        print("Verify them with the broker and resolve them with --resolve-order SYMBOL=placed|failed!")
+        return
+
+    # Orders refused by the broker every time they were sent are not resent
+    # automatically either
+    rejectedOrders = orderJournal.getRejectedOrders()
+    if len(rejectedOrders) > 0:
+        print(
+            f"WARNING: orders rejected {orderJournal.MAX_ORDER_REJECTIONS} times: {rejectedOrders}")
+        print("Fix them and resend them with --resolve-order SYMBOL=failed, or drop them with SYMBOL=skipped!")
+        return
+
+    print("Recurring orders completed!")
+    if getBroker() is RobinhoodAPIWrapper:
+        rateLimiterStats = RobinhoodAPIWrapper.BROKER_RATE_LIMITER.getStats()
+        print(
+            f"Waited {rateLimiterStats['totalWaitSeconds']:.2f}s on the broker rate limiter ({rateLimiterStats['throttled']} throttled requests)")
+    # By this point the cache tracking the order completiong process
+    # should be EMPTY (no more orders to send)
+
+    # Main cache should still contain all the info regarding the orders
+    # sent, grouped by cadence (skipped orders were never placed)
+    skippedOrders = orderJournal.getSkippedOrders()
+    ordersCompleted = {cadence: {symbol: amount for symbol, amount in orders.items()
+                                 if symbol not in skippedOrders}
+                       for cadence, orders in loadMainCache().items()}
+
+    # Update investment-history to indicate the completion of every due
+    # cadence
+    with runStage("history"):
+        addToInvestmentHistory(
+            toBeAdded={"date": currDate, "ordersByCadence": ordersCompleted})
+
+    print("Investment history updated!")
+
+    # Clear caches
+    clearAllCaches()
+
+
+def sendMarketOrder(symbol, amount):
+    with metrics.timed(metrics.ORDER_SECONDS):
+        return getBroker().buyFractionalSharesByPrice(
+            symbol=symbol, amountInDollars=amount)
+
+
+def parseOrderResolution(value):
+    # Parses SYMBOL=placed|failed|skipped (see --resolve-order)
+    symbol, _, outcome = value.rpartition("=")
+    if not symbol or outcome not in ORDER_RESOLUTIONS:
+        raise argparse.ArgumentTypeError(
+            f"expected SYMBOL={'|'.join(ORDER_RESOLUTIONS)}, got \"{value}\"")
+    return symbol, outcome
+
+
+def resolveOrders(resolutions):
+    for symbol, outcome in resolutions:
+        if symbol in orderJournal.getRejectedOrders():
+            if outcome == "placed":
+                raise ValueError(
+                    f"Order for {symbol} was rejected, resolve it as failed (resend) or skipped")
+            orderJournal.resolveRejectedOrder(symbol, resend=outcome == "failed")
+        else:
+            if outcome == "skipped":
+                raise ValueError(f"Only rejected orders can be skipped ({symbol} was not rejected)")
+            orderJournal.resolveUnacknowledgedOrder(symbol, placed=outcome == "placed")
 
-                    # Retrieve single order from cache
-                    for i in range(len(ordersToBeCached)):
+        print(f"Order for {symbol} resolved as "
+              f"{'failed (will be resent)' if outcome == 'failed' else outcome}")
 
-                        # Retrieve order and update cache
-                        print("Retrieving order from progress cache...")
-                        order = retrieveSingleWeeklyOrderFromCache()
 
-                        # Send order to RobinHood API
-                        sendSimulatedMarketOrder(
-                            symbol=order["symbol"], amount=order["amount"])
-                        # RobinhoodAPIWrapper.buyFractionalSharesByPrice(
-                        #     symbol=order["symbol"], amountInDollars=order["amount"])
+def enableMetrics():
+    # Times every call into the wrappers and counts HTTP traffic, on top of
+    # the stage and order timings recorded by sendRecurringOrders
+    metrics.enable()
+    for module in (SheetsAPIWrapper, PlaidAPIWrapper, RobinhoodAPIWrapper):
+        metrics.instrumentModule(module)
+    metrics.installHTTPHooks()
 
-                        # Pause to ensure that the API is not flooded
-                        sleep(FRACTIONAL_ORDER_FLOW_DELAY)
 
-                else:
-                    print("INSUFFICIENT FUNDS FOR CONTINUING ORDER FLOW!")
-                    clearAllCaches()
+def writeMetrics():
+    if METRICS_TEXTFILE_PATH:
+        metrics.writePrometheusTextfile(METRICS_TEXTFILE_PATH)
+    if METRICS_REPORT_PATH:
+        metrics.writeRunReport(METRICS_REPORT_PATH)
 
-                    # STOP order flow
-                    return
-            # Addresses cases in which order flow HAS been initiated but not
-            # completed
-            else:
-                print("Order flow previously initiated....")
-                print("Completing order flow.....")
-                ordersToBeCompleted = loadProgressCache()
 
-                # Retrieve single orders from cache and send to RobinHood # API
-                for i in range(len(ordersToBeCompleted)):
+def main():
+    # Log into the broker to ensure access to account-specific functionality
+    getBroker().login()
 
-                    # Retrieve order and update cache
-                    print("Retrieving order from progress cache...")
-                    order = retrieveSingleWeeklyOrderFromCache()
+    # Send every recurring order that is due
+    sendRecurringOrders()
 
-                    # Send order to RobinHood API
-                    # sendSimulatedMarketOrder(
-                    #     symbol=order["symbol"], amount=order["amount"])
-                    RobinhoodAPIWrapper.buyFractionalSharesByPrice(
-                        symbol=order["symbol"], amountInDollars=order["amount"])
+    # Logout of the broker for security
+    getBroker().logout()
 
-                    # Pause to ensure that the API is not flooded
-                    sleep(FRACTIONAL_ORDER_FLOW_DELAY)
 
-            print("Weekly orders completed!")
-            # By this point the cache tracking the order completiong process
-            # should be EMPTY (no more orders to send)
+def handleStopSignal(signum, frame):
+    # The first signal lets the current run finish (its progress is journaled
+    # either way), a second one interrupts it
+    if STOP_EVENT.is_set():
+        raise KeyboardInterrupt
+    print(f"\nReceived {signal.Signals(signum).name}, stopping after the current run....")
+    STOP_EVENT.set()
 
-            # Main cache should still contain all the info regarding the orders
-            # sent
-            ordersCompleted = loadMainCache()
 
-            # Update investment-history to indicate weekly order(s) completion
-            addToInvestmentHistory(
-                toBeAdded={"recurringType": "Weekly", "date": currDate, "orders": ordersCompleted})
+def sleepUntil(wakeTime):
+    # Returns False if stopped before wakeTime
+    while not STOP_EVENT.is_set():
+        remainingSeconds = (wakeTime - datetime.now()).total_seconds()
+        if remainingSeconds <= 0:
+            return True
+        STOP_EVENT.wait(min(remainingSeconds, DAEMON_MAX_SLEEP_SECONDS))
+    return False
 
-            print("Investment history updated!")
 
-            # Clear caches
-            clearAllCaches()
+def getNextScheduledRun(now):
+    cadences = {scheduleEngine.normalizeCadence(cadence)
+                for cadence in SheetsAPIWrapper.getRecurringInvestmentCadences().values()}
+    nextRunDates = scheduleEngine.getNextRunDates(
+        cadences or {scheduleEngine.DEFAULT_CADENCE}, now.date())
+    return datetime.combine(min(nextRunDates.values()), DAEMON_RUN_TIME)
 
-        # Addresses cases in which all weekly orders have been sent
-        else:
-            print("All weekly orders have been sent!")
-            sleep(2)
 
-    # If day is NOT sunday, STOP ORDER FLOW
-    else:
-        print("Day is not viable for delivery of weekly order requests!")
-        sleep(2)
+def prewarmScheduledRun():
+    # Returns False if stopped before a connection was established
+    if not awaitInternetConnection():
+        return False
 
+    # Reuses the stored broker session, logging in again if it expired
+    getBroker().login()
 
-def sendSimulatedMarketOrder(symbol, amount):
-    print(
-        f"\nPlacing a simulated market order for ${amount} worth of {symbol}")
-    sleep(0.5)
-    print("ORDER FILLED!")
+    # Revalidate the spreadsheet snapshot held since the previous run
+    SheetsAPIWrapper.SNAPSHOT = None
+    SheetsAPIWrapper.getSnapshot()
+    return True
 
 
-def main():
-    # Log into Robinhood account to ensure access to account-specific
-    # functionality
-    RobinhoodAPIWrapper.login()
+def runScheduledOrders():
+    # Sends the due orders and returns when the daemon should run next
+    try:
+        sendRecurringOrders()
+    except Exception:
+        traceback.print_exc()
+        print("Order flow failed, retrying later....")
+        return datetime.now() + timedelta(seconds=DAEMON_RETRY_SECONDS)
+    finally:
+        # Every run (in daemon mode) reports only its own series
+        writeMetrics()
+        metrics.reset()
+
+    if not validateEmptyInvestmentHistoryCache():
+        return datetime.now() + timedelta(seconds=DAEMON_RETRY_SECONDS)
+
+    return getNextScheduledRun(datetime.now())
+
+
+def runDaemon():
+    # Sends due orders immediately, then sleeps until each scheduled run. The
+    # broker session, spreadsheet snapshot and wrapper caches are kept in
+    # memory between runs.
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, handleStopSignal)
+
+    nextRun = datetime.now()
+    try:
+        while not STOP_EVENT.is_set():
+            print(f"Next run scheduled for {nextRun.isoformat(sep=' ', timespec='seconds')}")
+            if not sleepUntil(nextRun - timedelta(seconds=DAEMON_PREWARM_SECONDS)):
+                break
 
-    # # Send Weekly Orders
-    sendWeeklyOrders()
+            try:
+                if not prewarmScheduledRun():
+                    break
+            except Exception:
+                traceback.print_exc()
+                print("Warm-up failed, retrying later....")
+                nextRun = datetime.now() + timedelta(seconds=DAEMON_RETRY_SECONDS)
+                continue
 
-    # Logout of Robinhood account for security
-    RobinhoodAPIWrapper.logout()
+            if not sleepUntil(nextRun):
+                break
+
+            nextRun = runScheduledOrders()
+    finally:
+        print("Stopping daemon....")
+        getBroker().logout()
 
 
 def testDependencies():
 
     print("\nTesting SheetsAPIWrapper:\n")
     SheetsAPIWrapper.testSanity()
+    profiler.takeSnapshot("SheetsAPIWrapper")
 
     print("\nTesting RobinhoodAPIWrapper:\n")
     RobinhoodAPIWrapper.testSanity()
+    profiler.takeSnapshot("RobinhoodAPIWrapper")
 
     print("\nTesting PlaidAPIWrapper:\n")
     PlaidAPIWrapper.testSanity()
+    profiler.takeSnapshot("PlaidAPIWrapper")
+
+
+# Entry points that can be run under --profile
+PROFILE_TARGETS = {"main": main, "testDependencies": testDependencies}
 
 
 # Main function
 if __name__ == "__main__":
-    awaitInternetConnection()
-    importCustomWrappers()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--refresh-sheets", action="store_true",
+                        help="ignore the cached spreadsheet snapshot and refetch it")
+    parser.add_argument("--broker", choices=broker.BROKER_NAMES, required=True,
+                        help="send orders to Robinhood or to an in-memory simulator "
+                        f"(simulated runs keep their own history in {SIMULATED_STATE_DIRECTORY})")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and send orders whenever they are due")
+    parser.add_argument("--cassette",
+                        help="record HTTP traffic to (or replay it from) this file "
+                        "(combine with --refresh-sheets to capture the spreadsheet)")
+    parser.add_argument("--cassette-mode", choices=cassette.CASSETTE_MODES,
+                        default=cassette.REPLAY_MODE)
+    parser.add_argument("--latency-profile", default=cassette.DEFAULT_LATENCY_PROFILE,
+                        help="replayed latency: none, recorded, fixed:<seconds> or scaled:<factor>")
+    parser.add_argument("--resolve-order", type=parseOrderResolution, action="append",
+                        default=[], metavar="SYMBOL=placed|failed|skipped",
+                        help="record whether an order left unacknowledged by an interrupted "
+                        "run was placed (checked with the broker) or has to be resent, or "
+                        "whether a rejected order is resent or skipped")
+    parser.add_argument("--metrics-textfile",
+                        help="write Prometheus metrics to this file (for the node_exporter textfile collector)")
+    parser.add_argument("--metrics-report",
+                        help="write a JSON report of the run's metrics to this file")
+    parser.add_argument("--profile", choices=profiler.PROFILER_MODES,
+                        help="run under cProfile (deterministic) or a wall-clock stack sampler, "
+                        "writing pstats, collapsed stacks and tracemalloc snapshots")
+    parser.add_argument("--profile-target", choices=list(PROFILE_TARGETS), default="main",
+                        help="entry point to profile")
+    parser.add_argument("--profile-output", default=profiler.DEFAULT_PROFILE_DIRECTORY,
+                        help="directory the profile is written to")
+    parser.add_argument("--profile-interval", type=float,
+                        default=profiler.DEFAULT_SAMPLING_INTERVAL_SECONDS,
+                        help="seconds between stack samples")
+    args = parser.parse_args()
+
+    if args.profile and args.daemon:
+        parser.error("--profile cannot be combined with --daemon")
+
+    SheetsAPIWrapper.REFRESH_SNAPSHOT = args.refresh_sheets
+    BROKER = broker.getBroker(args.broker)
+    if args.broker == broker.SIMULATED_BROKER:
+        useStateDirectory(SIMULATED_STATE_DIRECTORY)
+
+    # Resolutions are journaled before anything is resumed
     try:
-        # testDependencies()
-        print("Tests passed!")
-    
-        # If testDependencies fails, main will NOT be executed
-        main()
-    except:
-        pass
-    
+        resolveOrders(args.resolve_order)
+    except ValueError as e:
+        parser.error(str(e))
+    METRICS_TEXTFILE_PATH = args.metrics_textfile
+    METRICS_REPORT_PATH = args.metrics_report
+
+    if args.cassette:
+        cassette.install(args.cassette, args.cassette_mode,
+                         latencyProfile=args.latency_profile)
+
+    # Installed after the cassette so that replayed traffic is counted too
+    if METRICS_TEXTFILE_PATH or METRICS_REPORT_PATH:
+        enableMetrics()
+
+    try:
+        if args.daemon:
+            runDaemon()
+        else:
+            awaitInternetConnection()
+            try:
+                # testDependencies()
+                print("Tests passed!")
+
+                # If testDependencies fails, main will NOT be executed
+                if args.profile:
+                    profiler.runProfiled(PROFILE_TARGETS[args.profile_target], args.profile,
+                                         outputDirectory=args.profile_output,
+                                         samplingIntervalSeconds=args.profile_interval)
+                else:
+                    main()
+            except:
+                pass
+            writeMetrics()
+    finally:
+        # Saves the cassette when recording
+        metrics.disable()
+        cassette.uninstall()
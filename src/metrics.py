@@ -0,0 +1,315 @@
+from urllib.parse import urlsplit
+import functools
+import json
+import os
+import threading
+import time
+import types
+
+"""
+Latency histograms and counters for wrapper calls and order flow stages,
+exported as a Prometheus textfile and a JSON run report
+"""
+
+# Nothing is recorded (and no function is wrapped) unless metrics are enabled
+ENABLED = False
+
+METRIC_PREFIX = "recurring_investment_"
+
+WRAPPER_CALL_SECONDS = METRIC_PREFIX + "wrapper_call_seconds"
+WRAPPER_CALL_ERRORS = METRIC_PREFIX + "wrapper_call_errors_total"
+STAGE_SECONDS = METRIC_PREFIX + "stage_seconds"
+STAGE_ERRORS = METRIC_PREFIX + "stage_errors_total"
+ORDER_SECONDS = METRIC_PREFIX + "order_seconds"
+ORDER_ERRORS = METRIC_PREFIX + "order_errors_total"
+BROKER_RETRIES = METRIC_PREFIX + "broker_throttled_retries_total"
+ORDER_RETRIES = METRIC_PREFIX + "order_retries_total"
+HTTP_REQUESTS = METRIC_PREFIX + "http_requests_total"
+HTTP_REQUEST_BYTES = METRIC_PREFIX + "http_request_bytes_total"
+HTTP_RESPONSE_BYTES = METRIC_PREFIX + "http_response_bytes_total"
+QUOTE_CACHE_LOOKUPS = METRIC_PREFIX + "quote_cache_lookups_total"
+
+METRIC_HELP = {WRAPPER_CALL_SECONDS: "Latency of wrapper function calls",
+               WRAPPER_CALL_ERRORS: "Wrapper function calls that raised",
+               STAGE_SECONDS: "Latency of order flow stages",
+               STAGE_ERRORS: "Order flow stages that raised",
+               ORDER_SECONDS: "Latency of single order submissions",
+               ORDER_ERRORS: "Order submissions that raised",
+               BROKER_RETRIES: "Broker requests retried after being throttled",
+               ORDER_RETRIES: "Orders resent when resuming an interrupted order flow",
+               HTTP_REQUESTS: "HTTP requests sent",
+               HTTP_REQUEST_BYTES: "HTTP request body bytes sent",
+               HTTP_RESPONSE_BYTES: "HTTP response body bytes received",
+               QUOTE_CACHE_LOOKUPS: "Quote cache lookups by result (hit, miss or coalesced)"}
+
+# Errors are counted under the counter paired with each histogram
+ERROR_COUNTERS = {WRAPPER_CALL_SECONDS: WRAPPER_CALL_ERRORS,
+                  STAGE_SECONDS: STAGE_ERRORS,
+                  ORDER_SECONDS: ORDER_ERRORS}
+
+LATENCY_BUCKETS_SECONDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                           0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# (name, labels) -> histogram / counter value, where labels is a sorted tuple
+# of (label, value) pairs
+HISTOGRAMS = {}
+COUNTERS = {}
+METRICS_LOCK = threading.Lock()
+
+STARTED_AT = time.time()
+
+# Functions restoring instrumented modules and patched transports
+UNPATCH_FUNCTIONS = []
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    # Stops recording and restores everything that was instrumented
+    global ENABLED
+    ENABLED = False
+    while UNPATCH_FUNCTIONS:
+        UNPATCH_FUNCTIONS.pop()()
+
+
+def reset():
+    global STARTED_AT
+    with METRICS_LOCK:
+        HISTOGRAMS.clear()
+        COUNTERS.clear()
+    STARTED_AT = time.time()
+
+
+def toLabels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = (name, toLabels(labels))
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * len(LATENCY_BUCKETS_SECONDS),
+                         "count": 0, "sum": 0.0, "max": 0.0}
+            HISTOGRAMS[key] = histogram
+        for i, bound in enumerate(LATENCY_BUCKETS_SECONDS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["max"] = max(histogram["max"], seconds)
+
+
+def incrementCounter(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, toLabels(labels))
+    with METRICS_LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+
+class Timer:
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        observe(self.name, time.perf_counter() - self.startTime, **self.labels)
+        if excType is not None and self.name in ERROR_COUNTERS:
+            incrementCounter(ERROR_COUNTERS[self.name], **self.labels)
+        return False
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def timed(name, **labels):
+    # Context manager recording the latency of its block (a shared no-op
+    # while metrics are disabled)
+    if not ENABLED:
+        return NULL_TIMER
+    return Timer(name, labels)
+
+
+def instrumentFunction(function, wrapperName):
+    labels = {"wrapper": wrapperName, "function": function.__name__}
+
+    @functools.wraps(function)
+    def instrumentedFunction(*args, **kwargs):
+        with Timer(WRAPPER_CALL_SECONDS, labels):
+            return function(*args, **kwargs)
+
+    return instrumentedFunction
+
+
+def instrumentModule(module, exclude=("testSanity",)):
+    # Wraps every function defined in module (including calls the module
+    # makes to its own functions) until disable() is called
+    wrapperName = module.__name__.rsplit(".", 1)[-1]
+    originalFunctions = {name: value for name, value in vars(module).items()
+                         if isinstance(value, types.FunctionType)
+                         and value.__module__ == module.__name__
+                         and name not in exclude}
+
+    for name, function in originalFunctions.items():
+        setattr(module, name, instrumentFunction(function, wrapperName))
+
+    def restore():
+        for name, function in originalFunctions.items():
+            setattr(module, name, function)
+
+    UNPATCH_FUNCTIONS.append(restore)
+
+
+def getBodySize(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # Streamed bodies (files, generators) are not measured
+    return 0
+
+
+def recordHTTPTransfer(url, requestBody, responseContent):
+    host = urlsplit(url).hostname or ""
+    incrementCounter(HTTP_REQUESTS, host=host)
+    incrementCounter(HTTP_REQUEST_BYTES, getBodySize(requestBody), host=host)
+    incrementCounter(HTTP_RESPONSE_BYTES, getBodySize(responseContent), host=host)
+
+
+def installHTTPHooks():
+    # Counts requests and bytes sent through requests (Plaid, robin_stocks,
+    # RobinhoodAPIWrapper) and httplib2 (the Google API client)
+    import requests
+
+    originalSend = requests.Session.send
+
+    def send(session, request, **kwargs):
+        response = originalSend(session, request, **kwargs)
+        recordHTTPTransfer(request.url, request.body, response.content)
+        return response
+
+    requests.Session.send = send
+    UNPATCH_FUNCTIONS.append(lambda: setattr(requests.Session, "send", originalSend))
+
+    # The Google API client is optional (only needed by SheetsAPIWrapper)
+    try:
+        import httplib2
+    except ImportError:
+        return
+
+    originalRequest = httplib2.Http.request
+
+    def request(http, uri, method="GET", body=None, *args, **kwargs):
+        response, content = originalRequest(http, uri, method, body, *args, **kwargs)
+        recordHTTPTransfer(uri, body, content)
+        return response, content
+
+    httplib2.Http.request = request
+    UNPATCH_FUNCTIONS.append(lambda: setattr(httplib2.Http, "request", originalRequest))
+
+
+def escapeLabelValue(value):
+    # Backslashes, double quotes and newlines must be escaped in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatLabels(labels, extraLabels=()):
+    pairs = list(labels) + list(extraLabels)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{label}="{escapeLabelValue(value)}"'
+                          for label, value in pairs) + "}"
+
+
+def formatPrometheus():
+    # Prometheus text exposition format
+    with METRICS_LOCK:
+        histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                            for key, value in HISTOGRAMS.items())
+        counters = sorted(COUNTERS.items())
+
+    lines = []
+    typedNames = set()
+
+    def addHeader(name, metricType):
+        if name not in typedNames:
+            typedNames.add(name)
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {metricType}")
+
+    for (name, labels), histogram in histograms:
+        addHeader(name, "histogram")
+        cumulativeCount = 0
+        for bound, count in zip(LATENCY_BUCKETS_SECONDS, histogram["buckets"]):
+            cumulativeCount += count
+            lines.append(f"{name}_bucket{formatLabels(labels, [('le', bound)])} {cumulativeCount}")
+        lines.append(f"{name}_bucket{formatLabels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{formatLabels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{formatLabels(labels)} {histogram['count']}")
+
+    for (name, labels), value in counters:
+        addHeader(name, "counter")
+        lines.append(f"{name}{formatLabels(labels)} {value}")
+
+    lastRunName = METRIC_PREFIX + "last_run_timestamp_seconds"
+    lines.append(f"# HELP {lastRunName} Time the metrics were written")
+    lines.append(f"# TYPE {lastRunName} gauge")
+    lines.append(f"{lastRunName} {time.time()}")
+
+    return "\n".join(lines) + "\n"
+
+
+def buildRunReport():
+    with METRICS_LOCK:
+        histograms = [{"name": name, "labels": dict(labels),
+                       "count": histogram["count"], "sumSeconds": histogram["sum"],
+                       "meanSeconds": histogram["sum"] / histogram["count"],
+                       "maxSeconds": histogram["max"],
+                       "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS_SECONDS, histogram["buckets"])
+                                   if count > 0}}
+                      for (name, labels), histogram in sorted(HISTOGRAMS.items())]
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(COUNTERS.items())]
+
+    return {"startedAt": STARTED_AT, "finishedAt": time.time(),
+            "histograms": histograms, "counters": counters}
+
+
+def writeAtomically(path, text):
+    # Textfile collectors may read at any moment, so the file is replaced in
+    # a single rename
+    tempFilePath = f"{path}.tmp"
+    with open(tempFilePath, "w") as file:
+        file.write(text)
+    os.replace(tempFilePath, path)
+
+
+def writePrometheusTextfile(path):
+    writeAtomically(path, formatPrometheus())
+
+
+def writeRunReport(path):
+    writeAtomically(path, json.dumps(buildRunReport(), indent=2))
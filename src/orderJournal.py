@@ -0,0 +1,243 @@
+import json
+import os
+
+import broker
+
+"""
+Append-only journal tracking the progress of an order flow
+"""
+
+# One JSON event per line:
+#   {"event": "queued", "symbol": ..., "amount": ...}
+#   {"event": "submitted", "symbol": ...}
+#   {"event": "acknowledged", "symbol": ...}
+#   {"event": "failed", "symbol": ...}
+#   {"event": "rejected", "symbol": ...}
+#   {"event": "skipped", "symbol": ...}
+JOURNAL_FILE_PATH = "./investments/order-journal.jsonl"
+
+# Progress cache ({symbol: amount} of the orders left to send) used before the
+# journal; an order flow interrupted before upgrading is imported from it once
+LEGACY_PROGRESS_CACHE_FILE_PATH = "./investments/investment-history-cache-progress.json"
+
+QUEUED_EVENT = "queued"
+SUBMITTED_EVENT = "submitted"
+ACKNOWLEDGED_EVENT = "acknowledged"
+FAILED_EVENT = "failed"
+REJECTED_EVENT = "rejected"
+SKIPPED_EVENT = "skipped"
+
+# Orders the broker refused this many times since they were queued are not
+# resent any more (e.g. unknown or non-fractionable symbols); they stay in the
+# journal, blocking the order flow, until an operator resolves them
+MAX_ORDER_REJECTIONS = 3
+
+# Orders that were submitted but never acknowledged (e.g. the process crashed
+# while waiting for the broker) may or may not have been placed. When False
+# they are never resent automatically, so a resumed order flow never buys
+# twice; they stay in the journal until resolved with
+# resolveUnacknowledgedOrder.
+RESEND_UNACKNOWLEDGED_ORDERS = False
+
+
+def appendEvents(events):
+    # Events are written with a single append and flushed to disk before
+    # returning, so that every recorded event survives a crash
+    lines = "".join(json.dumps(event) + "\n" for event in events)
+    with open(JOURNAL_FILE_PATH, "a") as file:
+        file.write(lines)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def readEvents():
+    if not os.path.exists(JOURNAL_FILE_PATH):
+        return []
+
+    events = []
+    with open(JOURNAL_FILE_PATH) as file:
+        for line in file:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # Only the last line can be partial (interrupted append), and
+                # an event that was not fully written was never recorded
+                break
+    return events
+
+
+def replayJournal():
+    # Returns the queued orders (symbol -> amount), the state of each symbol
+    # ("queued", "submitted", "acknowledged", "rejected", "skipped") and the
+    # number of times each was rejected since it was queued
+    orders = {}
+    states = {}
+    rejections = {}
+    for event in readEvents():
+        symbol = event["symbol"]
+        if event["event"] == QUEUED_EVENT:
+            orders[symbol] = event["amount"]
+            states[symbol] = QUEUED_EVENT
+            rejections[symbol] = 0
+        elif event["event"] == FAILED_EVENT:
+            # Failed submissions are retried
+            states[symbol] = QUEUED_EVENT
+        elif event["event"] == REJECTED_EVENT:
+            # Rejected submissions are retried up to MAX_ORDER_REJECTIONS times
+            rejections[symbol] = rejections.get(symbol, 0) + 1
+            states[symbol] = (REJECTED_EVENT if rejections[symbol] >= MAX_ORDER_REJECTIONS
+                              else QUEUED_EVENT)
+        else:
+            states[symbol] = event["event"]
+
+    return orders, states, rejections
+
+
+def queueOrders(orders):
+    appendEvents([{"event": QUEUED_EVENT, "symbol": symbol, "amount": amount}
+                  for symbol, amount in orders.items()])
+
+
+def recordSubmitted(symbol):
+    appendEvents([{"event": SUBMITTED_EVENT, "symbol": symbol}])
+
+
+def recordAcknowledged(symbol):
+    appendEvents([{"event": ACKNOWLEDGED_EVENT, "symbol": symbol}])
+
+
+def recordFailed(symbol):
+    appendEvents([{"event": FAILED_EVENT, "symbol": symbol}])
+
+
+def recordRejected(symbol):
+    appendEvents([{"event": REJECTED_EVENT, "symbol": symbol}])
+
+
+def recordOrderSubmitted(order):
+    # onSubmit callback of orderPipeline.submitOrders
+    recordSubmitted(order["symbol"])
+
+
+def recordOrderResult(result):
+    # onResult callback of orderPipeline.submitOrders. Orders the broker
+    # refused or throttled are journaled so that they are resent when the
+    # order flow is resumed (refused ones at most MAX_ORDER_REJECTIONS times).
+    # Any other error (no response, unexpected exception) leaves the order
+    # unacknowledged, since it may have been placed, until it is resolved
+    # with resolveUnacknowledgedOrder (--resolve-order of main.py).
+    if result["error"] is None:
+        recordAcknowledged(result["symbol"])
+    elif isinstance(result["error"], broker.BrokerRejectedError):
+        recordRejected(result["symbol"])
+    elif broker.isOrderNotPlaced(result["error"]):
+        recordFailed(result["symbol"])
+    else:
+        print(f"WARNING: outcome of the order for {result['symbol']} is unknown "
+              f"({result['error']!r})")
+
+
+def resolveUnacknowledgedOrder(symbol, placed):
+    # Records the outcome of an unacknowledged order once it has been checked
+    # with the broker: placed orders are acknowledged, others are resent
+    if symbol not in getUnacknowledgedOrders():
+        raise ValueError(f"No unacknowledged order for {symbol}")
+
+    if placed:
+        recordAcknowledged(symbol)
+    else:
+        recordFailed(symbol)
+
+
+def resolveRejectedOrder(symbol, resend):
+    # Rejected orders are either queued again (with a fresh rejection count)
+    # or skipped, in which case they are left out of the investment history
+    rejectedOrders = getRejectedOrders()
+    if symbol not in rejectedOrders:
+        raise ValueError(f"No rejected order for {symbol}")
+
+    if resend:
+        queueOrders({symbol: rejectedOrders[symbol]})
+    else:
+        appendEvents([{"event": SKIPPED_EVENT, "symbol": symbol}])
+
+
+def getOrdersInState(state):
+    orders, states, _ = replayJournal()
+    return {symbol: amount for symbol, amount in orders.items()
+            if states[symbol] == state}
+
+
+def getUnacknowledgedOrders():
+    return getOrdersInState(SUBMITTED_EVENT)
+
+
+def getRejectedOrders():
+    return getOrdersInState(REJECTED_EVENT)
+
+
+def getSkippedOrders():
+    return getOrdersInState(SKIPPED_EVENT)
+
+
+def getPendingOrders():
+    # Returns the orders (symbol -> amount) that still have to be sent
+    orders, states, _ = replayJournal()
+
+    pendingStates = [QUEUED_EVENT]
+    if RESEND_UNACKNOWLEDGED_ORDERS:
+        pendingStates.append(SUBMITTED_EVENT)
+
+    return {symbol: amount for symbol, amount in orders.items()
+            if states[symbol] in pendingStates}
+
+
+def compactJournal():
+    # Rewrites the journal so that it only contains the orders left to send,
+    # the unacknowledged, rejected and skipped ones (acknowledged orders are
+    # dropped). Rejection counts are kept.
+    orders, states, rejections = replayJournal()
+
+    tempFilePath = f"{JOURNAL_FILE_PATH}.tmp"
+    with open(tempFilePath, "w") as file:
+        for symbol, amount in orders.items():
+            if states[symbol] == ACKNOWLEDGED_EVENT:
+                continue
+            file.write(json.dumps({"event": QUEUED_EVENT, "symbol": symbol,
+                                   "amount": amount}) + "\n")
+            for _ in range(rejections.get(symbol, 0)):
+                file.write(json.dumps({"event": REJECTED_EVENT, "symbol": symbol}) + "\n")
+            if states[symbol] in (SUBMITTED_EVENT, SKIPPED_EVENT):
+                file.write(json.dumps({"event": states[symbol], "symbol": symbol}) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tempFilePath, JOURNAL_FILE_PATH)
+
+
+def importLegacyProgressCache():
+    # Queues the orders left in the legacy progress cache (only into an empty
+    # journal) and renames it so that it is imported once. Returns the
+    # imported orders.
+    if not os.path.exists(LEGACY_PROGRESS_CACHE_FILE_PATH):
+        return {}
+
+    try:
+        with open(LEGACY_PROGRESS_CACHE_FILE_PATH) as file:
+            legacyOrders = json.load(file)
+    except ValueError:
+        legacyOrders = {}
+
+    importedOrders = {}
+    if legacyOrders and not readEvents():
+        queueOrders(legacyOrders)
+        importedOrders = legacyOrders
+
+    os.replace(LEGACY_PROGRESS_CACHE_FILE_PATH,
+               f"{LEGACY_PROGRESS_CACHE_FILE_PATH}.imported")
+    return importedOrders
+
+
+def clearJournal():
+    with open(JOURNAL_FILE_PATH, "w") as file:
+        file.flush()
+        os.fsync(file.fileno())
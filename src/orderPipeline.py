@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from broker import BrokerThrottledError
+
+"""
+Asyncio pipeline that keeps a bounded number of orders in flight
+"""
+
+# Default number of orders submitted concurrently
+MAX_ORDERS_IN_FLIGHT = 4
+
+# Throttled orders are retried up to this many times. Without a rate limiter
+# to back off through, retries wait THROTTLED_RETRY_DELAY_SECONDS, doubled
+# after every attempt.
+MAX_THROTTLED_RETRIES = 3
+THROTTLED_RETRY_DELAY_SECONDS = 1.0
+
+
+async def submitOrderAsync(order, submitOrder, onSubmit, onResult, semaphore,
+                           executor, rateLimiter, throttledRetryDelaySeconds):
+    async with semaphore:
+        if rateLimiter is not None:
+            await rateLimiter.acquireAsync()
+
+        if onSubmit is not None:
+            onSubmit(order)
+
+        result = {"symbol": order["symbol"], "amount": order["amount"],
+                  "response": None, "error": None}
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_THROTTLED_RETRIES + 1):
+            try:
+                # Broker clients are blocking, so submissions run on worker
+                # threads
+                result["response"] = await loop.run_in_executor(
+                    executor, submitOrder, order["symbol"], order["amount"])
+                result["error"] = None
+                if rateLimiter is not None:
+                    rateLimiter.reportSuccess()
+                break
+            except BrokerThrottledError as e:
+                # A throttled order was not placed, so it is safe to resend
+                result["error"] = e
+                if attempt == MAX_THROTTLED_RETRIES:
+                    break
+                print(f"Order for {order['symbol']} throttled, retrying....")
+                if rateLimiter is not None:
+                    rateLimiter.reportThrottled()
+                    await rateLimiter.acquireAsync()
+                else:
+                    await asyncio.sleep(throttledRetryDelaySeconds * 2 ** attempt)
+            except Exception as e:
+                result["error"] = e
+                break
+
+        if result["error"] is not None:
+            print(f"FAILED TO SUBMIT ORDER FOR ${order['amount']} of {order['symbol']}: {result['error']}")
+
+    # Submissions and results are recorded on the event loop thread as soon as
+    # they happen, so the callbacks never run concurrently with themselves
+    if onResult is not None:
+        onResult(result)
+
+    return result
+
+
+async def submitOrdersAsync(orders, submitOrder, onSubmit=None, onResult=None,
+                            maxInFlight=MAX_ORDERS_IN_FLIGHT, rateLimiter=None,
+                            throttledRetryDelaySeconds=THROTTLED_RETRY_DELAY_SECONDS):
+    semaphore = asyncio.Semaphore(maxInFlight)
+    with ThreadPoolExecutor(max_workers=maxInFlight) as executor:
+        tasks = [submitOrderAsync(order, submitOrder, onSubmit, onResult,
+                                  semaphore, executor, rateLimiter,
+                                  throttledRetryDelaySeconds)
+                 for order in orders]
+        return await asyncio.gather(*tasks)
+
+
+def submitOrders(orders, submitOrder, onSubmit=None, onResult=None,
+                 maxInFlight=MAX_ORDERS_IN_FLIGHT, rateLimiter=None,
+                 throttledRetryDelaySeconds=THROTTLED_RETRY_DELAY_SECONDS):
+    # Submits every order ({"symbol", "amount"}) through
+    # submitOrder(symbol, amount) with at most maxInFlight orders pending at
+    # once, and returns one result per order (in order). Orders rejected with
+    # BrokerThrottledError are retried (backing off through rateLimiter when
+    # given), other errors are returned in their result.
+    return asyncio.run(submitOrdersAsync(orders, submitOrder, onSubmit=onSubmit,
+                                         onResult=onResult,
+                                         maxInFlight=maxInFlight,
+                                         rateLimiter=rateLimiter,
+                                         throttledRetryDelaySeconds=throttledRetryDelaySeconds))
@@ -0,0 +1,241 @@
+from datetime import date
+import argparse
+import csv
+import json
+
+import numpy as np
+
+import historyStore
+
+"""
+Vectorized dollar-cost-averaging performance of the investment history
+"""
+
+# Price CSV files have one row per symbol per day: date (YYYY-MM-DD), symbol,
+# price (extra columns are ignored)
+PRICE_CSV_DATE_FIELD = "date"
+PRICE_CSV_SYMBOL_FIELD = "symbol"
+PRICE_CSV_PRICE_FIELD = "price"
+
+# Newton iterations used to solve every symbol's money-weighted return at once
+MWR_MAX_ITERATIONS = 100
+MWR_TOLERANCE = 1e-10
+
+DAYS_PER_YEAR = 365.0
+
+# Combined (symbol, day) keys are symbolCode * KEY_DAY_SPAN + day
+KEY_DAY_SPAN = 1 << 20
+
+
+def loadOrderArrays(startDate=None, endDate=None):
+    # Returns (symbols, dates, amounts) arrays for every order in the history
+    symbols = []
+    dates = []
+    amounts = []
+    for _, isoDate, _, symbol, amount in historyStore.iterateOrders(
+            startDate=startDate, endDate=endDate):
+        symbols.append(symbol)
+        dates.append(isoDate)
+        amounts.append(amount)
+
+    return (np.array(symbols, dtype=object),
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(amounts, dtype=np.float64))
+
+
+def loadPriceCSV(path):
+    # Returns (symbols, dates, prices) arrays from a long-format price CSV
+    symbols = []
+    dates = []
+    prices = []
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            symbols.append(row[PRICE_CSV_SYMBOL_FIELD])
+            dates.append(row[PRICE_CSV_DATE_FIELD])
+            prices.append(row[PRICE_CSV_PRICE_FIELD])
+
+    return (np.array(symbols, dtype=object),
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(prices, dtype=np.float64))
+
+
+def lookupPrices(symbolCodes, days, priceSymbolCodes, priceDays, prices):
+    # Returns the most recent price on or before each (symbol, day), or NaN
+    # when the symbol has no earlier price
+    result = np.full(len(symbolCodes), np.nan)
+    if len(prices) == 0:
+        return result
+
+    priceKeys = priceSymbolCodes.astype(np.int64) * KEY_DAY_SPAN + priceDays
+    order = np.argsort(priceKeys, kind="stable")
+    priceKeys = priceKeys[order]
+    sortedPrices = prices[order]
+    sortedSymbolCodes = priceSymbolCodes[order]
+
+    keys = symbolCodes.astype(np.int64) * KEY_DAY_SPAN + days
+    positions = np.searchsorted(priceKeys, keys, side="right") - 1
+
+    # A match must belong to the same symbol (not the previous symbol's prices)
+    clippedPositions = np.clip(positions, 0, None)
+    found = (positions >= 0) & (sortedSymbolCodes[clippedPositions] == symbolCodes)
+
+    result[found] = sortedPrices[clippedPositions[found]]
+    return result
+
+
+def solveMoneyWeightedReturns(symbolCodes, amounts, yearsHeld, currentValues):
+    # Solves, for every symbol at once, the annual rate r where the current
+    # value equals the orders compounded at r:
+    #   currentValue = sum(amount * (1 + r) ** yearsHeld)
+    symbolCount = len(currentValues)
+    rates = np.full(symbolCount, 0.1)
+    solvable = np.isfinite(currentValues) & (currentValues > 0)
+
+    # With no time elapsed (every order on the valuation date) the value does
+    # not depend on r (the derivative is zero), so the return is undefined
+    solvable &= np.bincount(symbolCodes, weights=amounts * yearsHeld,
+                            minlength=symbolCount) > 0
+
+    for _ in range(MWR_MAX_ITERATIONS):
+        growth = (1.0 + rates[symbolCodes]) ** yearsHeld
+        futureValues = np.bincount(symbolCodes, weights=amounts * growth,
+                                   minlength=symbolCount)
+        derivatives = np.bincount(symbolCodes,
+                                  weights=amounts * yearsHeld * growth / (1.0 + rates[symbolCodes]),
+                                  minlength=symbolCount)
+
+        residuals = futureValues - currentValues
+        with np.errstate(divide="ignore", invalid="ignore"):
+            steps = np.where(derivatives > 0, residuals / derivatives, 0.0)
+        steps[~solvable] = 0.0
+
+        # Rates below -100% are meaningless
+        rates = np.maximum(rates - steps, -0.9999)
+
+        if np.all(np.abs(steps) < MWR_TOLERANCE):
+            break
+
+    rates[~solvable] = np.nan
+    return rates
+
+
+def computePerformance(orderSymbols, orderDates, orderAmounts,
+                       priceSymbols, priceDates, prices,
+                       currentPrices=None, valuationDate=None):
+    # Computes cost basis, shares, average cost, value, unrealized P&L and
+    # money-weighted return for every symbol. Orders are filled at the most
+    # recent price on or before their date, and valued at currentPrices (or
+    # the latest price in the price data).
+    symbols, codes = np.unique(np.concatenate([orderSymbols, priceSymbols]).astype(str),
+                               return_inverse=True)
+    orderCodes = codes[:len(orderSymbols)]
+    priceCodes = codes[len(orderSymbols):]
+    symbolCount = len(symbols)
+
+    orderDays = orderDates.astype(np.int64)
+    priceDays = priceDates.astype(np.int64)
+
+    fillPrices = lookupPrices(orderCodes, orderDays, priceCodes, priceDays, prices)
+    filled = np.isfinite(fillPrices) & (fillPrices > 0)
+
+    shares = np.zeros(len(orderAmounts))
+    shares[filled] = orderAmounts[filled] / fillPrices[filled]
+
+    costBasis = np.bincount(orderCodes[filled], weights=orderAmounts[filled],
+                            minlength=symbolCount)
+    sharesHeld = np.bincount(orderCodes[filled], weights=shares[filled],
+                             minlength=symbolCount)
+    unfilledOrders = np.bincount(orderCodes[~filled], minlength=symbolCount)
+
+    # Current price per symbol: explicit prices first, then the latest price
+    if valuationDate is None:
+        lastDays = [orderDays.max()] if len(orderDays) else []
+        lastDays += [priceDays.max()] if len(priceDays) else []
+        valuationDay = max(lastDays) if lastDays else 0
+    else:
+        valuationDay = np.datetime64(valuationDate, "D").astype(np.int64)
+
+    latestPrices = lookupPrices(np.arange(symbolCount),
+                                np.full(symbolCount, valuationDay, dtype=np.int64),
+                                priceCodes, priceDays, prices)
+    if currentPrices:
+        overrides = np.array([currentPrices.get(symbol, np.nan) for symbol in symbols],
+                             dtype=np.float64)
+        latestPrices = np.where(np.isfinite(overrides), overrides, latestPrices)
+
+    currentValues = sharesHeld * latestPrices
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averageCosts = costBasis / sharesHeld
+
+    yearsHeld = (valuationDay - orderDays[filled]) / DAYS_PER_YEAR
+    moneyWeightedReturns = solveMoneyWeightedReturns(
+        orderCodes[filled], orderAmounts[filled], np.maximum(yearsHeld, 0.0),
+        currentValues)
+
+    results = {}
+    for i, symbol in enumerate(symbols):
+        if costBasis[i] == 0 and unfilledOrders[i] == 0:
+            # Symbol only appears in the price data
+            continue
+        results[symbol] = {"costBasis": float(costBasis[i]),
+                           "shares": float(sharesHeld[i]),
+                           "averageCost": toOptionalFloat(averageCosts[i]),
+                           "currentPrice": toOptionalFloat(latestPrices[i]),
+                           "currentValue": toOptionalFloat(currentValues[i]),
+                           "unrealizedProfit": toOptionalFloat(currentValues[i] - costBasis[i]),
+                           "moneyWeightedReturn": toOptionalFloat(moneyWeightedReturns[i]),
+                           "unfilledOrders": int(unfilledOrders[i])}
+
+    return results
+
+
+def toOptionalFloat(value):
+    return float(value) if np.isfinite(value) else None
+
+
+def getCurrentPricesFromPositions():
+    # Requires a logged in Robinhood session
+    from wrappers import RobinhoodAPIWrapper
+
+    openPositionsSummary = RobinhoodAPIWrapper.getAllOpenPositions()
+    return {position["symbol"]: position["price"]
+            for position in openPositionsSummary["positions"]
+            if position["price"] is not None}
+
+
+def summarizePerformance(results):
+    costBasis = sum(result["costBasis"] for result in results.values())
+    currentValue = sum(result["currentValue"] or 0.0 for result in results.values())
+    return {"costBasis": costBasis, "currentValue": currentValue,
+            "unrealizedProfit": currentValue - costBasis}
+
+
+# Main function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Dollar-cost-averaging performance of the investment history")
+    parser.add_argument("--prices", required=True,
+                        help="CSV with date, symbol and price columns")
+    parser.add_argument("--start", help="first order date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last order date to include (YYYY-MM-DD)")
+    parser.add_argument("--live", action="store_true",
+                        help="value holdings at current Robinhood prices")
+    args = parser.parse_args()
+
+    currentPrices = None
+    valuationDate = None
+    if args.live:
+        from wrappers import RobinhoodAPIWrapper
+
+        RobinhoodAPIWrapper.login()
+        currentPrices = getCurrentPricesFromPositions()
+        RobinhoodAPIWrapper.logout()
+        valuationDate = date.today().isoformat()
+
+    results = computePerformance(*loadOrderArrays(startDate=args.start, endDate=args.end),
+                                 *loadPriceCSV(args.prices),
+                                 currentPrices=currentPrices,
+                                 valuationDate=valuationDate)
+
+    print(json.dumps({"summary": summarizePerformance(results), "symbols": results},
+                     indent=2))
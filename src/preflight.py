@@ -0,0 +1,83 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import time
+
+"""
+Concurrent pre-flight checks that run before any order is sent
+"""
+
+# Seconds each pre-flight call may take before the run is abandoned
+DEFAULT_PREFLIGHT_TIMEOUT_SECONDS = 30
+
+
+class PreflightError(Exception):
+    pass
+
+
+class PreflightTimeoutError(PreflightError):
+    pass
+
+
+@dataclass(frozen=True)
+class FundingSnapshot:
+    # Balances fetched during pre-flight, before any deposit or order
+    totalInvestmentValue: float
+    # Deposits are pulled from a single bank account, so only its balance
+    # decides whether a deposit can be made
+    bankAvailableFunds: float
+    # Across every linked funding account, for information only
+    totalBankAvailableFunds: float
+    brokerageBuyingPower: float
+    fetchSeconds: float
+
+    def getFundsToBeDeposited(self, brokerageCashBuffer):
+        # Deposit needed for the brokerage to keep brokerageCashBuffer after
+        # every order is filled (zero or less when no deposit is needed)
+        return self.totalInvestmentValue - (self.brokerageBuyingPower - brokerageCashBuffer)
+
+    def canDeposit(self, amount, bankCashBuffer):
+        return amount <= self.bankAvailableFunds - bankCashBuffer
+
+
+def runConcurrently(calls, timeouts=None, returnExceptions=False):
+    # Runs every call (name -> function) on its own thread and returns
+    # name -> result. Each call gets timeouts[name] seconds (or the default),
+    # counted from the start of the pre-flight. The first call to fail or time
+    # out raises, unless returnExceptions is set, in which case the error is
+    # returned as that call's result and the other calls are waited for.
+    timeouts = timeouts if timeouts is not None else {}
+    startTime = time.monotonic()
+
+    # Not used as a context manager, so that a call that timed out does not
+    # block the caller until it returns
+    executor = ThreadPoolExecutor(max_workers=len(calls))
+    try:
+        deadlines = {executor.submit(call): (name, startTime + timeouts.get(
+            name, DEFAULT_PREFLIGHT_TIMEOUT_SECONDS)) for name, call in calls.items()}
+
+        results = {}
+        pending = set(deadlines)
+        while pending:
+            nextDeadline = min(deadlines[future][1] for future in pending)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED,
+                                 timeout=max(0, nextDeadline - time.monotonic()))
+            for future in done:
+                name = deadlines[future][0]
+                if returnExceptions and future.exception() is not None:
+                    results[name] = future.exception()
+                else:
+                    results[name] = future.result()
+
+            now = time.monotonic()
+            for future in list(pending):
+                name, deadline = deadlines[future]
+                if deadline <= now:
+                    error = PreflightTimeoutError(f"Pre-flight call \"{name}\" timed out")
+                    if not returnExceptions:
+                        raise error
+                    results[name] = error
+                    pending.remove(future)
+
+        return results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
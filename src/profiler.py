@@ -0,0 +1,313 @@
+from datetime import datetime
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+"""
+Deterministic and sampling profiling of an entry point, with pstats and
+collapsed-stack (flamegraph) output and tracemalloc snapshots taken at stage
+boundaries
+"""
+
+DETERMINISTIC_PROFILER = "deterministic"
+SAMPLING_PROFILER = "sampling"
+PROFILER_MODES = [DETERMINISTIC_PROFILER, SAMPLING_PROFILER]
+
+DEFAULT_PROFILE_DIRECTORY = "./profiles"
+
+# Wall-clock sampling period of the sampling profiler (and of the sampler
+# producing collapsed stacks alongside the deterministic profiler)
+DEFAULT_SAMPLING_INTERVAL_SECONDS = 0.005
+
+# Frames kept per allocation traceback, and allocation sites listed per
+# snapshot
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 15
+
+# Active profiling session (see start)
+SESSION = None
+
+
+def getFrameLabel(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def getFunctionKey(code):
+    # Function identifier used by pstats
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class DeterministicProfiler:
+    # cProfile of every thread. Before Python 3.12 cProfile only follows the
+    # thread that enabled it, so threads started while profiling get a
+    # profile of their own and all of them are merged.
+
+    def __init__(self):
+        # Thread id -> profile
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def profileThread(self, frame, event, arg):
+        # Replaces itself with a new profile on the first event of a thread
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles[threading.get_ident()] = profile
+        profile.enable()
+
+    def getCurrentProfile(self):
+        with self.lock:
+            return self.profiles.get(threading.get_ident(), self.mainProfile)
+
+    def start(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.profileThread)
+        self.mainProfile = cProfile.Profile()
+        self.profiles[threading.get_ident()] = self.mainProfile
+        self.mainProfile.enable()
+
+    def pause(self):
+        # Stops profiling the calling thread until resume()
+        self.getCurrentProfile().disable()
+
+    def resume(self):
+        self.getCurrentProfile().enable()
+
+    def stop(self):
+        self.mainProfile.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+
+    def getStats(self):
+        with self.lock:
+            profiles = list(self.profiles.values())
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+class SamplingProfiler:
+    # Samples the stacks of every thread from a background thread. Blocked
+    # threads are sampled too, so the profile shows where wall-clock time
+    # (including network waits) goes.
+
+    def __init__(self, intervalSeconds=DEFAULT_SAMPLING_INTERVAL_SECONDS):
+        self.intervalSeconds = intervalSeconds
+        self.stopEvent = threading.Event()
+        self.paused = False
+        self.thread = None
+
+        # (thread name, code objects from the root to the leaf) -> samples
+        self.stackCounts = {}
+        self.sampleCount = 0
+        self.elapsedSeconds = 0.0
+
+    def sample(self):
+        threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+        for threadId, frame in sys._current_frames().items():
+            if threadId == self.thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            key = (threadNames.get(threadId, str(threadId)), tuple(reversed(stack)))
+            self.stackCounts[key] = self.stackCounts.get(key, 0) + 1
+        self.sampleCount += 1
+
+    def run(self):
+        # Samples are weighted by the measured time between them, which
+        # exceeds intervalSeconds under load. Paused time is not counted.
+        previousTime = time.perf_counter()
+        while not self.stopEvent.wait(self.intervalSeconds):
+            currentTime = time.perf_counter()
+            if not self.paused:
+                self.sample()
+                self.elapsedSeconds += currentTime - previousTime
+            previousTime = currentTime
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="SamplingProfiler",
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        self.thread.join()
+
+    def getSecondsPerSample(self):
+        if self.sampleCount == 0:
+            return self.intervalSeconds
+        return self.elapsedSeconds / self.sampleCount
+
+    def formatCollapsedStacks(self):
+        # One "thread;root;...;leaf count" line per stack, the input format
+        # of flamegraph.pl, inferno and speedscope
+        lines = {}
+        for (threadName, stack), count in self.stackCounts.items():
+            line = ";".join([threadName] + [getFrameLabel(code) for code in stack])
+            lines[line] = lines.get(line, 0) + count
+        return "".join(f"{line} {count}\n" for line, count in sorted(lines.items()))
+
+    def create_stats(self):
+        # Builds cProfile-style stats from the samples, so they can be loaded
+        # with pstats.Stats(self). Call counts are sample counts.
+        secondsPerSample = self.getSecondsPerSample()
+        stats = {}
+
+        def getEntry(code):
+            return stats.setdefault(getFunctionKey(code), [0, 0, 0.0, 0.0, {}])
+
+        for (threadName, stack), count in self.stackCounts.items():
+            seconds = count * secondsPerSample
+            getEntry(stack[-1])[2] += seconds
+
+            # Recursive functions are only counted once per stack
+            for code in set(stack):
+                entry = getEntry(code)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+
+            for callerCode, code in set(zip(stack, stack[1:])):
+                callers = getEntry(code)[4]
+                callerKey = getFunctionKey(callerCode)
+                callerCount, _, callerSelfSeconds, callerSeconds = callers.get(callerKey, (0, 0, 0.0, 0.0))
+                selfSeconds = seconds if code is stack[-1] else 0.0
+                callers[callerKey] = (callerCount + count, callerCount + count,
+                                      callerSelfSeconds + selfSeconds,
+                                      callerSeconds + seconds)
+
+        self.stats = {key: (entry[0], entry[1], entry[2], entry[3], entry[4])
+                      for key, entry in stats.items()}
+
+
+def formatSnapshot(label, snapshot, previousSnapshot, currentBytes, peakBytes):
+    lines = [f"== {label} (traced: {currentBytes / 1024:.1f} KiB, peak: {peakBytes / 1024:.1f} KiB)",
+             f"Top {TOP_ALLOCATIONS} allocation sites:"]
+    lines += [f"  {statistic}" for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+
+    if previousSnapshot is not None:
+        lines.append(f"Top {TOP_ALLOCATIONS} changes since the previous snapshot:")
+        lines += [f"  {statistic}"
+                  for statistic in snapshot.compare_to(previousSnapshot, "lineno")[:TOP_ALLOCATIONS]]
+    return "\n".join(lines) + "\n\n"
+
+
+class ProfilingSession:
+
+    def __init__(self, mode, outputDirectory=DEFAULT_PROFILE_DIRECTORY, name="profile",
+                 samplingIntervalSeconds=DEFAULT_SAMPLING_INTERVAL_SECONDS):
+        if mode not in PROFILER_MODES:
+            raise ValueError(f"Unknown profiler \"{mode}\"")
+        self.mode = mode
+        self.outputDirectory = outputDirectory
+        self.name = name
+
+        # Collapsed stacks always come from the sampler, which runs alongside
+        # cProfile in deterministic mode
+        self.sampler = SamplingProfiler(samplingIntervalSeconds)
+        self.deterministicProfiler = DeterministicProfiler() if mode == DETERMINISTIC_PROFILER else None
+
+        self.snapshotReports = []
+        self.previousSnapshot = None
+        self.startedTracemalloc = False
+
+    def takeSnapshot(self, label):
+        # Neither profiler records the (slow) snapshot itself
+        self.sampler.paused = True
+        if self.deterministicProfiler is not None:
+            self.deterministicProfiler.pause()
+        try:
+            self.recordSnapshot(label)
+        finally:
+            if self.deterministicProfiler is not None:
+                self.deterministicProfiler.resume()
+            self.sampler.paused = False
+
+    def recordSnapshot(self, label):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        currentBytes, peakBytes = tracemalloc.get_traced_memory()
+        self.snapshotReports.append(formatSnapshot(label, snapshot, self.previousSnapshot,
+                                                   currentBytes, peakBytes))
+        self.previousSnapshot = snapshot
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.startedTracemalloc = True
+        self.recordSnapshot("start")
+
+        self.sampler.start()
+        if self.deterministicProfiler is not None:
+            self.deterministicProfiler.start()
+
+    def stop(self):
+        # Stops profiling and returns the paths of the files written
+        if self.deterministicProfiler is not None:
+            self.deterministicProfiler.stop()
+        self.sampler.stop()
+
+        self.recordSnapshot("end")
+        if self.startedTracemalloc:
+            tracemalloc.stop()
+
+        return self.writeOutput()
+
+    def writeOutput(self):
+        os.makedirs(self.outputDirectory, exist_ok=True)
+        basePath = os.path.join(self.outputDirectory,
+                                f"{self.name}-{self.mode}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        paths = {"pstats": f"{basePath}.pstats",
+                 "collapsed": f"{basePath}.collapsed",
+                 "tracemalloc": f"{basePath}.tracemalloc.txt"}
+
+        if self.deterministicProfiler is not None:
+            stats = self.deterministicProfiler.getStats()
+        else:
+            stats = pstats.Stats(self.sampler)
+        stats.dump_stats(paths["pstats"])
+
+        with open(paths["collapsed"], "w") as file:
+            file.write(self.sampler.formatCollapsedStacks())
+
+        with open(paths["tracemalloc"], "w") as file:
+            file.writelines(self.snapshotReports)
+
+        return paths
+
+
+def start(mode, **options):
+    global SESSION
+    SESSION = ProfilingSession(mode, **options)
+    SESSION.start()
+    return SESSION
+
+
+def stop():
+    global SESSION
+    session, SESSION = SESSION, None
+    return session.stop()
+
+
+def takeSnapshot(label):
+    # Records the allocations at a stage boundary (a no-op unless profiling)
+    if SESSION is not None:
+        SESSION.takeSnapshot(label)
+
+
+def runProfiled(function, mode, **options):
+    # Calls function under the profiler, writing the profile even if it raises
+    start(mode, name=function.__name__, **options)
+    try:
+        return function()
+    finally:
+        paths = stop()
+        print(f"Profile written to {', '.join(paths.values())}")
+        stats = pstats.Stats(paths["pstats"])
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
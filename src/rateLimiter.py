@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+"""
+Adaptive token bucket used to pace outbound broker requests
+"""
+
+
+class RateLimiter:
+
+    def __init__(self, burst, ratePerSecond, minRatePerSecond, maxRatePerSecond,
+                 backoffFactor=0.5, recoveryFactor=1.25, recoveryThreshold=20,
+                 clock=time.monotonic, sleep=time.sleep):
+        # Bucket holds at most `burst` tokens and refills at the current rate
+        self.burst = burst
+        self.rate = ratePerSecond
+        self.minRate = minRatePerSecond
+        self.maxRate = maxRatePerSecond
+
+        # Rate is multiplied by backoffFactor on every throttled response and
+        # by recoveryFactor after every `recoveryThreshold` consecutive
+        # successful responses
+        self.backoffFactor = backoffFactor
+        self.recoveryFactor = recoveryFactor
+        self.recoveryThreshold = recoveryThreshold
+
+        # Clock and sleep can be replaced (e.g. with a fake clock in tests)
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = float(burst)
+        self.lastRefill = clock()
+        self.consecutiveSuccesses = 0
+        self.lock = threading.Lock()
+
+        self.stats = {"acquisitions": 0, "waits": 0, "totalWaitSeconds": 0.0,
+                      "throttled": 0, "rateIncreases": 0}
+
+    def refill(self):
+        now = self.clock()
+        elapsed = max(0.0, now - self.lastRefill)
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self.lastRefill = now
+
+    def reserve(self, tokens=1):
+        # Takes tokens from the bucket (possibly going negative) and returns
+        # how long the caller must wait before using them
+        with self.lock:
+            self.refill()
+            self.tokens -= tokens
+            waitSeconds = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+            self.stats["acquisitions"] += 1
+            if waitSeconds > 0:
+                self.stats["waits"] += 1
+                self.stats["totalWaitSeconds"] += waitSeconds
+
+            return waitSeconds
+
+    def acquire(self, tokens=1):
+        # Blocks until `tokens` are available and returns the time waited
+        waitSeconds = self.reserve(tokens)
+        if waitSeconds > 0:
+            self.sleep(waitSeconds)
+        return waitSeconds
+
+    async def acquireAsync(self, tokens=1):
+        # Same as acquire, but waits without blocking the event loop
+        waitSeconds = self.reserve(tokens)
+        if waitSeconds > 0:
+            await asyncio.sleep(waitSeconds)
+        return waitSeconds
+
+    def reportThrottled(self):
+        with self.lock:
+            self.refill()
+            self.stats["throttled"] += 1
+            self.consecutiveSuccesses = 0
+            self.rate = max(self.minRate, self.rate * self.backoffFactor)
+
+            # Drain the bucket so that the next request waits for a refill
+            self.tokens = min(self.tokens, 0.0)
+
+    def reportSuccess(self):
+        with self.lock:
+            self.consecutiveSuccesses += 1
+            if self.consecutiveSuccesses >= self.recoveryThreshold:
+                self.consecutiveSuccesses = 0
+                if self.rate < self.maxRate:
+                    self.refill()
+                    self.rate = min(self.maxRate, self.rate * self.recoveryFactor)
+                    self.stats["rateIncreases"] += 1
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["ratePerSecond"] = self.rate
+            return stats
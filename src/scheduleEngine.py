@@ -0,0 +1,161 @@
+from datetime import date, timedelta
+import math
+
+import historyStore
+
+"""
+Recurring-investment cadences and the runs that are due for each of them
+"""
+
+DAILY_CADENCE = "Daily"
+WEEKLY_CADENCE = "Weekly"
+BIWEEKLY_CADENCE = "Biweekly"
+MONTHLY_CADENCE = "Monthly"
+
+CADENCES = [DAILY_CADENCE, WEEKLY_CADENCE, BIWEEKLY_CADENCE, MONTHLY_CADENCE]
+
+# Rows without a cadence in the spreadsheet are invested weekly
+DEFAULT_CADENCE = WEEKLY_CADENCE
+
+# Spellings accepted in the spreadsheet (compared case-insensitively)
+CADENCE_ALIASES = {"daily": DAILY_CADENCE,
+                   "weekly": WEEKLY_CADENCE,
+                   "biweekly": BIWEEKLY_CADENCE,
+                   "bi-weekly": BIWEEKLY_CADENCE,
+                   "fortnightly": BIWEEKLY_CADENCE,
+                   "monthly": MONTHLY_CADENCE}
+
+# Weekly, biweekly and monthly runs fall on this weekday (date.weekday():
+# Monday is 0, Sunday is 6)
+RUN_WEEKDAY = 6
+
+# Biweekly runs fall on RUN_WEEKDAYs an even number of weeks from this date
+BIWEEKLY_ANCHOR_DATE = date(2021, 1, 3)
+
+# A scheduled run that was missed (e.g. the machine was off) is still due for
+# this many days afterwards
+MAX_CATCH_UP_DAYS = 6
+
+
+def normalizeCadence(value):
+    if value is None or str(value).strip() == "":
+        return DEFAULT_CADENCE
+
+    cadence = CADENCE_ALIASES.get(str(value).strip().lower())
+    if cadence is None:
+        raise ValueError(f"Unknown recurring investment cadence \"{value}\"")
+    return cadence
+
+
+def getFirstRunWeekdayOfMonth(year, month):
+    firstOfMonth = date(year, month, 1)
+    return firstOfMonth + timedelta(days=(RUN_WEEKDAY - firstOfMonth.weekday()) % 7)
+
+
+def getPreviousOccurrence(cadence, onDate):
+    # Most recent scheduled date of the cadence on or before onDate
+    if cadence == DAILY_CADENCE:
+        return onDate
+
+    lastRunWeekday = onDate - timedelta(days=(onDate.weekday() - RUN_WEEKDAY) % 7)
+
+    if cadence == WEEKLY_CADENCE:
+        return lastRunWeekday
+
+    if cadence == BIWEEKLY_CADENCE:
+        weeksFromAnchor = (lastRunWeekday - BIWEEKLY_ANCHOR_DATE).days // 7
+        return lastRunWeekday - timedelta(weeks=weeksFromAnchor % 2)
+
+    if cadence == MONTHLY_CADENCE:
+        occurrence = getFirstRunWeekdayOfMonth(onDate.year, onDate.month)
+        if occurrence > onDate:
+            previousMonth = onDate.replace(day=1) - timedelta(days=1)
+            occurrence = getFirstRunWeekdayOfMonth(previousMonth.year,
+                                                   previousMonth.month)
+        return occurrence
+
+    raise ValueError(f"Unknown recurring investment cadence \"{cadence}\"")
+
+
+def getNextOccurrence(cadence, afterDate):
+    # First scheduled date of the cadence strictly after afterDate
+    if cadence == DAILY_CADENCE:
+        return afterDate + timedelta(days=1)
+
+    if cadence == WEEKLY_CADENCE:
+        return getPreviousOccurrence(cadence, afterDate) + timedelta(weeks=1)
+
+    if cadence == BIWEEKLY_CADENCE:
+        return getPreviousOccurrence(cadence, afterDate) + timedelta(weeks=2)
+
+    if cadence == MONTHLY_CADENCE:
+        occurrence = getFirstRunWeekdayOfMonth(afterDate.year, afterDate.month)
+        if occurrence <= afterDate:
+            nextMonth = afterDate.replace(day=28) + timedelta(days=4)
+            occurrence = getFirstRunWeekdayOfMonth(nextMonth.year, nextMonth.month)
+        return occurrence
+
+    raise ValueError(f"Unknown recurring investment cadence \"{cadence}\"")
+
+
+def getLastRunDates(cadences):
+    # One indexed lookup per cadence (runs are indexed by recurringType, date)
+    lastRunDates = {}
+    for cadence in cadences:
+        isoDate = historyStore.getLastRunDate(recurringType=cadence)
+        lastRunDates[cadence] = None if isoDate is None else date.fromisoformat(isoDate)
+    return lastRunDates
+
+
+def isCadenceDue(cadence, onDate, lastRunDate):
+    previousOccurrence = getPreviousOccurrence(cadence, onDate)
+    if (onDate - previousOccurrence).days > MAX_CATCH_UP_DAYS:
+        return False
+    return lastRunDate is None or lastRunDate < previousOccurrence
+
+
+def getDueCadences(cadences, onDate):
+    # Returns the cadences (out of those given) with a run due on onDate
+    lastRunDates = getLastRunDates(cadences)
+    return [cadence for cadence in CADENCES
+            if cadence in lastRunDates
+            and isCadenceDue(cadence, onDate, lastRunDates[cadence])]
+
+
+def getNextRunDates(cadences, afterDate):
+    # Returns the next scheduled date of every cadence after afterDate
+    return {cadence: getNextOccurrence(cadence, afterDate) for cadence in cadences}
+
+
+def isOrderAmount(amount):
+    # Empty spreadsheet cells come through as None; only positive numbers
+    # can be ordered
+    return (isinstance(amount, (int, float)) and not isinstance(amount, bool)
+            and math.isfinite(amount) and amount > 0)
+
+
+def groupOrdersByCadence(recurringInvestments, recurringCadences, cadences):
+    # Returns cadence -> {symbol: amount} for the given cadences (symbols
+    # without a valid amount are skipped)
+    ordersByCadence = {}
+    for symbol, amount in recurringInvestments.items():
+        cadence = recurringCadences.get(symbol, DEFAULT_CADENCE)
+        if cadence not in cadences:
+            continue
+        if not isOrderAmount(amount):
+            print(f"WARNING: skipping {symbol}, its recurring investment amount is {amount!r}")
+            continue
+        ordersByCadence.setdefault(cadence, {})[symbol] = amount
+    return ordersByCadence
+
+
+def mergeOrders(ordersByCadence):
+    # Combines the orders of every cadence into a single run (a symbol due
+    # under several cadences is bought once, for the combined amount).
+    # Orders without a valid amount are left out.
+    orders = {}
+    for ordersForCadence in ordersByCadence.values():
+        for symbol, amount in ordersForCadence.items():
+            if isOrderAmount(amount):
+                orders[symbol] = orders.get(symbol, 0) + amount
+    return orders
@@ -0,0 +1,191 @@
+import random
+import threading
+import time
+
+from broker import BrokerRejectedError, BrokerThrottledError
+
+"""
+In-memory broker for running the order flow offline
+"""
+
+# Price of symbols without an explicit price
+DEFAULT_SIMULATED_PRICE = 100.0
+
+
+class SimulatedCrash(BaseException):
+    # Raised by a broker set up with crashAfterOrders. Derives from
+    # BaseException so that, like a real crash, it is not handled as a failed
+    # order and stops the order flow.
+    pass
+
+
+class SimulatedBroker:
+
+    def __init__(self, cash=0.0, prices=None, slippageBps=0.0,
+                 latencySeconds=0.0, latencyJitterSeconds=0.0,
+                 throttleProbability=0.0, failureProbability=0.0,
+                 crashAfterOrders=None, seed=None, sleep=time.sleep):
+        self.cash = float(cash)
+        self.positions = {}
+        self.prices = dict(prices) if prices is not None else {}
+
+        # Buys fill up to slippageBps above (sells below) the quoted price
+        self.slippageBps = slippageBps
+
+        # Every request takes latencySeconds plus up to latencyJitterSeconds
+        self.latencySeconds = latencySeconds
+        self.latencyJitterSeconds = latencyJitterSeconds
+
+        # Orders are randomly throttled or rejected with these probabilities,
+        # and symbol -> count failures can be injected with injectFailures
+        self.throttleProbability = throttleProbability
+        self.failureProbability = failureProbability
+        self.injectedFailures = {}
+
+        # SimulatedCrash is raised instead of placing order number
+        # crashAfterOrders + 1
+        self.crashAfterOrders = crashAfterOrders
+
+        self.random = random.Random(seed)
+        self.sleep = sleep
+        self.loggedIn = False
+        self.assetCategories = {}
+        self.fills = []
+        self.lock = threading.Lock()
+
+        self.stats = {"requests": 0, "orders": 0, "fills": 0, "throttled": 0,
+                      "failed": 0, "deposits": 0, "depositedAmount": 0.0}
+
+    def login(self):
+        self.loggedIn = True
+
+    def logout(self):
+        self.loggedIn = False
+
+    def simulateRequest(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            latency = self.latencySeconds
+            if self.latencyJitterSeconds > 0:
+                latency += self.random.uniform(0, self.latencyJitterSeconds)
+
+        # Latency is simulated outside the lock so requests overlap as they
+        # would against a real broker
+        if latency > 0:
+            self.sleep(latency)
+
+    def getAccountBuyingPower(self):
+        self.simulateRequest()
+        with self.lock:
+            return round(self.cash, 2)
+
+    def depositFundsToAccount(self, amount):
+        self.simulateRequest()
+        amount = round(amount, 2)
+        with self.lock:
+            self.cash += amount
+            self.stats["deposits"] += 1
+            self.stats["depositedAmount"] += amount
+        return {"amount": amount, "state": "completed"}
+
+    def setPrice(self, symbol, price):
+        with self.lock:
+            self.prices[symbol] = float(price)
+
+    def getPrice(self, symbol):
+        return self.prices.get(symbol, DEFAULT_SIMULATED_PRICE)
+
+    def getQuoteOfSymbol(self, symbol, useCache=True):
+        self.simulateRequest()
+        with self.lock:
+            return self.getPrice(symbol)
+
+    def getQuotesOfSymbols(self, symbols, useCache=True):
+        self.simulateRequest()
+        with self.lock:
+            return {symbol: self.getPrice(symbol) for symbol in symbols}
+
+    def seedAssetClassesFromCategories(self, symbolCategories):
+        self.assetCategories.update(symbolCategories)
+
+    def injectFailures(self, symbol, count=1):
+        # The next `count` orders of symbol are rejected
+        with self.lock:
+            self.injectedFailures[symbol] = self.injectedFailures.get(symbol, 0) + count
+
+    def checkOrder(self, symbol):
+        # Called with the lock held; raises if the order is not placed
+        if self.crashAfterOrders is not None and self.stats["orders"] >= self.crashAfterOrders:
+            raise SimulatedCrash(f"Simulated crash before ordering {symbol}")
+        self.stats["orders"] += 1
+
+        if self.random.random() < self.throttleProbability:
+            self.stats["throttled"] += 1
+            raise BrokerThrottledError("Request was throttled.")
+
+        if self.injectedFailures.get(symbol, 0) > 0:
+            self.injectedFailures[symbol] -= 1
+            self.stats["failed"] += 1
+            raise BrokerRejectedError(f"Injected failure for {symbol}")
+
+        if self.random.random() < self.failureProbability:
+            self.stats["failed"] += 1
+            raise BrokerRejectedError(f"Simulated failure for {symbol}")
+
+    def fill(self, symbol, side, quantity, price):
+        # Called with the lock held
+        fill = {"symbol": symbol, "side": side, "quantity": quantity,
+                "price": price, "amount": quantity * price}
+        self.fills.append(fill)
+        self.stats["fills"] += 1
+        return fill
+
+    def buyFractionalSharesByPrice(self, symbol, amountInDollars):
+        self.simulateRequest()
+        with self.lock:
+            self.checkOrder(symbol)
+            if amountInDollars > self.cash:
+                self.stats["failed"] += 1
+                raise BrokerRejectedError(
+                    f"Insufficient buying power for ${amountInDollars} of {symbol}")
+
+            slippage = self.random.uniform(0, self.slippageBps) / 10000
+            price = self.getPrice(symbol) * (1 + slippage)
+            quantity = amountInDollars / price
+
+            self.cash -= amountInDollars
+            self.positions[symbol] = self.positions.get(symbol, 0.0) + quantity
+            return self.fill(symbol, "buy", quantity, price)
+
+    def sellFractionalSharesByQuantity(self, symbol, quantity):
+        self.simulateRequest()
+        with self.lock:
+            self.checkOrder(symbol)
+            if quantity > self.positions.get(symbol, 0.0):
+                self.stats["failed"] += 1
+                raise BrokerRejectedError(
+                    f"Insufficient shares to sell {quantity} of {symbol}")
+
+            slippage = self.random.uniform(0, self.slippageBps) / 10000
+            price = self.getPrice(symbol) * (1 - slippage)
+
+            self.cash += quantity * price
+            self.positions[symbol] -= quantity
+            if self.positions[symbol] <= 0:
+                del self.positions[symbol]
+            return self.fill(symbol, "sell", quantity, price)
+
+    def getAllOpenPositions(self, maxWorkers=None):
+        # Same shape as RobinhoodAPIWrapper.getAllOpenPositions
+        self.simulateRequest()
+        with self.lock:
+            positions = [{"symbol": symbol, "quantity": quantity,
+                          "price": self.getPrice(symbol),
+                          "equity": self.getPrice(symbol) * quantity}
+                         for symbol, quantity in self.positions.items()]
+        return {"totalEquityValue": sum(position["equity"] for position in positions),
+                "positions": positions}
+
+    def getStats(self):
+        with self.lock:
+            return dict(self.stats, cash=self.cash, positions=len(self.positions))
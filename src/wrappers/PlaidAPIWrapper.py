@@ -1,5 +1,7 @@
-import plaid 
+from concurrent.futures import ThreadPoolExecutor
 import json
+import threading
+import time
 
 #cls Note: accessToken was created 27 January 2021 (see Plaid Quickstart to
 # generate new token) and should be valid indefinitely
@@ -11,13 +13,40 @@ CREDENTIALS_FILE_PATH = "./credentials/plaid-credentials.json"
 API_VERSION = '2019-05-29'
 
 
+# Credentials, client and access token are loaded on first use and reused for
+# the rest of the process
+CREDENTIALS = None
+
+CLIENT = None
+
+MAIN_ACCESS_TOKEN = None
+
+# Balances of each item (access token) are reused for this long
+BALANCE_CACHE_TTL_SECONDS = 60
+
+# accessToken -> (fetchedAt, accounts)
+BALANCE_CACHE = {}
+
+BALANCE_CACHE_LOCK = threading.Lock()
+
+# Only these account types count towards the total available funds (credit
+# and loan accounts report credit available, not cash)
+FUNDING_ACCOUNT_TYPES = ["depository"]
+
+
 def getCreds():
-    with open(CREDENTIALS_FILE_PATH) as file:
-        return json.load(file)
-    
+    global CREDENTIALS
+    if CREDENTIALS is None:
+        with open(CREDENTIALS_FILE_PATH) as file:
+            CREDENTIALS = json.load(file)
+    return CREDENTIALS
 
 
 def buildClient():
+    # Plaid is only imported once a client is actually needed so that
+    # importing this module stays cheap
+    import plaid
+
     creds = getCreds()
     client = plaid.Client(client_id=creds["PLAID_CLIENT_ID"],
                           secret=creds["PLAID_SECRET"],
@@ -28,7 +57,18 @@ def buildClient():
     return client if client is not None else None
 
 
+def getClient():
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = buildClient()
+    return CLIENT
+
+
 def getMainAccessToken():
+    global MAIN_ACCESS_TOKEN
+    if MAIN_ACCESS_TOKEN is not None:
+        return MAIN_ACCESS_TOKEN
+
     creds = getCreds()
 
     # Main access token information should be first in accessTokens array
@@ -36,25 +76,112 @@ def getMainAccessToken():
 
     # Retrieve main item token
     mainAccessToken = mainAccessTokenInfo["itemAccessToken"]
+    MAIN_ACCESS_TOKEN = mainAccessToken
 
     return mainAccessToken if mainAccessToken is not None else None
 
 
-# Global constants that rely upon other functions
-CREDENTIALS = getCreds()
+def getAccessTokensInfo():
+    # Every entry of accessTokens has an itemAccessToken and may restrict the
+    # accounts used for funding with an accountIds list
+    return getCreds()["accessTokens"]
+
+
+def fetchAccountBalances(accessToken):
+    resp = getClient().Accounts.balance.get(accessToken)
+    if resp is None:
+        return []
+
+    return [{"accountId": account["account_id"],
+             "name": account.get("name"),
+             "type": account.get("type"),
+             "available": account["balances"]["available"],
+             "current": account["balances"]["current"]}
+            for account in resp["accounts"]]
+
+
+def getAccountBalances(accessToken, useCache=True):
+    # Returns the balances of every account of an item, reusing balances
+    # fetched within BALANCE_CACHE_TTL_SECONDS
+    if useCache:
+        with BALANCE_CACHE_LOCK:
+            cachedBalances = BALANCE_CACHE.get(accessToken)
+        if cachedBalances is not None and time.time() - cachedBalances[0] < BALANCE_CACHE_TTL_SECONDS:
+            return cachedBalances[1]
+
+    accounts = fetchAccountBalances(accessToken)
+    with BALANCE_CACHE_LOCK:
+        BALANCE_CACHE[accessToken] = (time.time(), accounts)
 
-CLIENT = buildClient()
+    return accounts
+
+
+def clearBalanceCache():
+    with BALANCE_CACHE_LOCK:
+        BALANCE_CACHE.clear()
+
+
+def getAllAccountBalances(useCache=True):
+    # Fetches every configured item concurrently (over the shared client) and
+    # returns the balances of their accounts, restricted to accountIds where
+    # given
+    accessTokensInfo = getAccessTokensInfo()
+
+    # Build the client before the threads share it
+    getClient()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(accessTokensInfo))) as executor:
+        accountsByItem = list(executor.map(
+            lambda info: getAccountBalances(info["itemAccessToken"], useCache=useCache),
+            accessTokensInfo))
+
+    allAccounts = []
+    for info, accounts in zip(accessTokensInfo, accountsByItem):
+        accountIds = info.get("accountIds")
+        allAccounts += [account for account in accounts
+                        if accountIds is None or account["accountId"] in accountIds]
+
+    return allAccounts
+
+
+def getTotalAvailableFunds(useCache=True):
+    # Sum of the available balances of every funding account (the current
+    # balance is used where the bank does not report an available balance)
+    totalAvailableFunds = 0
+    for account in getAllAccountBalances(useCache=useCache):
+        if account["type"] not in FUNDING_ACCOUNT_TYPES:
+            continue
+        availBal = account["available"]
+        totalAvailableFunds += availBal if availBal is not None else account["current"] or 0
+
+    return totalAvailableFunds
+
+
+def getFundingAccountAvailableFunds(useCache=True):
+    # Available balance of the account deposits are pulled from (the bank
+    # account behind RobinhoodAPIWrapper.MAIN_BANK_ACCOUNT_URL): the account
+    # given by fundingAccountId in the main entry of accessTokens, or else the
+    # first account of the main item. None if the account is not found.
+    fundingAccountId = getAccessTokensInfo()[0].get("fundingAccountId")
+    accounts = getAccountBalances(getMainAccessToken(), useCache=useCache)
+    for account in accounts:
+        if fundingAccountId is None or account["accountId"] == fundingAccountId:
+            availBal = account["available"]
+            return availBal if availBal is not None else account["current"]
+
+    return None
 
-MAIN_ACCESS_TOKEN = getMainAccessToken()
 
 def getAccountAvailableBalance():
+    # Available balance of the first account of the main item
     availBal = None
-    if (CLIENT is not None and MAIN_ACCESS_TOKEN is not None):
-        resp = CLIENT.Accounts.balance.get(MAIN_ACCESS_TOKEN)
+    client = getClient()
+    mainAccessToken = getMainAccessToken()
+    if (client is not None and mainAccessToken is not None):
+        accounts = getAccountBalances(mainAccessToken)
 
-        if (resp is not None):
-            mainAccountBalances = resp["accounts"][0]["balances"]
-            availBal = mainAccountBalances["available"]
+        if (len(accounts) > 0):
+            availBal = accounts[0]["available"]
 
     return availBal
 
@@ -77,6 +204,14 @@ def testSanity():
     resp = "SUCCESS" if getAccountAvailableBalance() is not None else "FAILED"
     print(resp)
 
+    print("\nTesting getFundingAccountAvailableFunds()...")
+    resp = "SUCCESS" if getFundingAccountAvailableFunds() is not None else "FAILED"
+    print(resp)
+
+    print("\nTesting getTotalAvailableFunds()...")
+    resp = "SUCCESS" if getTotalAvailableFunds() is not None else "FAILED"
+    print(resp)
+
 
 
 # Main function
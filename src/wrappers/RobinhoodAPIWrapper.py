@@ -1,14 +1,131 @@
 import robin_stocks as rs
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
 import json
+import os
+import pytz
+import sys
+import threading
+import time
+
+# When run standalone (python src/wrappers/RobinhoodAPIWrapper.py) the
+# modules shared with src/ are not on the path yet
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broker import BrokerNoResponseError, BrokerOrderError, BrokerRejectedError, BrokerThrottledError
+import cassette
+import metrics
+from rateLimiter import RateLimiter
 import requests
-import copy
+from requests.adapters import HTTPAdapter
 
 CREDENTIALS_FILE_PATH = "./credentials/rh-credentials.json"
 
 MAIN_BANK_ACCOUNT_URL = "https://api.robinhood.com/ach/relationships/ad0d5b2c-ef75-47e9-9771-7ee7dacffcee/"
 
+# Forex quotes endpoint accepts a comma separated list of currency pair ids
+CRYPTO_QUOTES_URL = "https://api.robinhood.com/marketdata/forex/quotes/"
+
+# Maximum number of symbols (or ids) requested in a single bulk request
+QUOTE_BATCH_SIZE = 100
+
+# Crypto currency code -> currency pair id (loaded on first use)
+CRYPTO_PAIR_IDS = None
+
+# Quotes are cached process-wide for this many seconds (stocks use the
+# longer TTL while the market is closed since prices barely move)
+CRYPTO_QUOTE_TTL_SECONDS = 10
+STOCK_QUOTE_TTL_SECONDS = 30
+STOCK_QUOTE_MARKET_CLOSED_TTL_SECONDS = 15 * 60
+
+# Regular US market hours (extended hours trades are still picked up once the
+# longer TTL expires)
+MARKET_TIMEZONE = pytz.timezone("America/New_York")
+MARKET_OPEN_TIME = (9, 30)
+MARKET_CLOSE_TIME = (16, 0)
+
+# symbol -> {"price", "assetClass", "fetchedAt"}
+QUOTE_CACHE = {}
+
+# symbol -> Future for quotes currently being requested, so that concurrent
+# requests for the same symbol share a single request
+QUOTES_IN_FLIGHT = {}
+
+QUOTE_CACHE_LOCK = threading.Lock()
+
+QUOTE_CACHE_STATS = {"hits": 0, "misses": 0, "coalesced": 0}
+
+# Value of the result label of metrics.QUOTE_CACHE_LOOKUPS for each stat
+QUOTE_CACHE_LOOKUP_RESULTS = {"hits": "hit", "misses": "miss", "coalesced": "coalesced"}
+
+# Every outbound broker request is paced by one shared adaptive token bucket,
+# which slows down when requests are throttled and speeds back up after
+# sustained success
+BROKER_RATE_LIMIT_BURST = 5
+BROKER_RATE_LIMIT_PER_SECOND = 1.0
+BROKER_RATE_LIMIT_MIN_PER_SECOND = 0.1
+BROKER_RATE_LIMIT_MAX_PER_SECOND = 5.0
+
+BROKER_RATE_LIMITER = RateLimiter(burst=BROKER_RATE_LIMIT_BURST,
+                                  ratePerSecond=BROKER_RATE_LIMIT_PER_SECOND,
+                                  minRatePerSecond=BROKER_RATE_LIMIT_MIN_PER_SECOND,
+                                  maxRatePerSecond=BROKER_RATE_LIMIT_MAX_PER_SECOND)
+
+# Number of times a throttled request is retried (after backing off)
+MAX_THROTTLED_RETRIES = 3
+
+# Maximum number of concurrent requests made while valuing open positions
+# (1 values positions sequentially)
+VALUATION_MAX_WORKERS = 8
+
+ASSET_CLASS_CRYPTO = "crypto"
+ASSET_CLASS_STOCK = "stock"
+
+# Persistent symbol -> asset class registry, so that symbols are never probed
+# with live quote requests more than once
+ASSET_CLASS_REGISTRY_FILE_PATH = "./investments/asset-class-registry.json"
+
+# Loaded from ASSET_CLASS_REGISTRY_FILE_PATH on first use
+ASSET_CLASS_REGISTRY = None
+
+# Orders register asset classes from several pipeline threads, so loading and
+# updating (and writing) the registry are serialized
+ASSET_CLASS_REGISTRY_LOCK = threading.Lock()
+
+# Instrument URLs never change their symbol, so resolved symbols are kept in
+# a persistent instrument URL -> symbol map
+INSTRUMENT_CACHE_FILE_PATH = "./investments/instrument-cache.json"
+
+# Instruments endpoint accepts a comma separated list of instrument ids
+INSTRUMENTS_URL = "https://api.robinhood.com/instruments/"
+
+# Timeout (in seconds) for requests made through the pooled HTTP session
+HTTP_TIMEOUT = 10
+
+HTTP_POOL_SIZE = 10
+
+# Loaded from INSTRUMENT_CACHE_FILE_PATH on first use
+INSTRUMENT_CACHE = None
+
+# Keep-alive session shared by all requests made outside of robin_stocks
+HTTP_SESSION = None
+
+# robin_stocks swallows HTTP errors (returning None or the error body), so
+# throttling is detected from the responses themselves: a response hook on
+# every broker session flags the thread that received a 429
+THROTTLE_STATE = threading.local()
+
+THROTTLED_STATUS_CODE = 429
+
 
 def login():
+    # Replayed cassettes hold no credentials or session tokens, so the
+    # session is only marked as logged in
+    if cassette.isReplaying():
+        rs.helper.set_login_state(True)
+        return
+
     with open(CREDENTIALS_FILE_PATH) as file:
         creds = json.load(file)
 
@@ -24,112 +141,609 @@ def logout():
 
     rs.logout()
 
+def recordResponseStatus(response, *args, **kwargs):
+    # requests response hook (see installThrottleHook)
+    if response.status_code == THROTTLED_STATUS_CODE:
+        THROTTLE_STATE.throttled = True
+
+
+def installThrottleHook(session):
+    if session is not None and recordResponseStatus not in session.hooks["response"]:
+        session.hooks["response"].append(recordResponseStatus)
+
+
+def isThrottledResponse(resp):
+    # requests responses carry a 429 status, while robin_stocks may also
+    # return the decoded error body ({"detail": "Request was throttled. ..."})
+    if getattr(resp, "status_code", None) == THROTTLED_STATUS_CODE:
+        return True
+    if isinstance(resp, dict):
+        return "throttled" in str(resp.get("detail", "")).lower()
+    return False
+
+
+def callBroker(function, *args, **kwargs):
+    # Performs a single broker request under the shared rate limiter, raising
+    # BrokerThrottledError if it is still throttled after every retry
+    installThrottleHook(getattr(rs.helper, "SESSION", None))
+
+    for attempt in range(MAX_THROTTLED_RETRIES + 1):
+        BROKER_RATE_LIMITER.acquire()
+        THROTTLE_STATE.throttled = False
+        resp = function(*args, **kwargs)
+
+        if not (THROTTLE_STATE.throttled or isThrottledResponse(resp)):
+            BROKER_RATE_LIMITER.reportSuccess()
+            return resp
+
+        print("Broker request throttled, backing off....")
+        BROKER_RATE_LIMITER.reportThrottled()
+        if attempt < MAX_THROTTLED_RETRIES:
+            metrics.incrementCounter(metrics.BROKER_RETRIES)
+
+    raise BrokerThrottledError(
+        f"Broker request still throttled after {MAX_THROTTLED_RETRIES} retries")
+
+
+def isAcceptedResponse(resp):
+    # robin_stocks returns None or the decoded error body (e.g. {"detail":
+    # ...}) instead of raising, while accepted orders and transfers always
+    # carry an id
+    return isinstance(resp, dict) and "id" in resp
+
+
+def getResponseError(resp, message):
+    # robin_stocks turns timeouts and connection errors into a None
+    # response, in which case the order may still have been placed
+    if resp is None:
+        return BrokerNoResponseError(f"{message}: no response")
+    detail = resp.get("detail", resp) if isinstance(resp, dict) else resp
+    return BrokerRejectedError(f"{message}: {detail}")
+
+
+def getHTTPSession():
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        HTTP_SESSION = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                              pool_maxsize=HTTP_POOL_SIZE)
+        HTTP_SESSION.mount("https://", adapter)
+        installThrottleHook(HTTP_SESSION)
+    return HTTP_SESSION
+
+
+def loadInstrumentCache():
+    if not os.path.exists(INSTRUMENT_CACHE_FILE_PATH):
+        return {}
+    try:
+        with open(INSTRUMENT_CACHE_FILE_PATH) as file:
+            return json.load(file)
+    except ValueError:
+        # A corrupt cache is rebuilt from scratch
+        return {}
+
+
+def writeInstrumentCache(instrumentCache):
+    # Write to a temporary file first so that an interrupted write never
+    # leaves a partial cache behind
+    tempFilePath = f"{INSTRUMENT_CACHE_FILE_PATH}.tmp"
+    with open(tempFilePath, "w") as file:
+        json.dump(instrumentCache, file)
+    os.replace(tempFilePath, INSTRUMENT_CACHE_FILE_PATH)
+
+
+def getInstrumentCache():
+    global INSTRUMENT_CACHE
+    if INSTRUMENT_CACHE is None:
+        INSTRUMENT_CACHE = loadInstrumentCache()
+    return INSTRUMENT_CACHE
+
+
+def getInstrumentIdFromURL(instrumentURL):
+    # Instrument URLs are of the form .../instruments/<id>/
+    return instrumentURL.rstrip("/").rsplit("/", 1)[-1]
+
+
+def resolveInstrumentURLs(instrumentURLs):
+    # Returns an instrument URL -> symbol mapping, requesting only the URLs
+    # that are not in the instrument cache (in bulk). URLs that cannot be
+    # resolved are logged and left out of the mapping.
+    instrumentCache = getInstrumentCache()
+    unknownURLs = [instrumentURL for instrumentURL in dict.fromkeys(instrumentURLs)
+                   if instrumentURL not in instrumentCache]
+
+    if unknownURLs:
+        session = getHTTPSession()
+        urlsById = {getInstrumentIdFromURL(instrumentURL): instrumentURL
+                    for instrumentURL in unknownURLs}
+
+        for chunk in chunkList(list(urlsById.keys())):
+            resp = callBroker(session.get, INSTRUMENTS_URL,
+                              params={"ids": ",".join(chunk)}, timeout=HTTP_TIMEOUT)
+            if resp.ok:
+                for instrument in resp.json().get("results", []):
+                    if instrument is not None and instrument.get("id") in urlsById:
+                        instrumentCache[urlsById[instrument["id"]]] = instrument["symbol"]
+
+        # Fall back to single lookups for anything the bulk request did not
+        # return
+        for instrumentURL in unknownURLs:
+            if instrumentURL not in instrumentCache:
+                resp = callBroker(session.get, instrumentURL, timeout=HTTP_TIMEOUT)
+                try:
+                    instrument = resp.json() if resp.ok else None
+                except ValueError:
+                    instrument = None
+                if not isinstance(instrument, dict) or instrument.get("symbol") is None:
+                    print(f"WARNING: could not resolve instrument {instrumentURL} "
+                          f"(status {resp.status_code})")
+                    continue
+                instrumentCache[instrumentURL] = instrument["symbol"]
+
+        writeInstrumentCache(instrumentCache)
+
+    return {instrumentURL: instrumentCache[instrumentURL] for instrumentURL in instrumentURLs
+            if instrumentURL in instrumentCache}
+
+
 def getSymbolFromInstrumentURL(instrumentURL):
-    resp = requests.get(instrumentURL)
-    symbol = (resp.json())["symbol"]
+    # Repeated lookups are served by the instrument cache
+    symbol = resolveInstrumentURLs([instrumentURL]).get(instrumentURL)
 
     return symbol
 
 
-def getQuoteOfSymbol(symbol):
-    quote = None
-    
+def getQuoteOfSymbol(symbol, useCache=True):
+    quotes = {}
+    assetClass = getAssetClassOfSymbol(symbol)
+
+    if (assetClass == ASSET_CLASS_CRYPTO):
+        quotes = getCryptoQuotes([symbol], useCache=useCache)
+    elif (assetClass == ASSET_CLASS_STOCK):
+        quotes = getStockQuotes([symbol], useCache=useCache)
+
+    return quotes.get(symbol)
+
+
+def isMarketOpen(now=None):
+    now = now if now is not None else datetime.now(MARKET_TIMEZONE)
+    now = now.astimezone(MARKET_TIMEZONE)
+
+    # Market is closed on weekends
+    if now.weekday() >= 5:
+        return False
+
+    return MARKET_OPEN_TIME <= (now.hour, now.minute) < MARKET_CLOSE_TIME
+
+
+def getQuoteTTL(assetClass):
+    if assetClass == ASSET_CLASS_CRYPTO:
+        return CRYPTO_QUOTE_TTL_SECONDS
+    if isMarketOpen():
+        return STOCK_QUOTE_TTL_SECONDS
+    return STOCK_QUOTE_MARKET_CLOSED_TTL_SECONDS
+
+
+def storeQuotes(quotes, assetClass):
+    fetchedAt = time.time()
+    with QUOTE_CACHE_LOCK:
+        for symbol, price in quotes.items():
+            if price is not None:
+                QUOTE_CACHE[symbol] = {"price": price, "assetClass": assetClass,
+                                       "fetchedAt": fetchedAt}
+
+
+def readThroughQuoteCache(symbols, assetClass, fetchQuotes, useCache=True):
+    # Returns a symbol -> price mapping for symbols, calling fetchQuotes only
+    # for symbols that are neither cached nor already being requested
+    if not useCache:
+        quotes = fetchQuotes(symbols)
+        storeQuotes(quotes, assetClass)
+        return {symbol: price for symbol, price in quotes.items() if price is not None}
+
+    quotes = {}
+    claimedSymbols = []
+    pendingQuotes = {}
+    ttl = getQuoteTTL(assetClass)
+    now = time.time()
+    lookups = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    with QUOTE_CACHE_LOCK:
+        for symbol in dict.fromkeys(symbols):
+            cachedQuote = QUOTE_CACHE.get(symbol)
+            if cachedQuote is not None and now - cachedQuote["fetchedAt"] < ttl:
+                lookups["hits"] += 1
+                quotes[symbol] = cachedQuote["price"]
+            elif symbol in QUOTES_IN_FLIGHT:
+                lookups["coalesced"] += 1
+                pendingQuotes[symbol] = QUOTES_IN_FLIGHT[symbol]
+            else:
+                lookups["misses"] += 1
+                QUOTES_IN_FLIGHT[symbol] = Future()
+                claimedSymbols.append(symbol)
+        for key, count in lookups.items():
+            QUOTE_CACHE_STATS[key] += count
+
+    # Also exported as metrics (outside the quote cache lock)
+    for key, count in lookups.items():
+        if count > 0:
+            metrics.incrementCounter(metrics.QUOTE_CACHE_LOOKUPS, count,
+                                     result=QUOTE_CACHE_LOOKUP_RESULTS[key])
+
+    if claimedSymbols:
+        try:
+            fetchedQuotes = fetchQuotes(claimedSymbols)
+        except BaseException as e:
+            # Waiting requests fail the same way as the request they waited on
+            with QUOTE_CACHE_LOCK:
+                for symbol in claimedSymbols:
+                    QUOTES_IN_FLIGHT.pop(symbol).set_exception(e)
+            raise
+
+        storeQuotes(fetchedQuotes, assetClass)
+        with QUOTE_CACHE_LOCK:
+            for symbol in claimedSymbols:
+                QUOTES_IN_FLIGHT.pop(symbol).set_result(fetchedQuotes.get(symbol))
+
+        quotes.update({symbol: price for symbol, price in fetchedQuotes.items()
+                       if price is not None})
+
+    for symbol, pendingQuote in pendingQuotes.items():
+        price = pendingQuote.result()
+        if price is not None:
+            quotes[symbol] = price
+
+    return quotes
+
+
+def getQuoteCacheStats():
+    with QUOTE_CACHE_LOCK:
+        return dict(QUOTE_CACHE_STATS)
+
+
+def clearQuoteCache():
+    with QUOTE_CACHE_LOCK:
+        QUOTE_CACHE.clear()
+        for key in QUOTE_CACHE_STATS:
+            QUOTE_CACHE_STATS[key] = 0
+
+def getStockQuotePrice(quote):
+    # Determine most recent stock quote (extended hours or last trade in day)
+    price = None
+    if (quote['last_extended_hours_trade_price'] is not None):
+        price = quote['last_extended_hours_trade_price']
+    elif (quote['last_trade_price'] is not None):
+        price = quote['last_trade_price']
+
+    return float(price) if price is not None else None
+
+
+def getCryptoPairIds():
+    global CRYPTO_PAIR_IDS
+    if CRYPTO_PAIR_IDS is None:
+        CRYPTO_PAIR_IDS = {}
+        for pair in callBroker(rs.crypto.get_crypto_currency_pairs):
+            # Only USD pairs are traded by this application
+            if pair["symbol"].endswith("-USD"):
+                CRYPTO_PAIR_IDS[pair["asset_currency"]["code"]] = pair["id"]
+
+    return CRYPTO_PAIR_IDS
+
+
+def chunkList(items):
+    for i in range(0, len(items), QUOTE_BATCH_SIZE):
+        yield items[i:i + QUOTE_BATCH_SIZE]
+
+
+def getStockQuotes(symbols, useCache=True):
+    return readThroughQuoteCache(symbols, ASSET_CLASS_STOCK, fetchStockQuotes,
+                                 useCache=useCache)
+
+
+def getCryptoQuotes(symbols, useCache=True):
+    return readThroughQuoteCache(symbols, ASSET_CLASS_CRYPTO, fetchCryptoQuotes,
+                                 useCache=useCache)
+
+
+def fetchStockQuotes(symbols):
+    quotes = {}
+    for chunk in chunkList(symbols):
+        for quote in callBroker(rs.stocks.get_quotes, chunk):
+            # Unknown symbols are returned as None
+            if quote is not None:
+                quotes[quote["symbol"]] = getStockQuotePrice(quote)
+
+    return quotes
+
+
+def fetchCryptoQuotes(symbols):
+    # Symbols without a USD currency pair cannot be quoted (nor traded), so
+    # they are logged and left out
+    cryptoPairIds = getCryptoPairIds()
+    for symbol in symbols:
+        if symbol not in cryptoPairIds:
+            print(f"WARNING: no USD currency pair for crypto symbol {symbol}")
+    symbols = [symbol for symbol in symbols if symbol in cryptoPairIds]
+    symbolsById = {cryptoPairIds[symbol]: symbol for symbol in symbols}
+
+    quotes = {}
+    for chunk in chunkList(list(symbolsById.keys())):
+        resp = callBroker(
+            rs.helper.request_get, CRYPTO_QUOTES_URL, 'results', {'ids': ",".join(chunk)})
+        for quote in resp or []:
+            if quote is not None and quote.get("id") in symbolsById:
+                quotes[symbolsById[quote["id"]]] = float(quote["mark_price"])
+
+    # Fall back to single quotes for anything the bulk request did not return
+    for symbol in symbols:
+        if symbol not in quotes:
+            quote = callBroker(rs.crypto.get_crypto_quote, symbol)
+            if quote is not None:
+                quotes[symbol] = float(quote["mark_price"])
+
+    return quotes
+
+
+def getQuotesOfSymbols(symbols, useCache=True):
+    # Returns a symbol -> price mapping (symbols without a quote are omitted)
+    symbols = list(dict.fromkeys(symbols))
+    registry = getAssetClassRegistry()
+
+    # Split symbols by asset class using the registry, and the crypto currency
+    # pair listing for symbols that are not registered yet
+    unknownSymbols = [symbol for symbol in symbols if symbol not in registry]
+    if unknownSymbols:
+        cryptoPairIds = getCryptoPairIds()
+        registerAssetClasses({symbol: ASSET_CLASS_CRYPTO
+                              for symbol in unknownSymbols if symbol in cryptoPairIds})
+
+    cryptoSymbols = [symbol for symbol in symbols
+                     if registry.get(symbol) == ASSET_CLASS_CRYPTO]
+    stockSymbols = [symbol for symbol in symbols
+                    if registry.get(symbol) != ASSET_CLASS_CRYPTO]
+
+    quotes = {}
+    if stockSymbols:
+        stockQuotes = getStockQuotes(stockSymbols, useCache=useCache)
+        # Unregistered symbols that returned a stock quote are stocks
+        registerAssetClasses({symbol: ASSET_CLASS_STOCK
+                              for symbol in stockQuotes if symbol not in registry})
+        quotes.update(stockQuotes)
+    if cryptoSymbols:
+        quotes.update(getCryptoQuotes(cryptoSymbols, useCache=useCache))
+
+    return quotes
+
+
+def loadAssetClassRegistry():
+    if not os.path.exists(ASSET_CLASS_REGISTRY_FILE_PATH):
+        return {}
+    try:
+        with open(ASSET_CLASS_REGISTRY_FILE_PATH) as file:
+            return json.load(file)
+    except ValueError:
+        # A corrupt registry is rebuilt from scratch
+        return {}
+
+
+def writeAssetClassRegistry(registry):
+    # Write to a temporary file first so that an interrupted write never
+    # leaves a partial registry behind
+    tempFilePath = f"{ASSET_CLASS_REGISTRY_FILE_PATH}.tmp"
+    with open(tempFilePath, "w") as file:
+        json.dump(registry, file)
+    os.replace(tempFilePath, ASSET_CLASS_REGISTRY_FILE_PATH)
+
+
+def getAssetClassRegistry():
+    global ASSET_CLASS_REGISTRY
+    with ASSET_CLASS_REGISTRY_LOCK:
+        if ASSET_CLASS_REGISTRY is None:
+            ASSET_CLASS_REGISTRY = loadAssetClassRegistry()
+        return ASSET_CLASS_REGISTRY
+
+
+def registerAssetClasses(assetClasses):
+    # Records symbol -> asset class entries, writing the registry only when
+    # something changed
+    registry = getAssetClassRegistry()
+    with ASSET_CLASS_REGISTRY_LOCK:
+        changes = {symbol: assetClass for symbol, assetClass in assetClasses.items()
+                   if registry.get(symbol) != assetClass}
+        if changes:
+            registry.update(changes)
+            writeAssetClassRegistry(registry)
+
+
+def seedAssetClassesFromCategories(symbolCategories):
+    # Seeds the registry from the spreadsheet's symbol -> asset category
+    # (sheet name) mapping, without overriding symbols that are already
+    # registered. Categories are classified with the crypto currency pair
+    # listing: a category is crypto when every symbol has a USD pair and
+    # stocks when none has. Symbols of any other category are left
+    # unregistered (and probed when first ordered).
+    registry = getAssetClassRegistry()
+    cryptoPairIds = getCryptoPairIds()
+
+    symbolsByCategory = {}
+    for symbol, assetCategory in symbolCategories.items():
+        symbolsByCategory.setdefault(assetCategory, []).append(symbol)
+
+    assetClasses = {}
+    for assetCategory, symbols in symbolsByCategory.items():
+        cryptoSymbolCount = sum(symbol in cryptoPairIds for symbol in symbols)
+        if cryptoSymbolCount == len(symbols):
+            assetClass = ASSET_CLASS_CRYPTO
+        elif cryptoSymbolCount == 0:
+            assetClass = ASSET_CLASS_STOCK
+        else:
+            print(f"WARNING: asset category {assetCategory} mixes crypto and stock symbols, "
+                  "its symbols are not registered")
+            continue
+        assetClasses.update({symbol: assetClass for symbol in symbols
+                             if symbol not in registry})
+
+    registerAssetClasses(assetClasses)
+
+
+def getAssetClassOfSymbol(symbol):
+    registry = getAssetClassRegistry()
+    if symbol in registry:
+        return registry[symbol]
+
+    # Unknown symbols are probed once and then remembered
+    assetClass = None
     if (isCrypto(symbol)):
-        quote =  rs.crypto.get_crypto_quote(symbol)
-        quote = quote['mark_price']
+        assetClass = ASSET_CLASS_CRYPTO
     elif (isStock(symbol)):
-        quote =  rs.stocks.get_stock_quote_by_symbol(symbol)
-        # Determine most recent stock quote (extended hours or last trade in 
-        # day)
-        if (quote['last_extended_hours_trade_price'] is not None):
-            quote = quote['last_extended_hours_trade_price']
-        elif (quote['last_trade_price'] is not None):
-            quote = quote['last_trade_price']
+        assetClass = ASSET_CLASS_STOCK
+
+    if assetClass is not None:
+        registerAssetClasses({symbol: assetClass})
+
+    return assetClass
 
-    return float(quote)
 
 def isCrypto(symbol):
-    return (rs.crypto.get_crypto_quote(symbol) is not None)
+    quote = callBroker(rs.crypto.get_crypto_quote, symbol)
+    if quote is not None:
+        # Keep the probe's quote so the symbol is not quoted again right away
+        storeQuotes({symbol: float(quote['mark_price'])}, ASSET_CLASS_CRYPTO)
+    return (quote is not None)
 
 def isStock(symbol):
-    return (rs.stocks.get_stock_quote_by_symbol(symbol) is not None)
+    quote = callBroker(rs.stocks.get_stock_quote_by_symbol, symbol)
+    if quote is not None:
+        # Keep the probe's quote so the symbol is not quoted again right away
+        storeQuotes({symbol: getStockQuotePrice(quote)}, ASSET_CLASS_STOCK)
+    return (quote is not None)
 
 def getAccountInfo():
-    generalAccountInfo = rs.account.load_phoenix_account()
+    generalAccountInfo = callBroker(rs.account.load_phoenix_account)
 
     return generalAccountInfo
 
 
 def getAccountEquityValue():
-    accountValue = 0
+    # Get all open positions (quoted in bulk)
     openPositionSummary = getAllOpenPositions()
 
-    # Get all open positions
     return round(openPositionSummary['totalEquityValue'], 2)
 
 
-def getAllOpenPositions():
+def buildOpenPositionsSummary(stockPositions, symbolsByInstrumentURL, cryptoPositions, quotes):
     openPositionsSummary = {"totalEquityValue": 0, "positions": [] }
 
     openPositions = openPositionsSummary["positions"]
-    openPosition = {"symbol": None, "quantity": 0,
-                    "price": 0, "equity": 0}
 
     # Append all open stock positions
-    stockPositions = rs.account.get_open_stock_positions()
     for stockPosition in stockPositions:
+        # Positions whose instrument could not be resolved have no symbol
+        # (and so no price or equity)
+        openPositions.append({"symbol": symbolsByInstrumentURL.get(stockPosition["instrument"]),
+                              "quantity": float(stockPosition["quantity"]),
+                              "price": 0, "equity": 0})
 
-        # Create deep copy of openPosition template
-        postionToBeAdded = copy.deepcopy(openPosition)
+    # Append all open crypto positions
+    for cryptoPosition in cryptoPositions:
+        openPositions.append({"symbol": cryptoPosition["currency"]["code"],
+                              "quantity": float(cryptoPosition["quantity"]),
+                              "price": 0, "equity": 0})
 
-        # Get all stock position details
-        postionToBeAdded["symbol"] = getSymbolFromInstrumentURL(
-            stockPosition["instrument"])
-        postionToBeAdded["quantity"] = float(stockPosition["quantity"])
-        postionToBeAdded["price"] = getQuoteOfSymbol(
-            postionToBeAdded["symbol"])
-        if postionToBeAdded["price"] is not None:
+    for openPosition in openPositions:
+        openPosition["price"] = quotes.get(openPosition["symbol"])
+        if openPosition["price"] is not None:
             # Update equity value in positions array
-            postionToBeAdded["equity"] = postionToBeAdded["price"] * postionToBeAdded["quantity"]
+            openPosition["equity"] = openPosition["price"] * openPosition["quantity"]
 
             # Update total equity value
-            openPositionsSummary["totalEquityValue"] += postionToBeAdded["equity"]
+            openPositionsSummary["totalEquityValue"] += openPosition["equity"]
         else:
-            postionToBeAdded["equity"] = None
+            openPosition["equity"] = None
 
-        openPositions.append(postionToBeAdded)
+    return openPositionsSummary
 
-    # Append all open crypto positions
-    cryptoPositions = rs.crypto.get_crypto_positions()
 
-    for cryptoPosition in cryptoPositions:
-        # Create deep copy of openPosition template
-        postionToBeAdded = copy.deepcopy(openPosition)
-
-        # Get all crypto position details
-        postionToBeAdded["symbol"] = cryptoPosition["currency"]["code"]
-        postionToBeAdded["quantity"] = float(cryptoPosition["quantity"])
-        postionToBeAdded["price"] = getQuoteOfSymbol(
-            postionToBeAdded["symbol"])
-        if postionToBeAdded["price"] is not None:
-            # Update equity value in positions array
-            postionToBeAdded["equity"] = postionToBeAdded["price"] * postionToBeAdded["quantity"]
+def getAllOpenPositionsSequentially():
+    # Retrieve all open stock positions (instrument URLs are resolved in bulk)
+    stockPositions = callBroker(rs.account.get_open_stock_positions)
+    symbolsByInstrumentURL = resolveInstrumentURLs(
+        [stockPosition["instrument"] for stockPosition in stockPositions])
+    stockSymbols = [symbolsByInstrumentURL[stockPosition["instrument"]]
+                    for stockPosition in stockPositions
+                    if stockPosition["instrument"] in symbolsByInstrumentURL]
+
+    # Retrieve all open crypto positions
+    cryptoPositions = callBroker(rs.crypto.get_crypto_positions)
+    cryptoSymbols = [cryptoPosition["currency"]["code"]
+                     for cryptoPosition in cryptoPositions]
+
+    # Positions are authoritative for the asset class of their symbols
+    registerAssetClasses({symbol: ASSET_CLASS_STOCK for symbol in stockSymbols})
+    registerAssetClasses({symbol: ASSET_CLASS_CRYPTO for symbol in cryptoSymbols})
+
+    # Quote every position in bulk
+    quotes = getQuotesOfSymbols(stockSymbols + cryptoSymbols)
+
+    return buildOpenPositionsSummary(stockPositions, symbolsByInstrumentURL,
+                                     cryptoPositions, quotes)
 
-            # Update total equity value
-            openPositionsSummary["totalEquityValue"] += postionToBeAdded["equity"]
-        else:
-            postionToBeAdded["equity"] = None
-        
-        openPositions.append(postionToBeAdded)
-    
-    return openPositionsSummary
+
+def getAllOpenPositionsConcurrently(maxWorkers):
+    # Only this thread submits work to the pool and waits on it, so pool
+    # tasks never block on each other
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+
+        # Retrieve both position lists at once
+        stockPositionsFuture = executor.submit(callBroker, rs.account.get_open_stock_positions)
+        cryptoPositionsFuture = executor.submit(callBroker, rs.crypto.get_crypto_positions)
+
+        # Crypto positions already carry their symbols, so they can be quoted
+        # while stock instrument URLs are being resolved
+        cryptoPositions = cryptoPositionsFuture.result()
+        cryptoSymbols = list(dict.fromkeys(cryptoPosition["currency"]["code"]
+                                           for cryptoPosition in cryptoPositions))
+        cryptoQuotesFuture = executor.submit(getCryptoQuotes, cryptoSymbols) if cryptoSymbols else None
+
+        stockPositions = stockPositionsFuture.result()
+        symbolsByInstrumentURL = resolveInstrumentURLs(
+            [stockPosition["instrument"] for stockPosition in stockPositions])
+        stockSymbols = list(dict.fromkeys(symbolsByInstrumentURL[stockPosition["instrument"]]
+                                          for stockPosition in stockPositions
+                                          if stockPosition["instrument"] in symbolsByInstrumentURL))
+
+        # Stock quotes are requested one bulk chunk per task
+        stockQuotesFutures = [executor.submit(getStockQuotes, chunk)
+                              for chunk in chunkList(stockSymbols)]
+
+        # Positions are authoritative for the asset class of their symbols
+        registerAssetClasses({symbol: ASSET_CLASS_STOCK for symbol in stockSymbols})
+        registerAssetClasses({symbol: ASSET_CLASS_CRYPTO for symbol in cryptoSymbols})
+
+        quotes = {}
+        for stockQuotesFuture in stockQuotesFutures:
+            quotes.update(stockQuotesFuture.result())
+        if cryptoQuotesFuture is not None:
+            quotes.update(cryptoQuotesFuture.result())
+
+    return buildOpenPositionsSummary(stockPositions, symbolsByInstrumentURL,
+                                     cryptoPositions, quotes)
+
+
+def getAllOpenPositions(maxWorkers=None):
+    maxWorkers = maxWorkers if maxWorkers is not None else VALUATION_MAX_WORKERS
+
+    if maxWorkers > 1:
+        return getAllOpenPositionsConcurrently(maxWorkers=maxWorkers)
+    return getAllOpenPositionsSequentially()
 
 
 def getAccountBuyingPower():
-    generalAccountInfo = rs.account.load_phoenix_account()
+    generalAccountInfo = callBroker(rs.account.load_phoenix_account)
 
     accountBuyingPower = generalAccountInfo['account_buying_power']['amount']
 
+    cash = None
     if accountBuyingPower is not None:
         cash = round(float(accountBuyingPower), 2)
     return cash
@@ -144,48 +758,48 @@ def depositFundsToAccount(amount):
     # print("DEPOSIT CURRENTLY LIMITED TO $0.50")
     # amount = 0.50
 
-    resp = rs.deposit_funds_to_robinhood_account(
-        ach_relationship=MAIN_BANK_ACCOUNT_URL, amount=amount)
+    resp = callBroker(
+        rs.deposit_funds_to_robinhood_account, ach_relationship=MAIN_BANK_ACCOUNT_URL, amount=amount)
     print(resp)
 
-    if resp is not None:
-        print(f"Desposit of {amount} from main bank account SUCCESSFUL!")
-    else:
+    if not isAcceptedResponse(resp):
         print(f"Desposit of {amount} from main bank account UNSUCCESSFUL!")
+        raise getResponseError(resp, f"Deposit of {amount} failed")
+
+    print(f"Desposit of {amount} from main bank account SUCCESSFUL!")
+    return resp
 
 def buyFractionalSharesByPrice(symbol, amountInDollars):
     resp = None
-    if (isCrypto(symbol)):
-        resp = rs.orders.order_buy_crypto_by_price(symbol=symbol, amountInDollars=amountInDollars)
-    elif(isStock(symbol)):
-        resp = rs.orders.order_buy_fractional_by_price(symbol=symbol, amountInDollars=amountInDollars)
+    assetClass = getAssetClassOfSymbol(symbol)
+    if (assetClass == ASSET_CLASS_CRYPTO):
+        resp = callBroker(rs.orders.order_buy_crypto_by_price, symbol=symbol, amountInDollars=amountInDollars)
+    elif(assetClass == ASSET_CLASS_STOCK):
+        resp = callBroker(rs.orders.order_buy_fractional_by_price, symbol=symbol, amountInDollars=amountInDollars)
 
     print(resp)
-    if resp is not None:
-        print(f"SUCESSFULLY BOUGHT ${amountInDollars} of {symbol}!")
-        resp = json.dumps(resp, indent = 3)
-    else:
+    if not isAcceptedResponse(resp):
         print(f"FAILED TO BUY ${amountInDollars} of {symbol}!")
+        raise getResponseError(resp, f"Buy of ${amountInDollars} of {symbol} failed")
 
-    
-
-    return resp
+    print(f"SUCESSFULLY BOUGHT ${amountInDollars} of {symbol}!")
+    return json.dumps(resp, indent = 3)
 
 def sellFractionalSharesByQuantity(symbol, quantity):
     resp = None
-    if (isCrypto(symbol)):
-        resp = rs.orders.order_sell_crypto_by_quantity(symbol=symbol, quantity=quantity)
-    elif(isStock(symbol)):
-        resp = rs.orders.order_sell_fractional_by_quantity(symbol=symbol, quantity=quantity)
+    assetClass = getAssetClassOfSymbol(symbol)
+    if (assetClass == ASSET_CLASS_CRYPTO):
+        resp = callBroker(rs.orders.order_sell_crypto_by_quantity, symbol=symbol, quantity=quantity)
+    elif(assetClass == ASSET_CLASS_STOCK):
+        resp = callBroker(rs.orders.order_sell_fractional_by_quantity, symbol=symbol, quantity=quantity)
 
     print(resp)
-    if resp is not None:
-        print(f"SUCESSFULLY SOLD ${amountInDollars} SHARES OF {symbol}!")
-        resp = json.dumps(resp, indent = 3)
-    else:
-        print(f"FAILED TO BUY ${amountInDollars} OF {symbol}!")
+    if not isAcceptedResponse(resp):
+        print(f"FAILED TO SELL {quantity} SHARES OF {symbol}!")
+        raise getResponseError(resp, f"Sale of {quantity} shares of {symbol} failed")
 
-    return resp
+    print(f"SUCESSFULLY SOLD {quantity} SHARES OF {symbol}!")
+    return json.dumps(resp, indent = 3)
 
 def sellAllOpenPositions():
     openPositionsSummary = getAllOpenPositions()
@@ -194,8 +808,15 @@ def sellAllOpenPositions():
     for openPosition in openPositions:
         quantityToBeSold = openPosition['quantity']
         symbol = openPosition['symbol']
+        if symbol is None:
+            print(f"Skipping position of {quantityToBeSold} shares with an unresolved instrument")
+            continue
         print(f"Selling {quantityToBeSold} shares or {symbol}")
-        sellFractionalSharesByQuantity(symbol=symbol, quantity=quantityToBeSold)
+        try:
+            sellFractionalSharesByQuantity(symbol=symbol, quantity=quantityToBeSold)
+        except BrokerOrderError as e:
+            # Keep liquidating the remaining positions
+            print(e)
 
     print("All open positions liquidated!")
 
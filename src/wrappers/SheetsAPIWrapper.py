@@ -1,10 +1,17 @@
 from __future__ import print_function
 import pickle
 import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+import os
 import json
+import sys
+import time
+
+# When run standalone (python src/wrappers/SheetsAPIWrapper.py) the modules
+# shared with src/ are not on the path yet
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cassette
 
 """
 *Module description*
@@ -12,7 +19,8 @@ import json
 
 # Declare instance variables and constants here
 # If modifying these scopes, delete the file token.pickle.
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly',
+          'https://www.googleapis.com/auth/drive.metadata.readonly']
 
 # The ID and range of a sample spreadsheet.
 SPREADSHEET_ID = '1ZKgiY01HxvmRCREcWGUaAkocXzzuMYhEZk9SKjVGkQo'
@@ -24,11 +32,42 @@ ASSET_FIELDS_ROW = 4
 
 INDEX_TO_COLUMN_LETTER_BUFFER = 65
 
+# Optional column holding the cadence of each row (Daily, Weekly, Biweekly or
+# Monthly); rows without one are invested weekly. The Weekly Investment value
+# of a row is the amount invested on each of its scheduled runs.
+CADENCE_FIELD = "Cadence"
+
+# Only the header row and these columns are ever read from the spreadsheet, so
+# the targeted fetch requests nothing else
+SYMBOL_FIELD = "Symbol"
+WEEKLY_INVESTMENT_FIELD = "Weekly Investment"
+TARGETED_FIELDS = [SYMBOL_FIELD, WEEKLY_INVESTMENT_FIELD, CADENCE_FIELD]
+
+# When True, GRID_INDEX is built from a field-masked batchGet of
+# the needed value ranges instead of downloading the full grid data
+FETCH_TARGETED_RANGES = True
+
+# Local snapshot of the parsed recurring investments and Main total, so that
+# runs do not refetch a spreadsheet that rarely changes
+SNAPSHOT_FILE_PATH = './investments/sheets-snapshot.json'
+
+# Snapshots younger than this are used without contacting Google at all
+SNAPSHOT_TTL_SECONDS = 6 * 60 * 60
+
+# When True, the snapshot is ignored and the spreadsheet is always refetched
+# (set by the --refresh-sheets option of main.py)
+REFRESH_SNAPSHOT = False
+
+# Snapshots written in a different format are refetched
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def getAuthorizedCreds():
+    # Google client libraries are only imported once a service is actually
+    # needed so that importing this module stays cheap
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
 
-def buildAuthorizedService():
-    """Shows basic usage of the Sheets API.
-    Prints values from a sample spreadsheet.
-    """
     creds = None
     # The file token.pickle stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -48,13 +87,57 @@ def buildAuthorizedService():
         with open(PICKLE_FILE_PATH, 'wb') as token:
             pickle.dump(creds, token)
 
-    service = build('sheets', 'v4', credentials=creds)
+    return creds
+
+
+def getServiceAuthorization():
+    # Replayed cassettes need no credentials (requests are answered from the
+    # cassette by an unauthorized httplib2.Http)
+    if cassette.isReplaying():
+        import httplib2
+
+        return {"http": httplib2.Http()}
+    return {"credentials": getAuthorizedCreds()}
+
+
+def buildAuthorizedService():
+    """Shows basic usage of the Sheets API.
+    Prints values from a sample spreadsheet.
+    """
+    from googleapiclient.discovery import build
+
+    service = build('sheets', 'v4', **getServiceAuthorization())
 
     return service
 
 
-def getFullSpreadsheet():
-    authorizedService = buildAuthorizedService()
+def buildAuthorizedDriveService():
+    from googleapiclient.discovery import build
+
+    service = build('drive', 'v3', **getServiceAuthorization())
+
+    return service
+
+
+def getSpreadsheetRevision(driveService=None):
+    # The Drive file version increases on every edit of the spreadsheet
+    try:
+        authorizedService = driveService if driveService is not None else buildAuthorizedDriveService()
+        metadata = authorizedService.files().get(
+            fileId=SPREADSHEET_ID, fields="version").execute()
+        return metadata.get("version")
+    except Exception as e:
+        # Tokens created before the Drive scope was added cannot read the
+        # revision, in which case the snapshot only expires through its TTL
+        print(f"WARNING: unable to determine spreadsheet revision ({e}), so the "
+              f"snapshot is refetched every {SNAPSHOT_TTL_SECONDS} seconds even "
+              f"when the spreadsheet is unchanged. If the Google token predates "
+              f"the Drive scope, delete {PICKLE_FILE_PATH} to re-authorise.")
+        return None
+
+
+def getFullSpreadsheet(service=None):
+    authorizedService = service if service is not None else buildAuthorizedService()
     spreadsheet = authorizedService.spreadsheets()
     spreadsheet = spreadsheet.get(
         spreadsheetId=SPREADSHEET_ID, includeGridData=True).execute()
@@ -62,30 +145,177 @@ def getFullSpreadsheet():
     return spreadsheet
 
 
+def indexToColumnLetter(index):
+    return chr(index + INDEX_TO_COLUMN_LETTER_BUFFER)
+
+
+def columnLetterToIndex(columnLetter):
+    return ord(columnLetter) - INDEX_TO_COLUMN_LETTER_BUFFER
+
+
+def quoteSheetName(sheetName):
+    # A1 notation requires single quotes around sheet names (with embedded
+    # quotes doubled)
+    escapedSheetName = sheetName.replace("'", "''")
+    return f"'{escapedSheetName}'"
+
+
+def normalizeRangeValue(value):
+    # The values API returns "" for empty cells where the grid data omits
+    # effectiveValue entirely
+    return None if value == "" else value
+
+
+def getTargetedSpreadsheet(service=None):
+    authorizedService = service if service is not None else buildAuthorizedService()
+    spreadsheet = authorizedService.spreadsheets()
+
+    # Only sheet titles are needed from the spreadsheet metadata
+    metadata = spreadsheet.get(
+        spreadsheetId=SPREADSHEET_ID,
+        fields="spreadsheetId,sheets.properties.title").execute()
+    sheetNames = [sheet["properties"]["title"]
+                  for sheet in metadata.get("sheets", [])]
+
+    # Retrieve the asset fields row of every sheet in a single request
+    headerRanges = [f"{quoteSheetName(sheetName)}!{ASSET_FIELDS_ROW}:{ASSET_FIELDS_ROW}"
+                    for sheetName in sheetNames]
+    headerResp = spreadsheet.values().batchGet(
+        spreadsheetId=SPREADSHEET_ID, ranges=headerRanges,
+        majorDimension="ROWS", valueRenderOption="UNFORMATTED_VALUE",
+        fields="valueRanges(values)").execute()
+
+    headers = {}
+    for sheetName, valueRange in zip(sheetNames, headerResp.get("valueRanges", [])):
+        rows = valueRange.get("values", [])
+        headers[sheetName] = [normalizeRangeValue(value)
+                              for value in (rows[0] if rows else [])]
+
+    # Determine which columns are needed in every sheet
+    columnRanges = []
+    columnTargets = []
+    for sheetName in sheetNames:
+        for field in TARGETED_FIELDS:
+            if field in headers[sheetName]:
+                columnIndex = headers[sheetName].index(field)
+                columnLetter = indexToColumnLetter(columnIndex)
+                columnRanges.append(
+                    f"{quoteSheetName(sheetName)}!{columnLetter}:{columnLetter}")
+                columnTargets.append((sheetName, columnIndex))
+
+    # Retrieve all target columns in a single request
+    columnValueRanges = []
+    if columnRanges:
+        columnResp = spreadsheet.values().batchGet(
+            spreadsheetId=SPREADSHEET_ID, ranges=columnRanges,
+            majorDimension="COLUMNS", valueRenderOption="UNFORMATTED_VALUE",
+            fields="valueRanges(values)").execute()
+        columnValueRanges = columnResp.get("valueRanges", [])
+
+    columns = {sheetName: {} for sheetName in sheetNames}
+    for (sheetName, columnIndex), valueRange in zip(columnTargets, columnValueRanges):
+        cols = valueRange.get("values", [])
+        columns[sheetName][columnIndex] = [normalizeRangeValue(value)
+                                           for value in (cols[0] if cols else [])]
+
+    return {"spreadsheetId": metadata.get("spreadsheetId", SPREADSHEET_ID),
+            "sheetNames": sheetNames,
+            "headers": headers,
+            "columns": columns}
+
+
+def buildGridIndexFromTargetedSpreadsheet(targetedSpreadsheet):
+    # Builds the same grid index as buildGridIndex, with only the asset fields
+    # row and the targeted columns populated
+    sheetsByName = {}
+    valuesByName = {}
+
+    for sheetName in targetedSpreadsheet["sheetNames"]:
+        sheetsByName[sheetName] = {"properties": {"title": sheetName}}
+
+        header = targetedSpreadsheet["headers"][sheetName]
+        columns = targetedSpreadsheet["columns"][sheetName]
+
+        totRows = max([ASSET_FIELDS_ROW] +
+                      [len(column) for column in columns.values()])
+        totCols = max([len(header)] +
+                      [columnIndex + 1 for columnIndex in columns])
+
+        matrix = [[None] * totCols for _ in range(totRows)]
+        for colVal, value in enumerate(header):
+            matrix[ASSET_FIELDS_ROW - 1][colVal] = value
+        for colVal, column in columns.items():
+            for rowVal, value in enumerate(column):
+                matrix[rowVal][colVal] = value
+
+        valuesByName[sheetName] = matrix
+
+    return {"sheets": sheetsByName, "values": valuesByName}
+
+
+def fetchGridIndex(service=None):
+    if FETCH_TARGETED_RANGES:
+        return buildGridIndexFromTargetedSpreadsheet(
+            getTargetedSpreadsheet(service=service))
+    return buildGridIndex(getFullSpreadsheet(service=service))
+
+
+def buildGridIndex(spreadsheet):
+    # Builds a lookup of sheet name -> sheet and a dense matrix of effective
+    # values for every sheet so that cell, row and column reads never have to
+    # rescan the raw spreadsheet response
+    sheetsByName = {}
+    valuesByName = {}
+
+    for sheet in spreadsheet["sheets"]:
+        sheetName = sheet["properties"]["title"]
+        sheetsByName[sheetName] = sheet
+
+        rowData = sheet["data"][0].get("rowData", [])
+
+        # Sheets omits trailing empty cells, so pad every row to the widest
+        # row in the sheet
+        totCols = max((len(row.get("values", [])) for row in rowData),
+                      default=0)
+
+        matrix = []
+        for row in rowData:
+            rowValues = []
+            for cell in row.get("values", []):
+                cellValue = None
+                if "effectiveValue" in cell:
+                    # Obtain first value in effectiveValue dictionary
+                    cellValue = next(iter(cell["effectiveValue"].values()))
+                rowValues.append(cellValue)
+            rowValues.extend([None] * (totCols - len(rowValues)))
+            matrix.append(rowValues)
+
+        valuesByName[sheetName] = matrix
+
+    return {"sheets": sheetsByName, "values": valuesByName}
+
+
 # Since only one spreadsheet is used for this application, the script has a
-# global spreadsheet constant
-SPREADSHEET = getFullSpreadsheet()
+# global grid index that is fetched on first use and reused for all cell
+# lookups
+GRID_INDEX = None
 
 
-def getAllSheetNames():
+def getGridIndex():
+    global GRID_INDEX
+    if GRID_INDEX is None:
+        GRID_INDEX = fetchGridIndex()
+    return GRID_INDEX
 
-    # Call the Sheets API
-    result = SPREADSHEET["sheets"]
 
-    sheetNames = []
-    for i in range(len(result)):
-        sheetName = result[i]["properties"]["title"]
-        # print(sheetName)
-        sheetNames.append(sheetName)
+def getAllSheetNames():
 
-    return sheetNames
+    # Sheet names are kept in spreadsheet order by the grid index
+    return list(getGridIndex()["sheets"].keys())
 
 
 def getSheetAssetFields(sheetName):
 
-    # Obtain sheet by name
-    sheet = getSheetByName(sheetName=sheetName)
-
     # Obtain asset fields
     sheetAssetFields = getAllCellValuesInRow(
         sheetRow=ASSET_FIELDS_ROW, sheetName=sheetName)
@@ -93,17 +323,24 @@ def getSheetAssetFields(sheetName):
     return sheetAssetFields
 
 
-def indexToColumnLetter(index):
-    return chr(index + INDEX_TO_COLUMN_LETTER_BUFFER)
-
-
-def columnLetterToIndex(columnLetter):
-    return ord(columnLetter) - INDEX_TO_COLUMN_LETTER_BUFFER
+def getViableRowRange(symbolsColumnValues):
+    # Iterate through all symbolsColumnValues to determine range of rows
+    # that contain viable values
+    viableRowRange = {"start": None, "end": None}
+    for i in range(len(symbolsColumnValues)):
+        # Determine start of viable row range
+        if (symbolsColumnValues[i]) == SYMBOL_FIELD:
+            viableRowRange["start"] = i + 1
+        # Determine end of viable row range (first instance of None AFTER # "Symbol")
+        # Executes only if START HAS BEEN ESTABLISHED AND END INDEX HAS  #
+        # NOT YET BEEN ESTABLISHED
+        elif viableRowRange["start"] is not None and viableRowRange["end"] is None and (symbolsColumnValues[i]) is None:
+            viableRowRange["end"] = i
 
+    return viableRowRange["start"], viableRowRange["end"]
 
-def getAllRecurringInvestments():
 
-    fullSpreadsheet = SPREADSHEET
+def parseRecurringInvestmentsByCategory():
 
     # Retrieve all sheet names
     assetCategories = getAllSheetNames()
@@ -111,11 +348,9 @@ def getAllRecurringInvestments():
 
     # print(assetCategories)
 
-    recurringInvestments = {}
+    recurringInvestmentsByCategory = {}
     for assetCategory in assetCategories:
 
-        sheet = getSheetByName(sheetName=assetCategory)
-
         # Identify fields for the asset category
         assetCategoryFields = getAllCellValuesInRow(
             sheetRow=ASSET_FIELDS_ROW, sheetName=assetCategory)
@@ -123,20 +358,18 @@ def getAllRecurringInvestments():
 
         # Determine column letter corresponding with the Symbols in the asset
         # category
-        symbolsColumnIndex = assetCategoryFields.index("Symbol")
+        symbolsColumnIndex = assetCategoryFields.index(SYMBOL_FIELD)
         symbolsColumnLetter = indexToColumnLetter(symbolsColumnIndex)
         # print(symbolsColumnLetter)
 
         # Determine column letter corresponding with the Weekly Investment
         # values in the asset category
         weeklyInvestmentColumnIndex = assetCategoryFields.index(
-            "Weekly Investment")
+            WEEKLY_INVESTMENT_FIELD)
         weeklyInvestmentColumnLetter = indexToColumnLetter(
             weeklyInvestmentColumnIndex)
         # print(weeklyInvestmentColumnLetter)
 
-        # Determine rows that contain viable values
-
         # Identify ALL values in Symbols column
         symbolsColumnValues = getAllCellValuesInColumn(
             sheetColumn=symbolsColumnLetter, sheetName=assetCategory)
@@ -147,22 +380,10 @@ def getAllRecurringInvestments():
             sheetColumn=weeklyInvestmentColumnLetter, sheetName=assetCategory)
         # print(weeklyInvestmentColumnValues)
 
-        # Iterate through all symbolsColumnValues to determine range of rows
-        # that contain viable values
-        viableRowRange = {"start": None, "end": None}
-        for i in range(len(symbolsColumnValues)):
-            # Determine start of viable row range
-            if (symbolsColumnValues[i]) == "Symbol":
-                viableRowRange["start"] = i + 1
-            # Determine end of viable row range (first instance of None AFTER # "Symbol")
-            # Executes only if START HAS BEEN ESTABLISHED AND END INDEX HAS  #
-            # NOT YET BEEN ESTABLISHED
-            elif viableRowRange["start"] is not None and viableRowRange["end"] is None and (symbolsColumnValues[i]) is None:
-                viableRowRange["end"] = i
+        # Determine rows that contain viable values
+        startRange, endRange = getViableRowRange(symbolsColumnValues)
 
         # Match Symbol to Weekly Investment Amount
-        startRange = viableRowRange["start"]
-        endRange = viableRowRange["end"]
         viableSymbols = symbolsColumnValues[startRange:endRange]
         viableInvestmentAmounts = weeklyInvestmentColumnValues[startRange:endRange]
 
@@ -170,13 +391,55 @@ def getAllRecurringInvestments():
         recurringInvestmentsForCategory = dict(
             zip(viableSymbols, viableInvestmentAmounts))
 
+        recurringInvestmentsByCategory[assetCategory] = recurringInvestmentsForCategory
+
+    return recurringInvestmentsByCategory
+
+
+def parseRecurringInvestmentCadences():
+    # Returns a symbol -> cadence mapping, read from the optional Cadence column
+    # of every asset category (empty cells are None)
+    assetCategories = getAllSheetNames()
+    assetCategories.remove("Main")
+
+    recurringInvestmentCadences = {}
+    for assetCategory in assetCategories:
+        assetCategoryFields = getAllCellValuesInRow(
+            sheetRow=ASSET_FIELDS_ROW, sheetName=assetCategory)
+
+        symbolsColumnValues = getAllCellValuesInColumn(
+            sheetColumn=indexToColumnLetter(
+                assetCategoryFields.index(SYMBOL_FIELD)),
+            sheetName=assetCategory)
+        startRange, endRange = getViableRowRange(symbolsColumnValues)
+        viableSymbols = symbolsColumnValues[startRange:endRange]
+
+        if CADENCE_FIELD in assetCategoryFields:
+            cadenceColumnValues = getAllCellValuesInColumn(
+                sheetColumn=indexToColumnLetter(
+                    assetCategoryFields.index(CADENCE_FIELD)),
+                sheetName=assetCategory)
+            viableCadences = cadenceColumnValues[startRange:endRange]
+        else:
+            viableCadences = []
+
+        for i, symbol in enumerate(viableSymbols):
+            recurringInvestmentCadences[symbol] = (viableCadences[i]
+                                                   if i < len(viableCadences) else None)
+
+    return recurringInvestmentCadences
+
+
+def parseAllRecurringInvestments():
+    recurringInvestments = {}
+    for recurringInvestmentsForCategory in parseRecurringInvestmentsByCategory().values():
         # Merge with existing recurringInvestments dictionary
         recurringInvestments.update(recurringInvestmentsForCategory)
 
     return recurringInvestments
 
 
-def getTotalRecurringInvestmentsValue():
+def parseTotalRecurringInvestmentsValue():
 
     totalRecurringInvestmentsValue = None
 
@@ -186,7 +449,7 @@ def getTotalRecurringInvestmentsValue():
 
     # Get total value of weekly investments
     weeklyInvestmentColumnIndex = mainPortfolioFields.index(
-        "Weekly Investment")
+        WEEKLY_INVESTMENT_FIELD)
     weeklyInvestmentColumnLetter = indexToColumnLetter(
         weeklyInvestmentColumnIndex)
 
@@ -212,24 +475,132 @@ def getTotalRecurringInvestmentsValue():
     # at the TOTAL VALUE CELL
 
 
+def getSheetValues(sheetName):
+    values = getGridIndex()["values"].get(sheetName)
+    if values is None:
+        print(f"No sheet found with name \"{sheetName}\"")
+    return values
+
+
+def loadSnapshot():
+    if not os.path.exists(SNAPSHOT_FILE_PATH):
+        return None
+    try:
+        with open(SNAPSHOT_FILE_PATH) as file:
+            return json.load(file)
+    except ValueError:
+        # A corrupt snapshot is treated as missing
+        return None
+
+
+def writeSnapshot(snapshot):
+    # Write to a temporary file first so that an interrupted write never
+    # leaves a partial snapshot behind
+    tempFilePath = f"{SNAPSHOT_FILE_PATH}.tmp"
+    with open(tempFilePath, "w") as file:
+        json.dump(snapshot, file)
+    os.replace(tempFilePath, SNAPSHOT_FILE_PATH)
+
+
+def fetchSnapshot(revision=None):
+    # The snapshot is being refetched because the spreadsheet may have
+    # changed, so the grid index held in memory (e.g. since the previous run
+    # of a long-lived process) is refetched as well
+    global GRID_INDEX
+    GRID_INDEX = None
+
+    recurringInvestmentsByCategory = parseRecurringInvestmentsByCategory()
+
+    recurringInvestments = {}
+    for recurringInvestmentsForCategory in recurringInvestmentsByCategory.values():
+        recurringInvestments.update(recurringInvestmentsForCategory)
+
+    snapshot = {"formatVersion": SNAPSHOT_FORMAT_VERSION,
+                "spreadsheetId": SPREADSHEET_ID,
+                "revision": revision,
+                "fetchedAt": time.time(),
+                "recurringInvestments": recurringInvestments,
+                "recurringInvestmentsByCategory": recurringInvestmentsByCategory,
+                "recurringInvestmentCadences": parseRecurringInvestmentCadences(),
+                "totalRecurringInvestmentsValue": parseTotalRecurringInvestmentsValue()}
+
+    writeSnapshot(snapshot)
+
+    return snapshot
+
+
+def loadOrFetchSnapshot(forceRefresh=False):
+    snapshot = None if forceRefresh else loadSnapshot()
+
+    if (snapshot is not None and snapshot.get("formatVersion") == SNAPSHOT_FORMAT_VERSION
+            and snapshot.get("spreadsheetId") == SPREADSHEET_ID):
+
+        # Snapshot within TTL is used without any network access
+        if time.time() - snapshot["fetchedAt"] < SNAPSHOT_TTL_SECONDS:
+            print("Using cached spreadsheet snapshot....")
+            return snapshot
+
+        # Snapshot of an unchanged spreadsheet is renewed for another TTL
+        revision = getSpreadsheetRevision()
+        if revision is not None and revision == snapshot.get("revision"):
+            print("Spreadsheet unchanged, renewing cached snapshot....")
+            snapshot["fetchedAt"] = time.time()
+            writeSnapshot(snapshot)
+            return snapshot
+    else:
+        revision = getSpreadsheetRevision()
+
+    print("Fetching spreadsheet....")
+    return fetchSnapshot(revision=revision)
+
+
+# Parsed snapshot used by getAllRecurringInvestments and
+# getTotalRecurringInvestmentsValue (loaded on first use)
+SNAPSHOT = None
+
+
+def getSnapshot():
+    global SNAPSHOT
+    if SNAPSHOT is None:
+        SNAPSHOT = loadOrFetchSnapshot(forceRefresh=REFRESH_SNAPSHOT)
+    return SNAPSHOT
+
+
+def getAllRecurringInvestments():
+    return dict(getSnapshot()["recurringInvestments"])
+
+
+def getTotalRecurringInvestmentsValue():
+    return getSnapshot()["totalRecurringInvestmentsValue"]
+
+
+def getRecurringInvestmentCadences():
+    # Returns a symbol -> cadence mapping (raw spreadsheet values, None where
+    # the cell is empty)
+    return dict(getSnapshot()["recurringInvestmentCadences"])
+
+
+def getRecurringInvestmentCategories():
+    # Returns a symbol -> asset category (sheet name) mapping
+    symbolCategories = {}
+    for assetCategory, recurringInvestmentsForCategory in getSnapshot()["recurringInvestmentsByCategory"].items():
+        for symbol in recurringInvestmentsForCategory:
+            symbolCategories[symbol] = assetCategory
+
+    return symbolCategories
+
+
 def getCellValue(sheetCoord, sheetName):
 
-    sheet = getSheetByName(sheetName)
+    values = getSheetValues(sheetName)
 
-    if (sheet != None):
+    if (values != None):
 
         # Sheet coord should be of the form 'A1'
         colVal = columnLetterToIndex(sheetCoord[0])
         rowVal = int(sheetCoord[1:]) - 1
 
-        rawData = sheet["data"][0]["rowData"]
-
-        cell = rawData[rowVal]["values"][colVal]
-        cellValue = None
-
-        if "effectiveValue" in cell:
-            # Obtain first value in effectiveValue dictionary
-            cellValue = list(cell["effectiveValue"].values())[0]
+        cellValue = values[rowVal][colVal]
 
         # print(f"{sheetCoord} --> {rowVal}, {colVal} --> {cellValue}")
         return cellValue
@@ -240,45 +611,27 @@ def getCellValue(sheetCoord, sheetName):
 
 
 def getAllCellValuesInColumn(sheetColumn, sheetName):
-    sheet = getSheetByName(sheetName)
+    values = getSheetValues(sheetName)
 
-    totRows = len(sheet["data"][0]["rowData"])
+    colVal = columnLetterToIndex(sheetColumn)
 
-    values = []
-    for rowVal in range(totRows):
-
-        # rowVal + 1 ensured that getCellValue receives the correct coordinates
-        # (rows start at 1 rather than 0)
-        cellCoord = f"{sheetColumn}{rowVal + 1}"
-
-        cellValue = getCellValue(sheetCoord=cellCoord, sheetName=sheetName)
-        values.append(cellValue)
-
-    return values
+    # Column slice is taken straight from the value matrix
+    return [row[colVal] for row in values]
 
 
 def getAllCellValuesInRow(sheetRow, sheetName):
-    sheet = getSheetByName(sheetName)
+    values = getSheetValues(sheetName)
 
-    totCols = len(sheet["data"][0]["rowData"][0]["values"])
-
-    values = []
-    for colVal in range(totCols):
-        cellCoord = f"{indexToColumnLetter(colVal)}{sheetRow}"
-
-        cellValue = getCellValue(sheetCoord=cellCoord, sheetName=sheetName)
-        values.append(cellValue)
-
-    return values
+    # Rows start at 1 rather than 0
+    return list(values[sheetRow - 1])
 
 
 def getSheetByName(sheetName):
 
-    for sheet in SPREADSHEET["sheets"]:
-        if (sheet["properties"]["title"] == sheetName):
-            return sheet
-    print(f"No sheet found with name \"{sheetName}\"")
-    return None
+    sheet = getGridIndex()["sheets"].get(sheetName)
+    if sheet is None:
+        print(f"No sheet found with name \"{sheetName}\"")
+    return sheet
 
 
 def testSanity():
@@ -301,7 +654,7 @@ def testSanity():
     # TODO: Implement more tests for methods
 
     print("\nTest basic retrieve all recurring investments")
-    output = getAllRecurringInvestments()
+    output = parseAllRecurringInvestments()
     resp = "SUCCESS" if isinstance(output, dict) else "FAILED"
     print(resp)
     prettifiedOutput = json.dumps(output, indent=2)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# Modules in src/ import each other as top-level modules (as when running
+# src/main.py), so src/ is put on the path for the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import orderJournal  # noqa: E402
+import orderPipeline  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    # Every test gets its own empty order journal
+    monkeypatch.setattr(orderJournal, "JOURNAL_FILE_PATH", str(tmp_path / "order-journal.jsonl"))
+    monkeypatch.setattr(orderJournal, "LEGACY_PROGRESS_CACHE_FILE_PATH",
+                        str(tmp_path / "investment-history-cache-progress.json"))
+
+
+def sendPendingOrders(submitOrder, maxInFlight=4):
+    # Sends the pending orders of the journal with the same journaling as
+    # main.sendOrdersFromProgressCache
+    orders = [{"symbol": symbol, "amount": amount}
+              for symbol, amount in orderJournal.getPendingOrders().items()]
+    return orderPipeline.submitOrders(
+        orders, submitOrder=submitOrder,
+        onSubmit=orderJournal.recordOrderSubmitted,
+        onResult=orderJournal.recordOrderResult, maxInFlight=maxInFlight,
+        throttledRetryDelaySeconds=0)
+
+
+def getBrokerSubmitOrder(broker):
+    return lambda symbol, amount: broker.buyFractionalSharesByPrice(symbol, amount)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import backtest
+
+
+def buildJanuaryPriceData():
+    # Daily prices of two symbols over January 2024
+    dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-02-01"))
+    symbols = np.array(["A"] * len(dates) + ["B"] * len(dates))
+    prices = np.concatenate([np.full(len(dates), 10.0), np.full(len(dates), 20.0)])
+    return backtest.buildPriceMatrix(symbols, np.concatenate([dates, dates]), prices)
+
+
+def testWeeklyOrdersAreFilledOnScheduledDays():
+    result = backtest.runBacktest(buildJanuaryPriceData(), {"A": 10.0, "B": 20.0},
+                                  initialBankBalance=1000.0)
+
+    # Sundays of January 2024: the 7th, 14th, 21st and 28th
+    assert result["weeks"] == 4
+    assert result["fundedWeeks"] == 4
+    assert result["totalInvested"] == pytest.approx(120.0)
+    assert result["holdings"] == {"A": pytest.approx(4.0), "B": pytest.approx(4.0)}
+    assert result["finalValue"] == pytest.approx(120.0)
+
+
+def testRangeWithoutScheduledDayInvestsNothing():
+    result = backtest.runBacktest(buildJanuaryPriceData(), {"A": 10.0},
+                                  startDate="2024-01-29", initialBankBalance=1000.0)
+
+    assert result["weeks"] == 0
+    assert result["totalInvested"] == 0.0
+    assert result["finalValue"] == 0.0
+    assert result["holdings"] == {}
+    assert not result["equityCurve"].any()
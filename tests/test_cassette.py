@@ -0,0 +1,57 @@
+import json
+
+import cassette
+
+
+ACCOUNT_NUMBER = "5QR12345"
+
+ACCOUNT_URL = f"https://api.robinhood.com/accounts/{ACCOUNT_NUMBER}/"
+
+
+def recordJSON(recorder, method, url, response, body=None):
+    recorder.record(method, url, body, 200, {"content-type": "application/json"},
+                    json.dumps(response).encode("utf-8"), 0.01)
+
+
+def testAccountNumbersAreScrubbedFromURLsAndStrings(tmp_path):
+    path = str(tmp_path / "cassette.json")
+    recorder = cassette.Cassette(path, cassette.RECORD_MODE)
+
+    # The account URL is requested before the response revealing the number
+    recordJSON(recorder, "GET", ACCOUNT_URL, {"buying_power": "10.00"})
+    recordJSON(recorder, "GET", "https://api.robinhood.com/accounts/",
+               {"results": [{"account_number": ACCOUNT_NUMBER, "url": ACCOUNT_URL}]})
+    recordJSON(recorder, "GET", "https://api.robinhood.com/positions/",
+               {"results": [{"account": ACCOUNT_URL, "quantity": "1.5"}]})
+    recordJSON(recorder, "POST", "https://api.robinhood.com/orders/", {"state": "queued"},
+               body=json.dumps({"account": ACCOUNT_URL, "symbol": "VTI"}))
+    recorder.save()
+
+    with open(path) as file:
+        assert ACCOUNT_NUMBER not in file.read()
+
+    # The client requests the URLs built from the scrubbed account number
+    player = cassette.Cassette(path, cassette.REPLAY_MODE)
+    _, _, content = player.replay("GET", "https://api.robinhood.com/accounts/", None)
+    scrubbedAccountURL = json.loads(content)["results"][0]["url"]
+    assert cassette.SCRUBBED_VALUE in scrubbedAccountURL
+
+    _, _, content = player.replay("GET", scrubbedAccountURL.replace("<", "%3C").replace(">", "%3E"), None)
+    assert json.loads(content) == {"buying_power": "10.00"}
+    _, _, content = player.replay("POST", "https://api.robinhood.com/orders/",
+                                  json.dumps({"symbol": "VTI", "account": scrubbedAccountURL}))
+    assert json.loads(content) == {"state": "queued"}
+
+
+def testConnectivityProbeResponseIsNotRecorded(tmp_path):
+    path = str(tmp_path / "cassette.json")
+    recorder = cassette.Cassette(path, cassette.RECORD_MODE)
+    recorder.record("GET", "https://api.myip.com/", None, 200, {},
+                    b'{"ip": "203.0.113.7", "country": "Nowhere"}', 0.01)
+    recorder.save()
+
+    with open(path) as file:
+        assert "203.0.113.7" not in file.read()
+
+    player = cassette.Cassette(path, cassette.REPLAY_MODE)
+    assert player.replay("GET", "https://api.myip.com/", None) == (200, {}, b"")
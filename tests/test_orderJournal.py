@@ -0,0 +1,66 @@
+import pytest
+
+import orderJournal
+
+
+def rejectOrder(symbol, times):
+    for _ in range(times):
+        orderJournal.recordSubmitted(symbol)
+        orderJournal.recordRejected(symbol)
+
+
+def testRejectedOrderIsResentUpToMaxRejections():
+    orderJournal.queueOrders({"A": 1.0, "B": 2.0})
+
+    rejectOrder("A", orderJournal.MAX_ORDER_REJECTIONS - 1)
+    assert orderJournal.getPendingOrders() == {"A": 1.0, "B": 2.0}
+    assert orderJournal.getRejectedOrders() == {}
+
+    rejectOrder("A", 1)
+    assert orderJournal.getPendingOrders() == {"B": 2.0}
+    assert orderJournal.getRejectedOrders() == {"A": 1.0}
+
+
+def testThrottledOrdersDoNotCountAsRejections():
+    orderJournal.queueOrders({"A": 1.0})
+
+    for _ in range(orderJournal.MAX_ORDER_REJECTIONS + 1):
+        orderJournal.recordSubmitted("A")
+        orderJournal.recordFailed("A")
+
+    assert orderJournal.getPendingOrders() == {"A": 1.0}
+
+
+def testCompactionKeepsRejectionCounts():
+    orderJournal.queueOrders({"A": 1.0, "B": 2.0, "C": 3.0})
+    rejectOrder("A", orderJournal.MAX_ORDER_REJECTIONS)
+    rejectOrder("B", 1)
+    orderJournal.recordSubmitted("C")
+    orderJournal.recordAcknowledged("C")
+
+    orderJournal.compactJournal()
+
+    assert orderJournal.getRejectedOrders() == {"A": 1.0}
+    assert orderJournal.getPendingOrders() == {"B": 2.0}
+    rejectOrder("B", orderJournal.MAX_ORDER_REJECTIONS - 1)
+    assert orderJournal.getRejectedOrders() == {"A": 1.0, "B": 2.0}
+
+
+def testRejectedOrderIsResentWithFreshCountOrSkipped():
+    orderJournal.queueOrders({"A": 1.0, "B": 2.0})
+    rejectOrder("A", orderJournal.MAX_ORDER_REJECTIONS)
+    rejectOrder("B", orderJournal.MAX_ORDER_REJECTIONS)
+
+    orderJournal.resolveRejectedOrder("A", resend=True)
+    orderJournal.resolveRejectedOrder("B", resend=False)
+    orderJournal.compactJournal()
+
+    assert orderJournal.getPendingOrders() == {"A": 1.0}
+    assert orderJournal.getRejectedOrders() == {}
+    assert orderJournal.getSkippedOrders() == {"B": 2.0}
+
+    rejectOrder("A", 1)
+    assert orderJournal.getPendingOrders() == {"A": 1.0}
+
+    with pytest.raises(ValueError):
+        orderJournal.resolveRejectedOrder("A", resend=True)
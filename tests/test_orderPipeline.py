@@ -0,0 +1,71 @@
+import threading
+import time
+
+from conftest import getBrokerSubmitOrder, sendPendingOrders
+from simulatedBroker import SimulatedBroker
+import orderJournal
+
+
+ORDERS = {f"SYM{i}": float(i + 1) for i in range(40)}
+
+LATENCY_SECONDS = 0.02
+
+
+def testResultsKeepOrderOfInput():
+    broker = SimulatedBroker(cash=1000, latencySeconds=0.001, latencyJitterSeconds=0.005, seed=1)
+    orderJournal.queueOrders(ORDERS)
+
+    results = sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    assert [(result["symbol"], result["amount"]) for result in results] == list(ORDERS.items())
+
+
+def testOrdersOverlapUpToMaxInFlight():
+    inFlight = {"current": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def submitOrder(symbol, amount):
+        with lock:
+            inFlight["current"] += 1
+            inFlight["peak"] = max(inFlight["peak"], inFlight["current"])
+        time.sleep(LATENCY_SECONDS)
+        with lock:
+            inFlight["current"] -= 1
+
+    orderJournal.queueOrders(ORDERS)
+    startTime = time.perf_counter()
+    sendPendingOrders(submitOrder, maxInFlight=4)
+    elapsedSeconds = time.perf_counter() - startTime
+
+    assert inFlight["peak"] == 4
+    # Sequential submission would take len(ORDERS) * LATENCY_SECONDS
+    assert elapsedSeconds < len(ORDERS) * LATENCY_SECONDS / 2
+
+
+def testPlacedOrdersMatchInputDespiteFailuresAndThrottling():
+    broker = SimulatedBroker(cash=10000, latencySeconds=0.001, throttleProbability=0.2, seed=5)
+    broker.injectFailures("SYM3")
+    broker.injectFailures("SYM17", count=2)
+    orderJournal.queueOrders(ORDERS)
+
+    results = sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    failedSymbols = {result["symbol"] for result in results if result["error"] is not None}
+    assert {"SYM3", "SYM17"} <= failedSymbols
+    assert {fill["symbol"] for fill in broker.fills} == set(ORDERS) - failedSymbols
+
+    # Every order was either acknowledged or journaled as refused or throttled (and is
+    # pending again); none is left unacknowledged
+    assert set(orderJournal.getPendingOrders()) == failedSymbols
+    assert orderJournal.getUnacknowledgedOrders() == {}
+
+    # Resending the pending orders places the rest without placing any order
+    # twice
+    while orderJournal.getPendingOrders():
+        sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    placedAmounts = {}
+    for fill in broker.fills:
+        placedAmounts[fill["symbol"]] = placedAmounts.get(fill["symbol"], 0) + round(fill["amount"], 6)
+    assert placedAmounts == ORDERS
+    assert len(broker.fills) == len(ORDERS)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import performance
+
+
+def computeSymbolPerformance(orderDates, orderAmounts, priceDates, prices, valuationDate):
+    return performance.computePerformance(
+        np.array(["A"] * len(orderDates)), np.array(orderDates, dtype="datetime64[D]"),
+        np.array(orderAmounts, dtype=np.float64),
+        np.array(["A"] * len(priceDates)), np.array(priceDates, dtype="datetime64[D]"),
+        np.array(prices, dtype=np.float64), valuationDate=valuationDate)["A"]
+
+
+def testMoneyWeightedReturnOfSingleOrder():
+    # $100 doubling in exactly a year is a 100% annual return
+    result = computeSymbolPerformance(["2023-01-01"], [100.0],
+                                      ["2023-01-01", "2024-01-01"], [10.0, 20.0],
+                                      valuationDate="2024-01-01")
+
+    assert result["currentValue"] == pytest.approx(200.0)
+    assert result["moneyWeightedReturn"] == pytest.approx(1.0)
+
+
+def testMoneyWeightedReturnIsUndefinedWithoutElapsedTime():
+    result = computeSymbolPerformance(["2024-01-01", "2024-01-01"], [100.0, 50.0],
+                                      ["2024-01-01"], [10.0],
+                                      valuationDate="2024-01-01")
+
+    assert result["currentValue"] == pytest.approx(150.0)
+    assert result["moneyWeightedReturn"] is None
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import preflight
+
+
+def sleepThenReturn(seconds, value):
+    def call():
+        time.sleep(seconds)
+        return value
+    return call
+
+
+def fail():
+    raise RuntimeError("unavailable")
+
+
+def testCallsRunConcurrently():
+    startTime = time.monotonic()
+    results = preflight.runConcurrently({"a": sleepThenReturn(0.2, 1),
+                                         "b": sleepThenReturn(0.2, 2),
+                                         "c": sleepThenReturn(0.2, 3)})
+
+    assert results == {"a": 1, "b": 2, "c": 3}
+    # Latency is that of the slowest call, not the sum
+    assert time.monotonic() - startTime < 0.5
+
+
+def testFailureAndTimeoutRaise():
+    with pytest.raises(RuntimeError):
+        preflight.runConcurrently({"a": sleepThenReturn(0, 1), "b": fail})
+
+    with pytest.raises(preflight.PreflightTimeoutError):
+        preflight.runConcurrently({"a": sleepThenReturn(1, 1)}, timeouts={"a": 0.05})
+
+
+def testErrorsAreReturnedWhenRequested():
+    results = preflight.runConcurrently(
+        {"a": sleepThenReturn(0, 1), "b": fail, "c": sleepThenReturn(1, 3)},
+        timeouts={"c": 0.05}, returnExceptions=True)
+
+    assert results["a"] == 1
+    assert isinstance(results["b"], RuntimeError)
+    assert isinstance(results["c"], preflight.PreflightTimeoutError)
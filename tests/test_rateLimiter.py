@@ -0,0 +1,112 @@
+import pytest
+
+from rateLimiter import RateLimiter
+
+
+class FakeClock:
+    # Time only advances when the limiter sleeps (or the test advances it)
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def buildRateLimiter(fakeClock, **options):
+    parameters = dict(burst=3, ratePerSecond=1.0, minRatePerSecond=0.25,
+                      maxRatePerSecond=2.0, recoveryThreshold=5)
+    parameters.update(options)
+    return RateLimiter(clock=fakeClock.clock, sleep=fakeClock.sleep, **parameters)
+
+
+def testBurstIsServedWithoutWaiting():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+
+    assert [rateLimiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert fakeClock.sleeps == []
+
+    # The bucket is empty, so the next request waits for one token
+    assert rateLimiter.acquire() == pytest.approx(1.0)
+    assert fakeClock.sleeps == [pytest.approx(1.0)]
+
+
+def testBucketRefillsAtRateUpToBurst():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+    for _ in range(3):
+        rateLimiter.acquire()
+
+    fakeClock.advance(2.0)
+    assert [rateLimiter.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert rateLimiter.acquire() == pytest.approx(1.0)
+
+    # Idle time never accumulates more than `burst` tokens
+    fakeClock.advance(100.0)
+    assert [rateLimiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert rateLimiter.acquire() == pytest.approx(1.0)
+
+
+def testThrottledResponseBacksOffAndDrainsBucket():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+
+    rateLimiter.reportThrottled()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(0.5)
+    assert rateLimiter.getStats()["throttled"] == 1
+
+    # The bucket was drained, so even the first request waits for a token at
+    # the reduced rate
+    assert rateLimiter.acquire() == pytest.approx(2.0)
+
+
+def testBackoffIsBoundedByMinimumRate():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+
+    for _ in range(10):
+        rateLimiter.reportThrottled()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(0.25)
+
+
+def testRateRecoversAfterConsecutiveSuccesses():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+    rateLimiter.reportThrottled()
+
+    for _ in range(4):
+        rateLimiter.reportSuccess()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(0.5)
+
+    rateLimiter.reportSuccess()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(0.625)
+    assert rateLimiter.getStats()["rateIncreases"] == 1
+
+
+def testThrottledResponseResetsRecoveryStreak():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+
+    for _ in range(4):
+        rateLimiter.reportSuccess()
+    rateLimiter.reportThrottled()
+    rateLimiter.reportSuccess()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(0.5)
+
+
+def testRecoveryIsBoundedByMaximumRate():
+    fakeClock = FakeClock()
+    rateLimiter = buildRateLimiter(fakeClock)
+
+    for _ in range(100):
+        rateLimiter.reportSuccess()
+    assert rateLimiter.getStats()["ratePerSecond"] == pytest.approx(2.0)
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+import pytest
+
+import historyStore
+import scheduleEngine
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(historyStore, "HISTORY_DB_FILE_PATH", str(tmp_path / "investment-history.db"))
+    monkeypatch.setattr(historyStore, "LEGACY_HISTORY_FILE_PATH", str(tmp_path / "investment-history.json"))
+    monkeypatch.setattr(historyStore, "CONNECTION", None)
+    yield
+    if historyStore.CONNECTION is not None:
+        historyStore.CONNECTION.close()
+
+
+def isDue(cadence, onDate, lastRunDate=None):
+    return scheduleEngine.isCadenceDue(cadence, date.fromisoformat(onDate),
+                                       None if lastRunDate is None else date.fromisoformat(lastRunDate))
+
+
+def testDailyRunIsDueOncePerDay():
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.DAILY_CADENCE, date(2024, 1, 10)) == date(2024, 1, 10)
+    assert isDue(scheduleEngine.DAILY_CADENCE, "2024-01-10", lastRunDate="2024-01-09")
+    assert not isDue(scheduleEngine.DAILY_CADENCE, "2024-01-10", lastRunDate="2024-01-10")
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.DAILY_CADENCE, date(2024, 1, 10)) == date(2024, 1, 11)
+
+
+def testWeeklyRunFallsOnRunWeekday():
+    # 2024-01-07 is a Sunday
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.WEEKLY_CADENCE, date(2024, 1, 7)) == date(2024, 1, 7)
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.WEEKLY_CADENCE, date(2024, 1, 13)) == date(2024, 1, 7)
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.WEEKLY_CADENCE, date(2024, 1, 7)) == date(2024, 1, 14)
+
+    assert isDue(scheduleEngine.WEEKLY_CADENCE, "2024-01-10", lastRunDate="2023-12-31")
+    assert not isDue(scheduleEngine.WEEKLY_CADENCE, "2024-01-10", lastRunDate="2024-01-07")
+
+
+def testBiweeklyRunFallsOnEvenWeeksFromAnchor():
+    # 2024-01-14 is an even number of weeks after BIWEEKLY_ANCHOR_DATE,
+    # 2024-01-07 and 2024-01-21 are not
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 7)) == date(2023, 12, 31)
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 14)) == date(2024, 1, 14)
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 21)) == date(2024, 1, 14)
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 14)) == date(2024, 1, 28)
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 21)) == date(2024, 1, 28)
+
+    assert not isDue(scheduleEngine.BIWEEKLY_CADENCE, "2024-01-16", lastRunDate="2024-01-14")
+    assert isDue(scheduleEngine.BIWEEKLY_CADENCE, "2024-01-16", lastRunDate="2023-12-31")
+
+
+def testMonthlyRunFallsOnFirstRunWeekdayOfMonth():
+    # First Sundays: 2024-01-07, 2024-02-04, 2025-01-05
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.MONTHLY_CADENCE, date(2024, 2, 3)) == date(2024, 1, 7)
+    assert scheduleEngine.getPreviousOccurrence(scheduleEngine.MONTHLY_CADENCE, date(2024, 2, 4)) == date(2024, 2, 4)
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.MONTHLY_CADENCE, date(2024, 1, 7)) == date(2024, 2, 4)
+    assert scheduleEngine.getNextOccurrence(scheduleEngine.MONTHLY_CADENCE, date(2024, 12, 1)) == date(2025, 1, 5)
+
+    assert isDue(scheduleEngine.MONTHLY_CADENCE, "2024-01-08", lastRunDate="2023-12-03")
+    assert not isDue(scheduleEngine.MONTHLY_CADENCE, "2024-01-08", lastRunDate="2024-01-07")
+
+
+@pytest.mark.parametrize("cadence, occurrence", [
+    (scheduleEngine.BIWEEKLY_CADENCE, date(2024, 1, 14)),
+    (scheduleEngine.MONTHLY_CADENCE, date(2024, 1, 7)),
+])
+def testMissedRunIsCaughtUpForMaxCatchUpDays(cadence, occurrence):
+    lastDueDate = occurrence + timedelta(days=scheduleEngine.MAX_CATCH_UP_DAYS)
+
+    assert scheduleEngine.isCadenceDue(cadence, lastDueDate, None)
+    assert not scheduleEngine.isCadenceDue(cadence, lastDueDate + timedelta(days=1), None)
+
+
+def testDueCadencesFollowInvestmentHistory(history):
+    historyStore.addRun(scheduleEngine.WEEKLY_CADENCE, date(2024, 1, 7), {"A": 1.0})
+
+    dueCadences = scheduleEngine.getDueCadences(
+        {scheduleEngine.WEEKLY_CADENCE, scheduleEngine.MONTHLY_CADENCE, scheduleEngine.DAILY_CADENCE},
+        date(2024, 1, 10))
+
+    assert dueCadences == [scheduleEngine.DAILY_CADENCE, scheduleEngine.MONTHLY_CADENCE]
+
+
+def testOrdersWithoutAmountAreSkipped():
+    ordersByCadence = scheduleEngine.groupOrdersByCadence(
+        {"A": None, "B": 2.0, "C": 3.0}, {"C": scheduleEngine.DAILY_CADENCE},
+        [scheduleEngine.WEEKLY_CADENCE, scheduleEngine.DAILY_CADENCE])
+
+    assert ordersByCadence == {scheduleEngine.WEEKLY_CADENCE: {"B": 2.0},
+                               scheduleEngine.DAILY_CADENCE: {"C": 3.0}}
+    assert scheduleEngine.mergeOrders({scheduleEngine.WEEKLY_CADENCE: {"A": None, "B": 2.0},
+                                       scheduleEngine.DAILY_CADENCE: {"B": 1.0}}) == {"B": 3.0}
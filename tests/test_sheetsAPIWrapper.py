@@ -0,0 +1,237 @@
+import pytest
+
+from wrappers import SheetsAPIWrapper
+
+
+# Rows of every sheet as shown in the spreadsheet (None for empty cells)
+SHEETS = {
+    "Main": [[None], [None], [None],
+             ["Category", "Weekly Investment"],
+             ["Bob's Picks", 10],
+             ["Bonds", 5],
+             [None, 15]],
+    "Bob's Picks": [[], [], [],
+                    ["Name", "Symbol", "Weekly Investment", "Cadence"],
+                    ["Apple", "AAPL", 6, "Monthly"],
+                    ["Microsoft", "MSFT", 4],
+                    [],
+                    ["Notes", None, None, "Daily"]],
+    "Bonds": [[], [], [],
+              ["Symbol", "Weekly Investment"],
+              ["BND", 5]],
+}
+
+
+class Request:
+
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+def parseRange(a1Range):
+    # "'Sheet ''name'''!B:B" -> ("Sheet 'name'", "B:B")
+    quotedSheetName, _, cells = a1Range.rpartition("!")
+    assert quotedSheetName.startswith("'") and quotedSheetName.endswith("'")
+    return quotedSheetName[1:-1].replace("''", "'"), cells
+
+
+class FakeValues:
+    # Answers batchGet the way the values API does: trailing empty cells are
+    # omitted and empty cells within a range are ""
+
+    def __init__(self, batchGetCalls):
+        self.batchGetCalls = batchGetCalls
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension, **kwargs):
+        self.batchGetCalls.append({"ranges": list(ranges), "majorDimension": majorDimension})
+
+        valueRanges = []
+        for a1Range in ranges:
+            sheetName, cells = parseRange(a1Range)
+            rows = SHEETS[sheetName]
+            start, _, end = cells.partition(":")
+            assert start == end
+            if start.isdigit():
+                assert majorDimension == "ROWS"
+                values = [[cell for cell in rows[int(start) - 1]]]
+            else:
+                assert majorDimension == "COLUMNS"
+                columnIndex = ord(start) - ord("A")
+                column = [row[columnIndex] if columnIndex < len(row) and row[columnIndex] is not None else ""
+                          for row in rows]
+                while column and column[-1] == "":
+                    column.pop()
+                values = [column]
+            valueRanges.append({"values": values} if values[0] else {})
+
+        return Request({"valueRanges": valueRanges})
+
+
+class FakeSpreadsheets:
+
+    def __init__(self, batchGetCalls):
+        self.batchGetCalls = batchGetCalls
+
+    def get(self, spreadsheetId, fields=None, includeGridData=False):
+        return Request({"spreadsheetId": spreadsheetId,
+                        "sheets": [{"properties": {"title": sheetName}} for sheetName in SHEETS]})
+
+    def values(self):
+        return FakeValues(self.batchGetCalls)
+
+
+class FakeSheetsService:
+
+    def __init__(self):
+        self.batchGetCalls = []
+
+    def spreadsheets(self):
+        return FakeSpreadsheets(self.batchGetCalls)
+
+
+@pytest.fixture
+def sheetsService(monkeypatch):
+    service = FakeSheetsService()
+    monkeypatch.setattr(SheetsAPIWrapper, "buildAuthorizedService", lambda: service)
+    monkeypatch.setattr(SheetsAPIWrapper, "FETCH_TARGETED_RANGES", True)
+    monkeypatch.setattr(SheetsAPIWrapper, "GRID_INDEX", None)
+    return service
+
+
+def testQuoteSheetNameDoublesApostrophes():
+    assert SheetsAPIWrapper.quoteSheetName("Bob's Picks") == "'Bob''s Picks'"
+    assert SheetsAPIWrapper.quoteSheetName("Main") == "'Main'"
+
+
+def testTargetedFetchRequestsHeaderRowsThenTargetedColumns(sheetsService):
+    SheetsAPIWrapper.getGridIndex()
+
+    headerCall, columnCall = sheetsService.batchGetCalls
+    assert headerCall == {"ranges": ["'Main'!4:4", "'Bob''s Picks'!4:4", "'Bonds'!4:4"],
+                          "majorDimension": "ROWS"}
+    assert columnCall == {"ranges": ["'Main'!B:B",
+                                     "'Bob''s Picks'!B:B", "'Bob''s Picks'!C:C", "'Bob''s Picks'!D:D",
+                                     "'Bonds'!A:A", "'Bonds'!B:B"],
+                          "majorDimension": "COLUMNS"}
+
+
+def testGridIndexLookups(sheetsService):
+    assert SheetsAPIWrapper.getAllSheetNames() == ["Main", "Bob's Picks", "Bonds"]
+
+    assert SheetsAPIWrapper.getAllCellValuesInRow(sheetRow=4, sheetName="Bob's Picks") == \
+        ["Name", "Symbol", "Weekly Investment", "Cadence"]
+    assert SheetsAPIWrapper.getAllCellValuesInColumn(sheetColumn="B", sheetName="Bob's Picks") == \
+        [None, None, None, "Symbol", "AAPL", "MSFT", None, None]
+    # Empty cells inside a column and columns that were never fetched are None
+    assert SheetsAPIWrapper.getCellValue("D6", "Bob's Picks") is None
+    assert SheetsAPIWrapper.getCellValue("A5", "Bob's Picks") is None
+    assert SheetsAPIWrapper.getCellValue("C5", "Bob's Picks") == 6
+    assert SheetsAPIWrapper.getCellValue("B7", "Main") == 15
+    assert SheetsAPIWrapper.getCellValue("A1", "Missing") is None
+
+
+def testRecurringInvestmentsAreParsedFromTargetedRanges(sheetsService):
+    assert SheetsAPIWrapper.parseRecurringInvestmentsByCategory() == {
+        "Bob's Picks": {"AAPL": 6, "MSFT": 4},
+        "Bonds": {"BND": 5}}
+    assert SheetsAPIWrapper.parseRecurringInvestmentCadences() == {
+        "AAPL": "Monthly", "MSFT": None, "BND": None}
+    assert SheetsAPIWrapper.parseTotalRecurringInvestmentsValue() == 15
+
+
+class FakeDriveService:
+    # Drive service answering files().get with `version`, or failing like a
+    # token without the Drive scope when it is an exception
+
+    def __init__(self, version):
+        self.version = version
+        self.requests = 0
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields):
+        self.requests += 1
+        if isinstance(self.version, Exception):
+            raise self.version
+        return Request({"version": self.version})
+
+
+@pytest.fixture
+def snapshotClock(tmp_path, monkeypatch, sheetsService):
+    # Snapshots are written to a temporary file, and time only moves when the
+    # test advances it
+    clock = {"now": 1000000.0}
+    monkeypatch.setattr(SheetsAPIWrapper, "SNAPSHOT_FILE_PATH", str(tmp_path / "sheets-snapshot.json"))
+    monkeypatch.setattr(SheetsAPIWrapper.time, "time", lambda: clock["now"])
+    return clock
+
+
+def useDriveService(monkeypatch, version):
+    driveService = FakeDriveService(version)
+    monkeypatch.setattr(SheetsAPIWrapper, "buildAuthorizedDriveService", lambda: driveService)
+    return driveService
+
+
+def getFetchCount(sheetsService):
+    # Every fetch of the spreadsheet starts with one header row batchGet
+    return sum(call["majorDimension"] == "ROWS" for call in sheetsService.batchGetCalls)
+
+
+def testSnapshotWithinTTLIsUsedWithoutContactingGoogle(snapshotClock, sheetsService, monkeypatch):
+    driveService = useDriveService(monkeypatch, "7")
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    snapshotClock["now"] += SheetsAPIWrapper.SNAPSHOT_TTL_SECONDS - 1
+    snapshot = SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    assert snapshot["recurringInvestments"] == {"AAPL": 6, "MSFT": 4, "BND": 5}
+    assert getFetchCount(sheetsService) == 1
+    assert driveService.requests == 1
+
+
+def testExpiredSnapshotOfUnchangedSpreadsheetIsRenewed(snapshotClock, sheetsService, monkeypatch):
+    driveService = useDriveService(monkeypatch, "7")
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    snapshotClock["now"] += SheetsAPIWrapper.SNAPSHOT_TTL_SECONDS
+    snapshot = SheetsAPIWrapper.loadOrFetchSnapshot()
+    assert snapshot["fetchedAt"] == snapshotClock["now"]
+    assert getFetchCount(sheetsService) == 1
+
+    # The renewed snapshot is valid for another TTL
+    snapshotClock["now"] += SheetsAPIWrapper.SNAPSHOT_TTL_SECONDS - 1
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+    assert getFetchCount(sheetsService) == 1
+    assert driveService.requests == 2
+
+
+def testExpiredSnapshotOfEditedSpreadsheetIsRefetched(snapshotClock, sheetsService, monkeypatch):
+    driveService = useDriveService(monkeypatch, "7")
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    driveService.version = "8"
+    snapshotClock["now"] += SheetsAPIWrapper.SNAPSHOT_TTL_SECONDS
+    snapshot = SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    assert snapshot["revision"] == "8"
+    assert getFetchCount(sheetsService) == 2
+
+
+def testUnknownRevisionWarnsToReauthoriseAndFallsBackToTTL(snapshotClock, sheetsService, monkeypatch, capsys):
+    useDriveService(monkeypatch, PermissionError("Request had insufficient authentication scopes."))
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+
+    output = capsys.readouterr().out
+    assert "WARNING" in output and SheetsAPIWrapper.PICKLE_FILE_PATH in output
+
+    snapshotClock["now"] += SheetsAPIWrapper.SNAPSHOT_TTL_SECONDS - 1
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+    assert getFetchCount(sheetsService) == 1
+
+    snapshotClock["now"] += 1
+    SheetsAPIWrapper.loadOrFetchSnapshot()
+    assert getFetchCount(sheetsService) == 2
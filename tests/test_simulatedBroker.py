@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import getBrokerSubmitOrder, sendPendingOrders
+from simulatedBroker import SimulatedBroker, SimulatedCrash
+import orderJournal
+
+
+ORDERS = {f"SYM{i}": float(i + 1) for i in range(12)}
+
+
+def getFilledAmounts(broker):
+    filledAmounts = {}
+    for fill in broker.fills:
+        filledAmounts.setdefault(fill["symbol"], []).append(round(fill["amount"], 6))
+    return filledAmounts
+
+
+def testCrashRecoveryPlacesEveryOrderExactlyOnce():
+    broker = SimulatedBroker(cash=1000, latencySeconds=0.001, crashAfterOrders=5, seed=7)
+    orderJournal.queueOrders(ORDERS)
+
+    with pytest.raises(SimulatedCrash):
+        sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    # Orders in flight during the crash are left unacknowledged and are not
+    # resent automatically
+    unacknowledgedOrders = orderJournal.getUnacknowledgedOrders()
+    assert len(unacknowledgedOrders) > 0
+    assert not set(unacknowledgedOrders) & set(orderJournal.getPendingOrders())
+
+    # Compaction keeps them until they are resolved
+    orderJournal.compactJournal()
+    assert orderJournal.getUnacknowledgedOrders() == unacknowledgedOrders
+
+    # Resolve them against the broker's fills, as an operator would
+    filledSymbols = set(getFilledAmounts(broker))
+    for symbol in unacknowledgedOrders:
+        orderJournal.resolveUnacknowledgedOrder(symbol, placed=symbol in filledSymbols)
+
+    broker.crashAfterOrders = None
+    results = sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    assert all(result["error"] is None for result in results)
+    assert orderJournal.getPendingOrders() == {}
+    assert orderJournal.getUnacknowledgedOrders() == {}
+    assert getFilledAmounts(broker) == {symbol: [amount] for symbol, amount in ORDERS.items()}
+
+
+def testThrottledOrdersAreRetried():
+    broker = SimulatedBroker(cash=1000, throttleProbability=0.5, seed=3)
+    orderJournal.queueOrders(ORDERS)
+
+    results = sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    assert broker.getStats()["throttled"] > 0
+    placedSymbols = {result["symbol"] for result in results if result["error"] is None}
+    assert set(getFilledAmounts(broker)) == placedSymbols
+
+    # Orders still throttled after every retry are left to be resent
+    assert set(orderJournal.getPendingOrders()) == set(ORDERS) - placedSymbols
+
+
+def testRejectedOrderIsNotPlaced():
+    broker = SimulatedBroker(cash=1000)
+    broker.injectFailures("SYM0")
+    orderJournal.queueOrders(ORDERS)
+
+    sendPendingOrders(getBrokerSubmitOrder(broker))
+
+    assert "SYM0" not in getFilledAmounts(broker)
+    assert orderJournal.getPendingOrders() == {"SYM0": ORDERS["SYM0"]}